@@ -0,0 +1,241 @@
+"""
+Uplink bandwidth governor for outbound MQTT traffic.
+BandwidthGovernor sits between the publishers and the MQTT client (or spool)
+with the same publish() call. Each message is classified by topic into a
+traffic class, and a token bucket refilled at UPLINK_BUDGET_BYTES per second
+decides when it may go out. When the budget is exhausted, messages wait in
+per-class queues that drain in strict priority order:
+
+responses > events > counts > series > status > snapshots
+
+Lower classes degrade first. counts and status are retained state, so a
+queued message is replaced by a newer one on the same topic. Snapshots are
+shed once their queue is full, and headroom() lets the snapshot streamer
+shrink its own budget to what the higher classes leave unused. Per-class usage
+is reported by get_stats(). A budget of 0 disables pacing but keeps the
+accounting.
+"""
+
+import math
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Any, Dict, Optional, Tuple
+
+from logging_config import get_logger
+from config import UPLINK_BUDGET_BYTES, UPLINK_BURST_BYTES
+
+logger = get_logger(__name__)
+
+MESSAGE_OVERHEAD = 8  # rough MQTT fixed header, packet id and length bytes
+RATE_HALF_LIFE = 5.0  # seconds, for the per-class bytes/s estimate
+
+
+class TrafficClass:
+    def __init__(self, name: str, priority: int, max_queue: int, coalesce: bool):
+        self.name = name
+        self.priority = priority
+        self.max_queue = max_queue
+        self.coalesce = coalesce
+        # Coalescing classes keep the latest message per topic
+        self.queue: Any = OrderedDict() if coalesce else deque()
+
+        self.sent = 0
+        self.sent_bytes = 0
+        self.coalesced = 0
+        self.shed = 0
+        self.rate = 0.0
+        self.rate_updated = time.monotonic()
+
+    def record(self, size: int, now: float):
+        elapsed = now - self.rate_updated
+        self.rate *= 0.5 ** (elapsed / RATE_HALF_LIFE)
+        self.rate += size * math.log(2) / RATE_HALF_LIFE
+        self.rate_updated = now
+        self.sent += 1
+        self.sent_bytes += size
+
+    def current_rate(self, now: float) -> float:
+        return self.rate * 0.5 ** ((now - self.rate_updated) / RATE_HALF_LIFE)
+
+    def to_dict(self, now: float) -> Dict[str, Any]:
+        return {
+            "priority": self.priority,
+            "sent": self.sent,
+            "sent_bytes": self.sent_bytes,
+            "bytes_per_second": round(self.current_rate(now), 1),
+            "queued": len(self.queue),
+            "coalesced": self.coalesced,
+            "shed": self.shed,
+        }
+
+
+def default_classes() -> Dict[str, TrafficClass]:
+    return {
+        "responses": TrafficClass("responses", 0, max_queue=1000, coalesce=False),
+        "events": TrafficClass("events", 1, max_queue=10000, coalesce=False),
+        "counts": TrafficClass("counts", 2, max_queue=1000, coalesce=True),
+        "series": TrafficClass("series", 3, max_queue=1000, coalesce=False),
+        "status": TrafficClass("status", 4, max_queue=1000, coalesce=True),
+        "snapshots": TrafficClass("snapshots", 5, max_queue=4, coalesce=True),
+    }
+
+
+def classify(topic: str) -> str:
+    """Traffic class of a vision/{pi_id}/... topic."""
+    if topic.endswith("/response") or topic.endswith("/history/resync"):
+        return "responses"
+    if "/history/" in topic:
+        return "events"
+    if topic.endswith("/counts/update") or topic.endswith("/state/digest"):
+        return "counts"
+    if "/series/" in topic:
+        return "series"
+    if topic.endswith("/snapshot"):
+        return "snapshots"
+    return "status"
+
+
+class BandwidthGovernor:
+    def __init__(self, client, budget: float = UPLINK_BUDGET_BYTES, burst: float = UPLINK_BURST_BYTES):
+        self.client = client
+        self.budget = float(budget)
+        self.burst = float(max(burst, 1))
+        self.classes = default_classes()
+        self.by_priority = sorted(self.classes.values(), key=lambda traffic_class: traffic_class.priority)
+
+        self.lock = threading.Lock()
+        self.wakeup = threading.Condition(self.lock)
+        self.tokens = self.burst
+        self.refilled = time.monotonic()
+        self._stopped = False
+        self.thread: Optional[threading.Thread] = None
+
+    def is_connected(self) -> bool:
+        return self.client.is_connected()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.burst, self.tokens + (now - self.refilled) * self.budget)
+        self.refilled = now
+
+    def _has_queued(self, up_to_priority: int) -> bool:
+        return any(traffic_class.queue for traffic_class in self.by_priority
+                   if traffic_class.priority <= up_to_priority)
+
+    def publish(self, topic: str, payload: Any = None, qos: int = 0, retain: bool = False):
+        """Send now if the budget allows and nothing more important is waiting, otherwise queue."""
+        traffic_class = self.classes[classify(topic)]
+        size = len(topic) + len(payload or b"") + MESSAGE_OVERHEAD
+        message = (topic, payload, qos, retain, size)
+        now = time.monotonic()
+        with self.lock:
+            if self.budget > 0:
+                self._refill(now)
+                if self._has_queued(traffic_class.priority) or self.tokens < min(size, self.burst):
+                    self._enqueue(traffic_class, message)
+                    return None
+                self.tokens -= size
+            traffic_class.record(size, now)
+        return self.client.publish(topic, payload, qos=qos, retain=retain)
+
+    def _enqueue(self, traffic_class: TrafficClass, message: Tuple[str, Any, int, bool, int]):
+        topic = message[0]
+        if traffic_class.coalesce:
+            if topic in traffic_class.queue:
+                traffic_class.coalesced += 1
+                del traffic_class.queue[topic]
+            traffic_class.queue[topic] = message
+            if len(traffic_class.queue) > traffic_class.max_queue:
+                traffic_class.queue.popitem(last=False)
+                traffic_class.shed += 1
+        else:
+            traffic_class.queue.append(message)
+            if len(traffic_class.queue) > traffic_class.max_queue:
+                traffic_class.queue.popleft()
+                traffic_class.shed += 1
+                if traffic_class.shed % 100 == 1:
+                    logger.warning(f"Uplink budget exceeded, shedding {traffic_class.name} messages "
+                                   f"({traffic_class.shed} so far)")
+        self.wakeup.notify()
+
+    def headroom(self, class_name: str) -> float:
+        """Bytes per second of the budget not used by classes more important than class_name."""
+        if self.budget <= 0:
+            return float("inf")
+        now = time.monotonic()
+        priority = self.classes[class_name].priority
+        with self.lock:
+            used = sum(traffic_class.current_rate(now) for traffic_class in self.by_priority
+                       if traffic_class.priority < priority)
+        return max(0.0, self.budget - used)
+
+    # --- draining ----------------------------------------------------------------
+
+    def start(self):
+        if self.budget <= 0 or (self.thread and self.thread.is_alive()):
+            return
+        self._stopped = False
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+        logger.info(f"Bandwidth governor started ({self.budget / 1024:.0f} KB/s, burst {self.burst / 1024:.0f} KB)")
+
+    def stop(self):
+        """Stop pacing and send whatever is still queued, most important first."""
+        with self.lock:
+            self._stopped = True
+            self.wakeup.notify()
+        if self.thread and self.thread.is_alive():
+            self.thread.join(timeout=5)
+        while True:
+            with self.lock:
+                message, traffic_class = self._pop()
+            if message is None:
+                return
+            self._send(traffic_class, message)
+
+    def _pop(self):
+        for traffic_class in self.by_priority:
+            if traffic_class.queue:
+                if traffic_class.coalesce:
+                    return traffic_class.queue.popitem(last=False)[1], traffic_class
+                return traffic_class.queue.popleft(), traffic_class
+        return None, None
+
+    def _run(self):
+        while True:
+            with self.lock:
+                while not self._stopped:
+                    head = next((traffic_class for traffic_class in self.by_priority if traffic_class.queue), None)
+                    if head is None:
+                        self.wakeup.wait()
+                        continue
+                    size = (next(iter(head.queue.values())) if head.coalesce else head.queue[0])[4]
+                    self._refill(time.monotonic())
+                    needed = min(size, self.burst)
+                    if self.tokens >= needed:
+                        break
+                    self.wakeup.wait((needed - self.tokens) / self.budget)
+                if self._stopped:
+                    return
+                message, traffic_class = self._pop()
+                self.tokens -= message[4]
+            self._send(traffic_class, message)
+
+    def _send(self, traffic_class: TrafficClass, message: Tuple[str, Any, int, bool, int]):
+        topic, payload, qos, retain, size = message
+        try:
+            self.client.publish(topic, payload, qos=qos, retain=retain)
+        except Exception as e:
+            logger.error(f"Failed to publish queued {traffic_class.name} message to {topic}: {e}")
+            return
+        with self.lock:
+            traffic_class.record(size, time.monotonic())
+
+    def get_stats(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        with self.lock:
+            return {
+                "budget_bytes_per_second": self.budget,
+                "tokens": round(self.tokens, 1),
+                "classes": {name: traffic_class.to_dict(now) for name, traffic_class in self.classes.items()},
+            }
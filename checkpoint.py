@@ -0,0 +1,145 @@
+"""
+Periodic binary checkpoints of counter state with event-log replay on start.
+A checkpoint holds counts, rollups and the ids counted inside each zone.
+Events appended to the event log after the checkpoint are replayed on top.
+Tracker tables are not saved: track ids belong to the previous tracker
+session, so the occupant ids only seed stale occupants right after restore
+(see MultiSourceZoneVisitorCounter.mark_restored_ids_stale).
+"""
+
+import pickle
+import struct
+import threading
+import time
+import zlib
+from typing import Any, Dict, Optional
+
+from logging_config import get_logger
+from persistence import atomic_write
+from config import CHECKPOINT_FILE, CHECKPOINT_INTERVAL
+
+logger = get_logger(__name__)
+
+CHECKPOINT_MAGIC = b"ZCCP"
+CHECKPOINT_VERSION = 2
+CHECKPOINT_HEADER = struct.Struct("<4sHI")  # magic, version, crc32 of the pickled body
+
+
+def encode_checkpoint(state: Dict[str, Any]) -> bytes:
+    body = pickle.dumps(state, protocol=pickle.HIGHEST_PROTOCOL)
+    return CHECKPOINT_HEADER.pack(CHECKPOINT_MAGIC, CHECKPOINT_VERSION, zlib.crc32(body)) + body
+
+
+def decode_checkpoint(payload: bytes) -> Optional[Dict[str, Any]]:
+    if len(payload) < CHECKPOINT_HEADER.size:
+        return None
+    magic, version, crc = CHECKPOINT_HEADER.unpack_from(payload)
+    body = payload[CHECKPOINT_HEADER.size:]
+    if magic != CHECKPOINT_MAGIC or version != CHECKPOINT_VERSION or zlib.crc32(body) != crc:
+        return None
+    return pickle.loads(body)
+
+
+class CheckpointManager:
+    def __init__(self, counter, path: str = CHECKPOINT_FILE, interval: float = CHECKPOINT_INTERVAL):
+        self.counter = counter
+        self.path = path
+        self.interval = interval
+        self.stop_event = threading.Event()
+        self.wake_event = threading.Event()
+        self.thread: Optional[threading.Thread] = None
+        self.save_lock = threading.Lock()
+
+        self.checkpoints_written = 0
+        self.last_checkpoint_at: Optional[float] = None
+        self.last_checkpoint_bytes = 0
+        self.last_checkpoint_seconds = 0.0
+        self.recovery: Dict[str, Any] = {}
+
+    def start(self):
+        if self.thread and self.thread.is_alive():
+            return
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+        logger.info(f"Checkpointing counter state every {self.interval}s to {self.path}")
+
+    def stop(self):
+        """Stop the thread and write a final checkpoint."""
+        self.stop_event.set()
+        self.wake_event.set()
+        if self.thread and self.thread.is_alive():
+            self.thread.join(timeout=5)
+        self.save()
+
+    def request(self):
+        """Checkpoint soon, e.g. after counts were reset."""
+        self.wake_event.set()
+
+    def _run(self):
+        while not self.stop_event.is_set():
+            self.wake_event.wait(self.interval)
+            self.wake_event.clear()
+            if self.stop_event.is_set():
+                break
+            self.save()
+
+    def save(self) -> bool:
+        with self.save_lock:
+            started = time.monotonic()
+            try:
+                state = self.counter.snapshot_state()
+                payload = encode_checkpoint(state)
+                atomic_write(self.path, payload)
+            except Exception as e:
+                logger.error(f"Failed to write checkpoint {self.path}: {e}")
+                return False
+            self.checkpoints_written += 1
+            self.last_checkpoint_at = state["wall_time"]
+            self.last_checkpoint_bytes = len(payload)
+            self.last_checkpoint_seconds = time.monotonic() - started
+            return True
+
+    def restore(self) -> Dict[str, Any]:
+        """Load the checkpoint, replay newer events from the event log and report what was recovered."""
+        started = time.monotonic()
+        state = None
+        try:
+            with open(self.path, "rb") as f:
+                state = decode_checkpoint(f.read())
+            if state is None:
+                logger.warning(f"Checkpoint {self.path} is corrupt or from another version; ignoring it")
+        except FileNotFoundError:
+            logger.info(f"No checkpoint at {self.path}; starting from the saved configuration")
+        except Exception as e:
+            logger.error(f"Failed to read checkpoint {self.path}: {e}")
+
+        since = None
+        replayed = stale = 0
+        if state is not None:
+            since = state["wall_time"]
+            self.counter.restore_state(state)
+            replayed = self.counter.replay_events(since)
+            stale = self.counter.mark_restored_ids_stale()
+
+        self.recovery = {
+            "checkpoint_wall_time": since,
+            "checkpoint_age_seconds": round(time.time() - since, 1) if since else None,
+            "replayed_events": replayed,
+            "stale_occupants": stale,
+            "restore_seconds": round(time.monotonic() - started, 3),
+        }
+        logger.info(f"Counter state recovered: {self.recovery}")
+        return self.recovery
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "path": self.path,
+            "interval": self.interval,
+            "checkpoints_written": self.checkpoints_written,
+            "last_checkpoint_at": self.last_checkpoint_at,
+            "last_checkpoint_bytes": self.last_checkpoint_bytes,
+            "last_checkpoint_seconds": round(self.last_checkpoint_seconds, 4),
+            "recovery": self.recovery,
+            "time_to_first_count_seconds": self.counter.time_to_first_count,
+        }
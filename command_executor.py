@@ -0,0 +1,129 @@
+"""
+Asynchronous execution of MQTT commands.
+The MQTT listener callback runs on paho's network thread, so commands are
+handed to a small worker pool and the callback returns at once. Every command
+carries a command_id (taken from the request or generated) and its progress is
+reported on the response topic:
+
+accepted   the command will run now
+queued     it waits behind a conflicting command of the same group
+progress   intermediate step, with a "stage" and optional details
+success / failed   final result
+rejected   duplicate command_id, or too many commands queued in its group
+
+Commands of the same conflict group (e.g. everything that reconfigures the
+pipeline) run one at a time in arrival order; commands without a group run
+concurrently.
+"""
+
+import threading
+import uuid
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Deque, Dict, Optional, Tuple
+
+from logging_config import get_logger
+from config import COMMAND_WORKERS, COMMAND_MAX_QUEUED
+
+logger = get_logger(__name__)
+
+RECENT_IDS = 256
+
+# fn(progress) -> (success, error_message); progress(stage, **details)
+CommandFn = Callable[[Callable[..., None]], Tuple[bool, str]]
+
+
+class CommandExecutor:
+    def __init__(self, respond: Callable[[Dict[str, Any]], None], workers: int = COMMAND_WORKERS,
+                 max_queued: int = COMMAND_MAX_QUEUED):
+        self.respond = respond
+        self.max_queued = max_queued
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="command")
+
+        self.lock = threading.Lock()
+        self.busy_groups: Dict[str, str] = {}
+        self.queued: Dict[str, Deque[Tuple[str, str, CommandFn]]] = {}
+        self.recent_ids: "OrderedDict[str, None]" = OrderedDict()
+        self.stats = {"accepted": 0, "queued": 0, "rejected": 0, "succeeded": 0, "failed": 0}
+
+    def submit(self, command: str, fn: CommandFn, command_id: Optional[str] = None,
+               group: Optional[str] = None) -> str:
+        """Schedule a command and acknowledge it immediately. Returns the command id."""
+        command_id = str(command_id) if command_id else uuid.uuid4().hex
+        running = None
+        with self.lock:
+            if command_id in self.recent_ids:
+                status, error = "rejected", f"Duplicate command_id {command_id}"
+            elif group is not None and group in self.busy_groups:
+                running = self.busy_groups[group]
+                queue = self.queued.setdefault(group, deque())
+                if len(queue) >= self.max_queued:
+                    status = "rejected"
+                    error = f"'{running}' is running and {len(queue)} commands are queued"
+                else:
+                    queue.append((command, command_id, fn))
+                    status, error = "queued", ""
+            else:
+                if group is not None:
+                    self.busy_groups[group] = command
+                status, error = "accepted", ""
+            if status != "rejected":
+                self._remember(command_id)
+            self.stats[status] += 1
+
+        response = {"command": command, "command_id": command_id, "status": status, "error": error}
+        if status == "queued":
+            response["running"] = running
+        self._respond(response)
+        if status == "accepted":
+            self.pool.submit(self._run, command, command_id, fn, group)
+        return command_id
+
+    def _remember(self, command_id: str):
+        self.recent_ids[command_id] = None
+        while len(self.recent_ids) > RECENT_IDS:
+            self.recent_ids.popitem(last=False)
+
+    def _run(self, command: str, command_id: str, fn: CommandFn, group: Optional[str]):
+        def progress(stage: str, **details):
+            self._respond({"command": command, "command_id": command_id, "status": "progress",
+                           "stage": stage, **details})
+
+        try:
+            success, error_message = fn(progress)
+        except Exception as e:
+            success, error_message = False, f"Error processing command '{command}': {str(e)}"
+            logger.error(error_message, exc_info=True)
+        with self.lock:
+            self.stats["succeeded" if success else "failed"] += 1
+        self._respond({"command": command, "command_id": command_id,
+                       "status": "success" if success else "failed", "error": error_message})
+        if group is not None:
+            self._next_in_group(group)
+
+    def _next_in_group(self, group: str):
+        with self.lock:
+            queue = self.queued.get(group)
+            if not queue:
+                self.busy_groups.pop(group, None)
+                return
+            command, command_id, fn = queue.popleft()
+            self.busy_groups[group] = command
+        self._respond({"command": command, "command_id": command_id, "status": "accepted", "error": ""})
+        self.pool.submit(self._run, command, command_id, fn, group)
+
+    def _respond(self, response: Dict[str, Any]):
+        try:
+            self.respond(response)
+        except Exception as e:
+            logger.error(f"Failed to publish command response {response.get('status')}: {e}")
+
+    def shutdown(self):
+        with self.lock:
+            self.queued.clear()
+        self.pool.shutdown(wait=False)
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self.lock:
+            return {**self.stats, "running": dict(self.busy_groups),
+                    "queued_by_group": {group: len(queue) for group, queue in self.queued.items() if queue}}
@@ -3,34 +3,50 @@ Configuration module for multi-source zone visitor counter application.
 Contains all configuration constants and settings.
 """
 
-import json
+import copy
 import os
+import threading
 
 CONFIG_FILE = "cameras_zones.json"
 
 LINE_HISTORY_FILE = "line_data.json"
 
+# Config files are cached in memory; changes are written after CONFIG_SAVE_DEBOUNCE seconds
+# of quiet, and at the latest CONFIG_SAVE_MAX_DELAY seconds after the first unsaved change.
+CONFIG_SAVE_DEBOUNCE = 0.5
+CONFIG_SAVE_MAX_DELAY = 5.0
+_config_stores = {}
+_config_stores_lock = threading.Lock()
+
+def get_config_store(filename=CONFIG_FILE):
+    """
+    Return the shared in-memory store for a config file.
+    The file is parsed once; saves are debounced and written atomically in the background.
+    """
+    from config_store import ConfigStore
+    path = os.path.abspath(filename)
+    with _config_stores_lock:
+        store = _config_stores.get(path)
+        if store is None:
+            store = _config_stores[path] = ConfigStore(
+                filename, debounce=CONFIG_SAVE_DEBOUNCE, max_delay=CONFIG_SAVE_MAX_DELAY)
+        return store
+
+def flush_config_stores():
+    """Write every pending config change now (used on shutdown)."""
+    with _config_stores_lock:
+        stores = list(_config_stores.values())
+    for store in stores:
+        store.flush()
+
 def load_config(filename=CONFIG_FILE):
-    if os.path.exists(filename):
-        try:
-            with open(filename, "r") as f:
-                content = f.read().strip()
-                if not content:  # Empty file
-                    return {}
-                return json.loads(content)
-        except Exception as e:
-            print(f"Error loading config from {filename}: {e}")
-            return {}
-    return {}
+    return get_config_store(filename).snapshot()
 
 def save_user_data(user_data, filename=CONFIG_FILE):
     """
     Save user_data.data and retain active_sources if present.
     """
-    config = load_config(filename)
-    config["camera_data"] = user_data.data  # main zone data
-    with open(filename, "w") as f:
-        json.dump(config, f, indent=4)
+    get_config_store(filename).set("camera_data", copy.deepcopy(user_data.data))  # main zone data
 
 def load_user_data(user_data, file_name=CONFIG_FILE):
     config = load_config(file_name)
@@ -40,17 +56,57 @@ def save_active_sources(active_sources, filename=CONFIG_FILE):
     """
     Save RTSP camera sources to config file.
     """
-    config = load_config(filename) or {}
-    config["video_sources"] = active_sources
-    with open(filename, "w") as f:
-        json.dump(config, f, indent=4)
+    get_config_store(filename).set("video_sources", list(active_sources))
 
 def get_active_sources(filename=CONFIG_FILE):
     """
     Load and return list of previously saved RTSP sources.
     """
+    return get_config_store(filename).get("video_sources", [])
+
+
+def save_zone_line_config(user_data, filename=None):
+    """
+    Save zone and line definitions with their counts.
+    Event history lives in the event log, so it is not written here.
+    """
+    filename = filename or HISTORY_FILE
+    # Called with the counter lock held: only an in-memory copy here, the store writes later
+    config = {
+        camera_id: {
+            section: {
+                name: {key: copy.deepcopy(value) for key, value in item.items() if key != "history"}
+                for name, item in camera_data.get(section, {}).items()
+            }
+            for section in ("zones", "lines")
+        }
+        for camera_id, camera_data in user_data.data.items()
+    }
+    get_config_store(filename).replace(config)
+
+
+def load_zone_line_config(user_data, filename=None):
+    """
+    Load zone and line definitions into user_data.
+    History lists found in older files are handed to the counter's event log once.
+    """
+    filename = filename or HISTORY_FILE
     config = load_config(filename)
-    return config.get("video_sources", [])
+    legacy_history = []
+    with user_data.lock:
+        for camera_id, camera_data in config.items():
+            if camera_id.startswith("_") or not isinstance(camera_data, dict):
+                continue
+            for section, kind in (("zones", "zone"), ("lines", "line")):
+                for name, item in camera_data.setdefault(section, {}).items():
+                    for entry in item.pop("history", None) or []:
+                        legacy_history.append((camera_id, kind, name, entry))
+                    item["history"] = []
+            user_data.data[camera_id] = {"zones": camera_data["zones"], "lines": camera_data["lines"]}
+            user_data._init_camera(camera_id)
+    if legacy_history and hasattr(user_data, "import_legacy_history"):
+        user_data.import_legacy_history(legacy_history)
+    return config
 
 
 # Model configurations
@@ -61,6 +117,77 @@ MODEL_PATHS = {
 # File paths
 HISTORY_FILE = "multisource1.json"
 
+# Append-only event log for zone/line history (replaces the history lists in the JSON files)
+EVENT_LOG_DIR = os.getenv("EVENT_LOG_DIR", "event_log")
+EVENT_LOG_SEGMENT_BYTES = 4 * 1024 * 1024
+EVENT_LOG_INDEX_INTERVAL_BYTES = 4096
+EVENT_LOG_MAX_BYTES = 256 * 1024 * 1024
+EVENT_LOG_FSYNC_INTERVAL = 1.0
+EVENT_LOG_MAX_QUEUED = 50000  # events waiting for the background writer before new ones are dropped
+
+# Counter state checkpoints; events logged after the checkpoint are replayed on start
+CHECKPOINT_FILE = os.getenv("CHECKPOINT_FILE", "counter_state.ckpt")
+CHECKPOINT_INTERVAL = 30.0
+
+# Rollups: buckets kept in memory per granularity before being spilled to ROLLUP_DIR
+ROLLUP_DIR = os.getenv("ROLLUP_DIR", "rollups")
+ROLLUP_MEMORY_BUCKETS = {"1m": 180, "15m": 192, "1h": 168, "1d": 31}
+ROLLUP_MAX_QUERY_BUCKETS = 5000
+
+# Columnar event archive: one file of fixed-width records per day, kept for ARCHIVE_RETENTION_DAYS
+ARCHIVE_DIR = os.getenv("ARCHIVE_DIR", "event_archive")
+ARCHIVE_RETENTION_DAYS = 90
+ARCHIVE_FSYNC_INTERVAL = 1.0
+
+# Local SQLite event sink; buffered rows are forwarded to the remote database in batches
+LOCAL_SINK_PATH = os.getenv("LOCAL_SINK_PATH", "events.db")
+LOCAL_SINK_FORWARD_BATCH = 500
+LOCAL_SINK_FORWARD_INTERVAL = 5.0
+LOCAL_SINK_RETENTION_DAYS = 7
+
+# Dashboard drag edits: latest geometry per shape is applied every EDIT_COALESCE_WINDOW,
+# the config is saved once the shape has not been edited for EDIT_IDLE_SECONDS
+EDIT_COALESCE_WINDOW = 0.2
+EDIT_IDLE_SECONDS = 2.0
+
+# MQTT count updates: changes are coalesced over the window; all cameras are republished every keepalive
+COUNTS_COALESCE_WINDOW = 0.2
+COUNTS_KEEPALIVE_INTERVAL = 60.0
+
+# History events over MQTT: "batch" publishes envelopes on .../history/batch, "single" one message per event
+EVENT_PUBLISH_MODE = os.getenv("EVENT_PUBLISH_MODE", "batch")
+EVENT_ENCODING = os.getenv("EVENT_ENCODING", "json")  # "json" or "packed"
+EVENT_BATCH_MAX_EVENTS = 100
+EVENT_BATCH_MAX_AGE = 1.0
+
+# Outbound MQTT spool used while the broker is unreachable
+MQTT_SPOOL_DIR = os.getenv("MQTT_SPOOL_DIR", "mqtt_spool")
+MQTT_SPOOL_MAX_BYTES = 64 * 1024 * 1024
+MQTT_SPOOL_SEGMENT_BYTES = 1024 * 1024
+MQTT_SPOOL_DRAIN_RATE = 50  # messages per second while catching up
+
+# Uplink budget for all outbound MQTT traffic (0 = unlimited). Traffic classes drain in
+# priority order responses > events > counts > series > status > snapshots once it is exhausted.
+UPLINK_BUDGET_BYTES = int(os.getenv("UPLINK_BUDGET_BYTES", 256 * 1024))  # bytes per second
+UPLINK_BURST_BYTES = 64 * 1024
+
+# Per-interval count series: sampled every SERIES_INTERVAL seconds, sent as one
+# compressed block per camera every SERIES_BLOCK_POINTS samples
+SERIES_INTERVAL = 60.0
+SERIES_BLOCK_POINTS = 5
+
+# Outbound telemetry scheduler
+TELEMETRY_TICK_BUDGET_MS = 50  # CPU per tick before lower-priority jobs are deferred
+CAMERA_STATUS_INTERVAL = 5.0
+
+# MQTT commands run on a worker pool; commands of one conflict group run one at a time
+COMMAND_WORKERS = 4
+COMMAND_MAX_QUEUED = 2  # further commands of a busy group are rejected
+CAMERA_READY_TIMEOUT = 10.0  # wait this long for sources to deliver frames before publishing the camera list
+
+# Streaming exports are sent in chunks of about this many bytes
+EXPORT_CHUNK_BYTES = 64 * 1024
+
 # Default frame dimensions
 DEFAULT_FRAME_HEIGHT = 1080
 DEFAULT_FRAME_WIDTH = 1920
@@ -77,6 +204,41 @@ DEFAULT_ZONE_CONFIG = {
     }
 }
 
+# Pipeline configuration
+# Headless mode ends every source branch in a fakesink instead of the display sink,
+# skipping hailooverlay and videoconvert. Frames are still consumed by the probe.
+HEADLESS_MODE = os.getenv("HEADLESS_MODE", "false").lower() in ("1", "true", "yes")
+FPS_WINDOW_SECONDS = 2.0
+
+# Per-source supervision: each camera branch is restarted on its own with exponential backoff
+SOURCE_RESTART_BACKOFF_INITIAL = 2.0
+SOURCE_RESTART_BACKOFF_MAX = 60.0
+SOURCE_STABLE_SECONDS = 30.0
+SOURCE_START_TIMEOUT = 30.0
+SOURCE_STALL_TIMEOUT = 15.0
+SOURCE_WATCHDOG_INTERVAL = 5.0
+
+# Queue introspection. In adaptive mode the queues feeding inference are switched to
+# leak the oldest frames while the queued latency of a camera exceeds its budget.
+QUEUE_SAMPLE_INTERVAL = 1.0
+QUEUE_ADAPTIVE_MODE = os.getenv("QUEUE_ADAPTIVE_MODE", "false").lower() in ("1", "true", "yes")
+QUEUE_LATENCY_BUDGET_MS = 500
+QUEUE_LATENCY_BUDGETS_MS = {}  # per-camera overrides, e.g. {"camera1": 300}
+QUEUE_ADAPTIVE_RECOVERY_RATIO = 0.5
+QUEUE_ADAPTIVE_RECOVERY_SAMPLES = 3
+
+# Per-stage latency tracing. One in LATENCY_SAMPLE_EVERY frames is timed at the
+# named elements of each source branch; the rest pass the probes untouched.
+LATENCY_TRACING = os.getenv("LATENCY_TRACING", "true").lower() in ("1", "true", "yes")
+LATENCY_SAMPLE_EVERY = 10
+LATENCY_BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000)
+LATENCY_MAX_IN_FLIGHT = 64
+
+# Write-behind persistence: state is flushed every PERSIST_FLUSH_INTERVAL seconds
+# or after PERSIST_FLUSH_EVENTS changes, whichever comes first.
+PERSIST_FLUSH_INTERVAL = 5.0
+PERSIST_FLUSH_EVENTS = 50
+
 # Server configuration
 SERVER_HOST = "0.0.0.0"
 SERVER_PORT = 5000
@@ -89,7 +251,15 @@ CORS_ALLOWED_ORIGINS = "*" #["http://localhost:3000"]
 SOCKETIO_ASYNC_MODE = 'threading'
 
 # Image encoding settings
-JPEG_QUALITY = 100
+JPEG_QUALITY = 85
+
+# MQTT snapshots are only sent for cameras a client is watching (watch_camera lease).
+# Scale and quality adapt so all watched cameras together stay within the budget.
+SNAPSHOT_MAX_FPS = 2.0
+SNAPSHOT_BANDWIDTH_BUDGET = 256 * 1024  # bytes per second
+SNAPSHOT_LEASE_MAX_SECONDS = 120.0
+SNAPSHOT_CHANGE_THRESHOLD = 2.0  # mean absolute difference (0-255) of a 32x18 grayscale thumbnail
+SNAPSHOT_REFRESH_SECONDS = 10.0  # publish at least this often even without visual change
 
 # Template file
 TEMPLATE_FILE = "index3.html"
@@ -0,0 +1,170 @@
+"""
+In-memory configuration store backed by a JSON file.
+The file is parsed once; reads are served from memory and every change bumps
+a version. Writes are coalesced over a debounce window and persisted by a
+background thread with an atomic rename, so callers never do file I/O while
+holding their own locks.
+"""
+
+import atexit
+import copy
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Optional
+
+from logging_config import get_logger
+from persistence import atomic_write
+
+logger = get_logger(__name__)
+
+
+class ConfigStore:
+    def __init__(self, path: str, debounce: float = 0.5, max_delay: float = 5.0):
+        self.path = path
+        self.debounce = debounce
+        self.max_delay = max_delay
+
+        self.lock = threading.RLock()
+        self.write_lock = threading.Lock()  # one file write at a time, in version order
+        self.changed = threading.Condition(self.lock)
+        self._data: Dict[str, Any] = self._read_file()
+        self.version = 0
+        self.saved_version = 0
+        self._first_unsaved_at: Optional[float] = None
+        self._last_change_at = 0.0
+        self._retry_at = 0.0
+        self.writes = 0
+        self.bytes_written = 0
+
+        self._stopped = False
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+        atexit.register(self.close)
+
+    def _read_file(self) -> Dict[str, Any]:
+        if not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path, "r") as f:
+                content = f.read().strip()
+            return json.loads(content) if content else {}
+        except Exception as e:
+            logger.error(f"Error loading config from {self.path}: {e}")
+            return {}
+
+    # --- reads -------------------------------------------------------------------
+
+    def get(self, key: str, default: Any = None) -> Any:
+        with self.lock:
+            return copy.deepcopy(self._data.get(key, default))
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self.lock:
+            return copy.deepcopy(self._data)
+
+    # --- writes ------------------------------------------------------------------
+
+    def set(self, key: str, value: Any) -> int:
+        """Store value (taken over, not copied) and schedule a save. Returns the new version."""
+        with self.lock:
+            self._data[key] = value
+            return self._mark_changed()
+
+    def delete(self, key: str) -> int:
+        with self.lock:
+            self._data.pop(key, None)
+            return self._mark_changed()
+
+    def replace(self, data: Dict[str, Any]) -> int:
+        with self.lock:
+            self._data = data
+            return self._mark_changed()
+
+    @contextmanager
+    def transaction(self):
+        """
+        Mutate the config in bulk; one version bump and one save for the whole block.
+        The block works on a copy that replaces the config only if it completes, so an
+        exception leaves the config as it was.
+        """
+        with self.lock:
+            data = copy.deepcopy(self._data)
+            yield data
+            self._data = data
+            self._mark_changed()
+
+    def _mark_changed(self) -> int:
+        self.version += 1
+        now = time.monotonic()
+        self._last_change_at = now
+        if self._first_unsaved_at is None:
+            self._first_unsaved_at = now
+        self.changed.notify()
+        return self.version
+
+    # --- persistence -------------------------------------------------------------
+
+    def _run(self):
+        while True:
+            with self.lock:
+                while not self._stopped:
+                    # _first_unsaved_at is None while another flush is writing the pending version
+                    if self.version == self.saved_version or self._first_unsaved_at is None:
+                        self.changed.wait()
+                        continue
+                    now = time.monotonic()
+                    due = min(self._last_change_at + self.debounce, self._first_unsaved_at + self.max_delay)
+                    due = max(due, self._retry_at)
+                    if now < due:
+                        self.changed.wait(due - now)
+                        continue
+                    break
+                if self._stopped:
+                    return
+            self.flush()
+
+    def flush(self):
+        """Write pending changes now. Must not be called from inside transaction()."""
+        with self.write_lock:
+            # Serialize under the store lock (cheap, in memory), write the file outside of it
+            with self.lock:
+                if self.version == self.saved_version:
+                    return
+                version = self.version
+                payload = json.dumps(self._data, indent=4).encode("utf-8")
+                self._first_unsaved_at = None
+            try:
+                atomic_write(self.path, payload)
+            except Exception as e:
+                logger.error(f"Failed to save config to {self.path}: {e}")
+                with self.lock:
+                    if self._first_unsaved_at is None:
+                        self._first_unsaved_at = time.monotonic()
+                    self._retry_at = time.monotonic() + self.max_delay
+                    self.changed.notify()
+                return
+            with self.lock:
+                self.saved_version = max(self.saved_version, version)
+                self.writes += 1
+                self.bytes_written += len(payload)
+
+    def close(self):
+        with self.lock:
+            if self._stopped:
+                return
+            self._stopped = True
+            self.changed.notify()
+        self.flush()
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self.lock:
+            return {
+                "path": self.path,
+                "version": self.version,
+                "saved_version": self.saved_version,
+                "writes": self.writes,
+                "bytes_written": self.bytes_written,
+            }
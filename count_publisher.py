@@ -0,0 +1,93 @@
+"""
+Change-driven publishing of zone/line counts over MQTT, run as telemetry jobs.
+The counter notifies the publisher whenever a camera's counts may have
+changed. The "counts" job is triggered with a COUNTS_COALESCE_WINDOW delay, so
+bursts are merged, and only cameras whose counts actually differ from the last
+publish are sent on vision/{pi_id}/{camera_id}/counts/update. Every
+COUNTS_KEEPALIVE_INTERVAL all cameras are republished together with a compact
+state digest (counts and last event sequence number per shape) on
+vision/{pi_id}/{camera_id}/state/digest. Both are retained, so late subscribers
+get the current state immediately and can request the events they missed with
+the resync_history command.
+"""
+
+import threading
+from typing import Any, Dict, Set
+
+from logging_config import get_logger
+from config import COUNTS_COALESCE_WINDOW, COUNTS_KEEPALIVE_INTERVAL
+from mqtt_serialization import TopicCache, encode_counts
+from telemetry_scheduler import TickContext
+
+logger = get_logger(__name__)
+
+
+class CountPublisher:
+    def __init__(self, counter, mqtt_client, pi_id: str, scheduler,
+                 window: float = COUNTS_COALESCE_WINDOW, keepalive: float = COUNTS_KEEPALIVE_INTERVAL):
+        self.counter = counter
+        self.client = mqtt_client
+        self.pi_id = pi_id
+        self.topics = TopicCache(pi_id)
+        self.scheduler = scheduler
+        self.window = window
+        self.keepalive = keepalive
+
+        self.lock = threading.Lock()
+        self.dirty: Set[str] = set()
+        # Encoded payload last sent per camera; comparing bytes avoids rebuilding dicts
+        self.last_published: Dict[str, bytes] = {}
+
+        self.stats = {"notifications": 0, "published": 0, "unchanged": 0, "keepalives": 0}
+
+    def start(self):
+        self.scheduler.add_job("counts", self._publish_changed, priority=0, delay=self.window)
+        self.scheduler.add_job("counts_keepalive", self._publish_all, interval=self.keepalive, priority=5)
+        self.scheduler.add_job("state_digest", self._publish_digest, interval=self.keepalive, priority=5)
+        self.counter.change_listeners.append(self.notify)
+        logger.info(f"Count publisher registered (window {self.window}s, keepalive {self.keepalive}s)")
+
+    def stop(self):
+        """Unregister and publish counts that changed since the last run; the scheduler is stopped by then."""
+        if self.notify in self.counter.change_listeners:
+            self.counter.change_listeners.remove(self.notify)
+        self._publish_changed(TickContext(self.counter))
+
+    def notify(self, camera_id: str):
+        """Called by the counter (under its lock) when counts of a camera may have changed."""
+        with self.lock:
+            self.dirty.add(camera_id)
+            self.stats["notifications"] += 1
+        self.scheduler.trigger("counts")
+
+    def _publish_changed(self, context):
+        with self.lock:
+            dirty, self.dirty = self.dirty, set()
+        self._publish(context, dirty, force=False)
+
+    def _publish_all(self, context):
+        self._publish(context, None, force=True)
+        self.stats["keepalives"] += 1
+
+    def _publish(self, context, cameras, force: bool):
+        for camera_id, camera_state in context.counter_state().items():
+            if cameras is not None and camera_id not in cameras:
+                continue
+            if not camera_state.get("zones") and not camera_state.get("lines"):
+                continue
+            payload = context.fragment(("counts", camera_id), lambda: camera_state, encode=encode_counts)
+            if not force and self.last_published.get(camera_id) == payload:
+                self.stats["unchanged"] += 1
+                continue
+            self.client.publish(self.topics.get(camera_id, "counts", "update"), payload, qos=1, retain=True)
+            self.last_published[camera_id] = payload
+            self.stats["published"] += 1
+
+    def _publish_digest(self, context):
+        for camera_id, camera_state in context.counter_state().items():
+            payload = context.fragment(("digest", camera_id), lambda: {"ts": context.now, **camera_state})
+            self.client.publish(self.topics.get(camera_id, "state", "digest"), payload, qos=1, retain=True)
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self.lock:
+            return dict(self.stats)
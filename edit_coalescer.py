@@ -0,0 +1,112 @@
+"""
+Coalescing of interactive zone/line edits.
+While a shape is dragged or resized the dashboard sends a stream of set_zone /
+set_line events. Edits are kept per (camera, kind, shape); only the latest
+geometry within EDIT_COALESCE_WINDOW is applied, and the config is saved once
+when the edit ends (an edit flagged final, or EDIT_IDLE_SECONDS without
+further edits). Each applied edit is reported as a compact geometry delta.
+"""
+
+import threading
+import time
+from typing import Any, Callable, Dict, Optional, Set, Tuple
+
+from logging_config import get_logger
+from config import EDIT_COALESCE_WINDOW, EDIT_IDLE_SECONDS
+
+logger = get_logger(__name__)
+
+ShapeKey = Tuple[str, str, str]  # camera_id, kind ("zone" | "line"), name
+
+
+class EditCoalescer:
+    def __init__(self, counter, on_applied: Optional[Callable[[Dict[str, Any]], None]] = None,
+                 window: float = EDIT_COALESCE_WINDOW, idle: float = EDIT_IDLE_SECONDS):
+        self.counter = counter
+        self.on_applied = on_applied
+        self.window = window
+        self.idle = idle
+
+        self.lock = threading.Lock()
+        self.changed = threading.Condition(self.lock)
+        self.pending: Dict[ShapeKey, Dict[str, Any]] = {}
+        self.apply_at: Optional[float] = None
+        self.unsaved: Set[ShapeKey] = set()
+        self.save_at: Optional[float] = None
+        self.seq = 0
+
+        self.stats = {"received": 0, "applied": 0, "coalesced": 0, "saves": 0}
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def submit(self, camera_id: str, kind: str, name: str, geometry: Dict[str, Any], final: bool = False) -> bool:
+        """Queue an edit; returns False if the geometry is invalid."""
+        if not self.counter.validate_shape(kind, geometry):
+            return False
+        key = (camera_id, kind, name)
+        now = time.monotonic()
+        with self.lock:
+            self.stats["received"] += 1
+            if key in self.pending:
+                self.stats["coalesced"] += 1
+            self.pending[key] = geometry
+            if self.apply_at is None:
+                self.apply_at = now + self.window
+            self.save_at = now if final else now + self.idle
+            self.changed.notify()
+        return True
+
+    def _run(self):
+        while True:
+            with self.lock:
+                while True:
+                    now = time.monotonic()
+                    deadlines = [d for d in (self.apply_at, self.save_at if self.unsaved or self.pending else None)
+                                 if d is not None]
+                    if not deadlines:
+                        self.changed.wait()
+                        continue
+                    if min(deadlines) > now:
+                        self.changed.wait(min(deadlines) - now)
+                        continue
+                    break
+                edits = {}
+                if self.pending and (self.apply_at <= now or self.save_at <= now):
+                    edits, self.pending, self.apply_at = self.pending, {}, None
+                    self.unsaved.update(edits)
+                save = not self.pending and self.unsaved and self.save_at <= now
+                if save:
+                    self.unsaved.clear()
+                    self.save_at = None
+
+            for key, geometry in edits.items():
+                self._apply(key, geometry)
+            if save:
+                try:
+                    self.counter.save_layout()
+                    self.stats["saves"] += 1
+                except Exception as e:
+                    logger.error(f"Failed to save layout after edits: {e}")
+
+    def _apply(self, key: ShapeKey, geometry: Dict[str, Any]):
+        camera_id, kind, name = key
+        if kind == "zone":
+            ok = self.counter.create_or_update_zone(camera_id, name, geometry["top_left"], geometry["bottom_right"],
+                                                    persist=False)
+        else:
+            ok = self.counter.create_or_update_line(camera_id, name, geometry["start"], geometry["end"],
+                                                    persist=False)
+        if not ok:
+            return
+        self.stats["applied"] += 1
+        self.seq += 1
+        if self.on_applied is not None:
+            try:
+                self.on_applied({"camera": camera_id, "kind": kind, "name": name,
+                                 "geometry": geometry, "seq": self.seq})
+            except Exception as e:
+                logger.error(f"Failed to publish geometry delta for {kind} {name}: {e}")
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self.lock:
+            return {**self.stats, "pending": len(self.pending), "unsaved": len(self.unsaved)}
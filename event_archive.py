@@ -0,0 +1,297 @@
+"""
+Columnar long-retention archive of zone and line events.
+Each local day is one file of fixed-width NumPy structured records
+(timestamp, camera index, shape index, track id, action, x, y, dwell).
+Camera and shape names are kept in a small index next to the day files.
+Day files are opened with np.memmap, so range scans and aggregations
+(counts, dwell percentiles) run vectorized instead of building Python
+objects. Files older than the retention window are deleted.
+"""
+
+import datetime
+import json
+import os
+import threading
+import time
+import numpy as np
+from typing import Any, Dict, Iterable, List, Optional
+
+from logging_config import get_logger
+from persistence import atomic_write
+from config import ARCHIVE_DIR, ARCHIVE_RETENTION_DAYS, ARCHIVE_FSYNC_INTERVAL
+
+logger = get_logger(__name__)
+
+ARCHIVE_DTYPE = np.dtype([
+    ("ts", "<f8"),
+    ("camera", "<u2"),
+    ("shape", "<u2"),
+    ("track_id", "<i4"),
+    ("action", "u1"),
+    ("x", "<f4"),
+    ("y", "<f4"),
+    ("dwell", "<f4"),  # seconds inside the zone for exits, NaN otherwise
+])
+
+# Action codes follow the counter's history entries
+ACTIONS = ("Entered", "Exited", "In", "Out")
+ACTION_CODES = {action: code for code, action in enumerate(ACTIONS)}
+
+DAY_SUFFIX = ".evt"
+INDEX_FILE = "index.json"
+
+TRACK_ID_NONE = -1
+TRACK_ID_RANGE = np.iinfo(ARCHIVE_DTYPE["track_id"])
+
+
+def day_of(ts: float) -> str:
+    return datetime.date.fromtimestamp(ts).strftime("%Y%m%d")
+
+
+def archive_track_id(value: Any) -> Optional[int]:
+    """Track id as stored in the <i4 column, or None when it is not an integer in range."""
+    if isinstance(value, (int, np.integer)) and not isinstance(value, bool):
+        track_id = int(value)
+    elif isinstance(value, str) and value.lstrip("-").isdigit():
+        track_id = int(value)
+    else:
+        return None
+    return track_id if TRACK_ID_RANGE.min <= track_id <= TRACK_ID_RANGE.max else None
+
+
+class EventArchive:
+    def __init__(self, directory: str = ARCHIVE_DIR, retention_days: int = ARCHIVE_RETENTION_DAYS,
+                 fsync_interval: float = ARCHIVE_FSYNC_INTERVAL):
+        self.directory = directory
+        self.retention_days = retention_days
+        self.fsync_interval = fsync_interval
+        self.lock = threading.Lock()
+
+        self.cameras: List[str] = []
+        self.shapes: List[str] = []  # "zone:<name>" / "line:<name>"
+        self._camera_idx: Dict[str, int] = {}
+        self._shape_idx: Dict[str, int] = {}
+
+        self._day: Optional[str] = None
+        self._file = None
+        self._last_fsync = time.monotonic()
+        self.records_appended = 0
+        self.track_ids_skipped = 0
+
+        os.makedirs(directory, exist_ok=True)
+        self._load_index()
+        self._enforce_retention()
+
+    # --- name index --------------------------------------------------------------
+
+    def _load_index(self):
+        path = os.path.join(self.directory, INDEX_FILE)
+        if not os.path.exists(path):
+            return
+        try:
+            with open(path, "r") as f:
+                index = json.load(f)
+        except Exception as e:
+            logger.error(f"Failed to read archive index {path}: {e}")
+            return
+        self.cameras = list(index.get("cameras", []))
+        self.shapes = list(index.get("shapes", []))
+        self._camera_idx = {name: i for i, name in enumerate(self.cameras)}
+        self._shape_idx = {name: i for i, name in enumerate(self.shapes)}
+
+    def _save_index(self):
+        payload = json.dumps({"cameras": self.cameras, "shapes": self.shapes}).encode("utf-8")
+        atomic_write(os.path.join(self.directory, INDEX_FILE), payload)
+
+    def _intern(self, table: List[str], lookup: Dict[str, int], name: str) -> int:
+        idx = lookup.get(name)
+        if idx is None:
+            idx = lookup[name] = len(table)
+            table.append(name)
+            # Persist the name before any record refers to it
+            self._save_index()
+        return idx
+
+    # --- day files ---------------------------------------------------------------
+
+    def _day_path(self, day: str) -> str:
+        return os.path.join(self.directory, day + DAY_SUFFIX)
+
+    def _days(self) -> List[str]:
+        return sorted(name[:-len(DAY_SUFFIX)] for name in os.listdir(self.directory)
+                      if name.endswith(DAY_SUFFIX) and name[:-len(DAY_SUFFIX)].isdigit())
+
+    def _open_day(self, day: str):
+        self._close_day()
+        path = self._day_path(day)
+        # Drop a partial record left by a crash so the file stays a whole number of records
+        if os.path.exists(path):
+            size = os.path.getsize(path)
+            if size % ARCHIVE_DTYPE.itemsize:
+                logger.warning(f"Archive {path}: truncating {size % ARCHIVE_DTYPE.itemsize} bytes of torn tail")
+                with open(path, "r+b") as f:
+                    f.truncate(size - size % ARCHIVE_DTYPE.itemsize)
+        self._file = open(path, "ab")
+        self._day = day
+        self._enforce_retention()
+
+    def _close_day(self):
+        if self._file is not None:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._file.close()
+        self._file = None
+        self._day = None
+
+    def _enforce_retention(self):
+        cutoff = (datetime.date.today() - datetime.timedelta(days=self.retention_days)).strftime("%Y%m%d")
+        for day in self._days():
+            if day >= cutoff or day == self._day:
+                continue
+            try:
+                os.remove(self._day_path(day))
+                logger.info(f"Archive retention removed {day}")
+            except OSError:
+                pass
+
+    # --- write -------------------------------------------------------------------
+
+    def append(self, record: Dict[str, Any], ts: float, x: float = float("nan"), y: float = float("nan"),
+               dwell: float = float("nan")) -> None:
+        """Archive one event in the counter's schema ({"camera", "kind", "name", "id", "action", ...})."""
+        action = ACTION_CODES.get(record.get("action"))
+        if action is None:
+            return
+        track_id = archive_track_id(record.get("id", TRACK_ID_NONE))
+        if track_id is None:
+            # Logged once as a warning; later ones only at debug level to keep the log quiet
+            log = logger.debug if self.track_ids_skipped else logger.warning
+            log(f"Archiving {record.get('camera')} {record.get('kind')} {record.get('name')} event "
+                f"without its track id {record.get('id')!r} (not a 32-bit integer)")
+            self.track_ids_skipped += 1
+            track_id = TRACK_ID_NONE
+        row = np.zeros(1, dtype=ARCHIVE_DTYPE)
+        with self.lock:
+            row["ts"] = ts
+            row["camera"] = self._intern(self.cameras, self._camera_idx, record["camera"])
+            row["shape"] = self._intern(self.shapes, self._shape_idx, f"{record['kind']}:{record['name']}")
+            row["track_id"] = track_id
+            row["action"] = action
+            row["x"], row["y"] = x, y
+            row["dwell"] = np.nan if dwell is None else dwell
+
+            day = day_of(ts)
+            if day != self._day:
+                self._open_day(day)
+            self._file.write(row.tobytes())
+            self._file.flush()
+            self.records_appended += 1
+
+            now = time.monotonic()
+            if now - self._last_fsync >= self.fsync_interval:
+                os.fsync(self._file.fileno())
+                self._last_fsync = now
+
+    def close(self):
+        with self.lock:
+            self._close_day()
+
+    # --- read --------------------------------------------------------------------
+
+    def _map_day(self, day: str) -> Optional[np.ndarray]:
+        path = self._day_path(day)
+        try:
+            count = os.path.getsize(path) // ARCHIVE_DTYPE.itemsize
+        except OSError:
+            return None
+        if count == 0:
+            return None
+        return np.memmap(path, dtype=ARCHIVE_DTYPE, mode="r", shape=(count,))
+
+    def scan(self, start_ts: Optional[float] = None, end_ts: Optional[float] = None,
+             camera_id: Optional[str] = None, kind: Optional[str] = None,
+             name: Optional[str] = None) -> np.ndarray:
+        """Records with start_ts <= ts <= end_ts matching the filters, as one structured array."""
+        with self.lock:
+            camera = self._camera_idx.get(camera_id) if camera_id else None
+            shapes = None
+            if kind or name:
+                shapes = [i for i, shape in enumerate(self.shapes)
+                          if (not kind or shape.startswith(kind + ":"))
+                          and (not name or shape.split(":", 1)[1] == name)]
+        if (camera_id and camera is None) or shapes == []:
+            return np.zeros(0, dtype=ARCHIVE_DTYPE)
+
+        first_day = day_of(start_ts) if start_ts is not None else None
+        last_day = day_of(end_ts) if end_ts is not None else None
+        parts = []
+        for day in self._days():
+            if (first_day and day < first_day) or (last_day and day > last_day):
+                continue
+            records = self._map_day(day)
+            if records is None:
+                continue
+            # Records are appended in time order, so the range is a contiguous slice
+            lo = np.searchsorted(records["ts"], start_ts, side="left") if start_ts is not None else 0
+            hi = np.searchsorted(records["ts"], end_ts, side="right") if end_ts is not None else len(records)
+            chunk = records[lo:hi]
+            mask = np.ones(len(chunk), dtype=bool)
+            if camera is not None:
+                mask &= chunk["camera"] == camera
+            if shapes is not None:
+                mask &= np.isin(chunk["shape"], shapes)
+            parts.append(np.array(chunk[mask]))
+        if not parts:
+            return np.zeros(0, dtype=ARCHIVE_DTYPE)
+        return np.concatenate(parts)
+
+    def aggregate(self, start_ts: Optional[float] = None, end_ts: Optional[float] = None,
+                  camera_id: Optional[str] = None, kind: Optional[str] = None,
+                  percentiles: Iterable[float] = (50, 90, 99)) -> Dict[str, Any]:
+        """Counts per action and dwell percentiles per camera/zone/line over a time range."""
+        records = self.scan(start_ts, end_ts, camera_id=camera_id, kind=kind)
+        percentiles = list(percentiles)
+        result: Dict[str, Any] = {"start": start_ts, "end": end_ts, "records": int(len(records)), "cameras": {}}
+        if not len(records):
+            return result
+
+        keys = records["camera"].astype(np.uint32) << 16 | records["shape"]
+        unique_keys, inverse = np.unique(keys, return_inverse=True)
+        counts = np.zeros((len(unique_keys), len(ACTIONS)), dtype=np.int64)
+        np.add.at(counts, (inverse, records["action"]), 1)
+
+        dwell = records["dwell"]
+        has_dwell = ~np.isnan(dwell)
+        with self.lock:
+            cameras, shapes = list(self.cameras), list(self.shapes)
+        for i, key in enumerate(unique_keys):
+            camera, shape = cameras[key >> 16], shapes[key & 0xFFFF]
+            shape_kind, shape_name = shape.split(":", 1)
+            entry = {action: int(counts[i, code]) for code, action in enumerate(ACTIONS) if counts[i, code]}
+            if shape_kind == "zone":
+                dwells = dwell[(inverse == i) & has_dwell]
+                if len(dwells):
+                    values = np.percentile(dwells, percentiles)
+                    entry["dwell_seconds"] = {f"p{p:g}": round(float(v), 2) for p, v in zip(percentiles, values)}
+                    entry["dwell_seconds"]["mean"] = round(float(dwells.mean()), 2)
+            result["cameras"].setdefault(camera, {}).setdefault(f"{shape_kind}s", {})[shape_name] = entry
+        return result
+
+    def get_stats(self) -> Dict[str, Any]:
+        days = self._days()
+        total = 0
+        for day in days:
+            try:
+                total += os.path.getsize(self._day_path(day))
+            except OSError:
+                pass
+        return {
+            "directory": self.directory,
+            "days": len(days),
+            "first_day": days[0] if days else None,
+            "last_day": days[-1] if days else None,
+            "records": total // ARCHIVE_DTYPE.itemsize,
+            "total_bytes": total,
+            "records_appended": self.records_appended,
+            "track_ids_skipped": self.track_ids_skipped,
+        }
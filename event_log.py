@@ -0,0 +1,370 @@
+"""
+Append-only, segmented on-disk event log.
+Records are framed as a fixed header (payload length, timestamp, CRC32)
+followed by compact JSON. Segments rotate by size, each with a sparse time
+index so range queries seek close to their start instead of scanning
+everything. A torn tail left by a crash is detected by the CRC and
+truncated on open. EventWriter appends to the log (and the columnar archive)
+on a background thread so the counter never waits for the disk while holding
+its lock.
+"""
+
+import bisect
+import json
+import os
+import queue
+import struct
+import threading
+import time
+import zlib
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from logging_config import get_logger
+from config import (
+    EVENT_LOG_SEGMENT_BYTES,
+    EVENT_LOG_INDEX_INTERVAL_BYTES,
+    EVENT_LOG_MAX_BYTES,
+    EVENT_LOG_FSYNC_INTERVAL,
+    EVENT_LOG_MAX_QUEUED,
+)
+
+logger = get_logger(__name__)
+
+RECORD_HEADER = struct.Struct("<IdI")  # payload length, unix timestamp, crc32 of payload
+INDEX_ENTRY = struct.Struct("<dQ")  # timestamp, byte offset of the record in the segment
+MAX_RECORD_BYTES = 1 << 20
+
+
+class _Segment:
+    def __init__(self, directory: str, sequence: int):
+        self.sequence = sequence
+        self.log_path = os.path.join(directory, f"{sequence:010d}.log")
+        self.index_path = os.path.join(directory, f"{sequence:010d}.idx")
+        self.index_ts: List[float] = []
+        self.index_pos: List[int] = []
+        self.first_ts: Optional[float] = None
+        self.last_ts: Optional[float] = None
+        self.size = 0
+
+    def load_index(self):
+        self.index_ts, self.index_pos = [], []
+        if not os.path.exists(self.index_path):
+            return
+        with open(self.index_path, "rb") as f:
+            data = f.read()
+        usable = len(data) - len(data) % INDEX_ENTRY.size
+        for ts, pos in INDEX_ENTRY.iter_unpack(data[:usable]):
+            if pos >= self.size:
+                break
+            self.index_ts.append(ts)
+            self.index_pos.append(pos)
+
+    def seek_position(self, start_ts: Optional[float]) -> int:
+        """Byte offset of the last indexed record at or before start_ts."""
+        if start_ts is None or not self.index_ts:
+            return 0
+        i = bisect.bisect_right(self.index_ts, start_ts) - 1
+        return self.index_pos[i] if i >= 0 else 0
+
+
+def _scan(f, position: int, end: int) -> Iterator[Tuple[int, float, bytes]]:
+    """Yield (offset, timestamp, payload) of valid records; stops at the first torn or corrupt one."""
+    f.seek(position)
+    while position + RECORD_HEADER.size <= end:
+        header = f.read(RECORD_HEADER.size)
+        if len(header) < RECORD_HEADER.size:
+            return
+        length, ts, crc = RECORD_HEADER.unpack(header)
+        if length > MAX_RECORD_BYTES or position + RECORD_HEADER.size + length > end:
+            return
+        payload = f.read(length)
+        if len(payload) < length or zlib.crc32(payload) != crc:
+            return
+        yield position, ts, payload
+        position += RECORD_HEADER.size + length
+
+
+class SegmentedLog:
+    def __init__(self, directory: str,
+                 segment_max_bytes: int = EVENT_LOG_SEGMENT_BYTES,
+                 index_interval_bytes: int = EVENT_LOG_INDEX_INTERVAL_BYTES,
+                 max_total_bytes: int = EVENT_LOG_MAX_BYTES,
+                 fsync_interval: float = EVENT_LOG_FSYNC_INTERVAL):
+        self.directory = directory
+        self.segment_max_bytes = segment_max_bytes
+        self.index_interval_bytes = index_interval_bytes
+        self.max_total_bytes = max_total_bytes
+        self.fsync_interval = fsync_interval
+
+        self.lock = threading.Lock()
+        self.segments: List[_Segment] = []
+        self._log_file = None
+        self._index_file = None
+        self._bytes_since_index = 0
+        self._last_fsync = time.monotonic()
+        self.records_appended = 0
+        self.truncated_bytes = 0
+
+        os.makedirs(directory, exist_ok=True)
+        self._open()
+
+    # --- open / recovery ---------------------------------------------------------
+
+    def _open(self):
+        sequences = sorted(
+            int(name[:-4]) for name in os.listdir(self.directory)
+            if name.endswith(".log") and name[:-4].isdigit()
+        )
+        for sequence in sequences:
+            segment = _Segment(self.directory, sequence)
+            segment.size = os.path.getsize(segment.log_path)
+            segment.load_index()
+            self.segments.append(segment)
+
+        if self.segments:
+            self._recover_tail(self.segments[-1])
+            for segment in self.segments[:-1]:
+                self._load_bounds(segment)
+            self._open_active(self.segments[-1])
+        else:
+            self._roll()
+
+    def _load_bounds(self, segment: _Segment):
+        with open(segment.log_path, "rb") as f:
+            first = next(_scan(f, 0, segment.size), None)
+            if first is None:
+                return
+            segment.first_ts = first[1]
+            last_ts = first[1]
+            for _, ts, _ in _scan(f, segment.index_pos[-1] if segment.index_pos else 0, segment.size):
+                last_ts = ts
+            segment.last_ts = last_ts
+
+    def _recover_tail(self, segment: _Segment):
+        """Drop anything after the last complete record of the active segment."""
+        valid_end = 0
+        with open(segment.log_path, "rb") as f:
+            for position, ts, payload in _scan(f, 0, segment.size):
+                if segment.first_ts is None:
+                    segment.first_ts = ts
+                segment.last_ts = ts
+                valid_end = position + RECORD_HEADER.size + len(payload)
+        if valid_end < segment.size:
+            logger.warning(f"Event log {segment.log_path}: truncating {segment.size - valid_end} bytes of torn tail")
+            self.truncated_bytes += segment.size - valid_end
+            with open(segment.log_path, "r+b") as f:
+                f.truncate(valid_end)
+            segment.size = valid_end
+            segment.load_index()
+            with open(segment.index_path, "wb") as f:
+                for ts, pos in zip(segment.index_ts, segment.index_pos):
+                    f.write(INDEX_ENTRY.pack(ts, pos))
+
+    def _open_active(self, segment: _Segment):
+        self._close_active()
+        self._log_file = open(segment.log_path, "ab")
+        self._index_file = open(segment.index_path, "ab")
+        self._bytes_since_index = segment.size - (segment.index_pos[-1] if segment.index_pos else 0)
+        if not segment.index_pos:
+            self._bytes_since_index = self.index_interval_bytes  # index the first record
+
+    def _close_active(self):
+        for f in (self._log_file, self._index_file):
+            if f is not None:
+                f.flush()
+                os.fsync(f.fileno())
+                f.close()
+        self._log_file = self._index_file = None
+
+    def _roll(self):
+        sequence = self.segments[-1].sequence + 1 if self.segments else 1
+        segment = _Segment(self.directory, sequence)
+        self.segments.append(segment)
+        self._open_active(segment)
+        self._enforce_retention()
+
+    def _enforce_retention(self):
+        total = sum(segment.size for segment in self.segments)
+        while len(self.segments) > 1 and total > self.max_total_bytes:
+            oldest = self.segments.pop(0)
+            total -= oldest.size
+            for path in (oldest.log_path, oldest.index_path):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            logger.info(f"Event log retention removed segment {oldest.sequence}")
+
+    # --- write -------------------------------------------------------------------
+
+    def append(self, record: Dict[str, Any], ts: Optional[float] = None) -> None:
+        ts = time.time() if ts is None else ts
+        payload = json.dumps(record, separators=(",", ":")).encode("utf-8")
+        header = RECORD_HEADER.pack(len(payload), ts, zlib.crc32(payload))
+        with self.lock:
+            segment = self.segments[-1]
+            if segment.size and segment.size + len(header) + len(payload) > self.segment_max_bytes:
+                self._roll()
+                segment = self.segments[-1]
+
+            position = segment.size
+            if self._bytes_since_index >= self.index_interval_bytes:
+                self._index_file.write(INDEX_ENTRY.pack(ts, position))
+                self._index_file.flush()
+                segment.index_ts.append(ts)
+                segment.index_pos.append(position)
+                self._bytes_since_index = 0
+
+            self._log_file.write(header + payload)
+            self._log_file.flush()
+            segment.size += len(header) + len(payload)
+            self._bytes_since_index += len(header) + len(payload)
+            if segment.first_ts is None:
+                segment.first_ts = ts
+            segment.last_ts = ts
+            self.records_appended += 1
+
+            now = time.monotonic()
+            if now - self._last_fsync >= self.fsync_interval:
+                os.fsync(self._log_file.fileno())
+                self._last_fsync = now
+
+    def truncate_before(self, ts: float) -> int:
+        """Delete closed segments whose records are all older than ts; returns the number removed."""
+        removed = 0
+        with self.lock:
+            while len(self.segments) > 1 and self.segments[0].last_ts is not None and self.segments[0].last_ts < ts:
+                oldest = self.segments.pop(0)
+                for path in (oldest.log_path, oldest.index_path):
+                    try:
+                        os.remove(path)
+                    except OSError:
+                        pass
+                removed += 1
+        return removed
+
+    def close(self):
+        with self.lock:
+            self._close_active()
+
+    # --- read --------------------------------------------------------------------
+
+    def read(self, start_ts: Optional[float] = None, end_ts: Optional[float] = None) -> Iterator[Tuple[float, Dict[str, Any]]]:
+        """Yield (timestamp, record) in append order for start_ts <= ts <= end_ts."""
+        with self.lock:
+            # Snapshot the segment list and sizes; concurrent appends land beyond them
+            segments = [(segment, segment.size) for segment in self.segments]
+        for i, (segment, size) in enumerate(segments):
+            if start_ts is not None and i + 1 < len(segments):
+                next_first = segments[i + 1][0].first_ts
+                if next_first is not None and next_first < start_ts:
+                    continue
+            if end_ts is not None and segment.first_ts is not None and segment.first_ts > end_ts:
+                return
+            try:
+                with open(segment.log_path, "rb") as f:
+                    for _, ts, payload in _scan(f, segment.seek_position(start_ts), size):
+                        if start_ts is not None and ts < start_ts:
+                            continue
+                        if end_ts is not None and ts > end_ts:
+                            return
+                        yield ts, json.loads(payload)
+            except FileNotFoundError:
+                continue  # removed by retention while reading
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self.lock:
+            return {
+                "directory": self.directory,
+                "segments": len(self.segments),
+                "total_bytes": sum(segment.size for segment in self.segments),
+                "first_ts": self.segments[0].first_ts if self.segments else None,
+                "last_ts": self.segments[-1].last_ts if self.segments else None,
+                "records_appended": self.records_appended,
+                "truncated_bytes": self.truncated_bytes,
+            }
+
+
+class EventWriter:
+    def __init__(self, log: Optional[SegmentedLog], archive=None, max_queued: int = EVENT_LOG_MAX_QUEUED):
+        self.log = log
+        self.archive = archive
+        self.queue: "queue.Queue" = queue.Queue(maxsize=max_queued)
+        self.thread: Optional[threading.Thread] = None
+        self.written = 0
+        self.dropped = 0
+        self.errors = 0
+
+    def start(self):
+        if self.thread and self.thread.is_alive():
+            return
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def submit(self, record: Dict[str, Any], ts: float, archive_fields: Optional[Dict[str, Any]] = None) -> None:
+        """
+        Queue one record; never blocks. The record must not be modified afterwards.
+        archive_fields (x, y, dwell) are passed to the archive, which is skipped when None.
+        """
+        try:
+            self.queue.put_nowait((record, ts, archive_fields))
+        except queue.Full:
+            self.dropped += 1
+            if self.dropped % 1000 == 1:
+                logger.error(f"Event writer queue full, dropped {self.dropped} events so far")
+
+    def flush(self, timeout: float = 5.0) -> bool:
+        """Wait until everything submitted so far is written; False on timeout."""
+        if not self.thread or not self.thread.is_alive():
+            return not self.queue.unfinished_tasks
+        deadline = time.monotonic() + timeout
+        with self.queue.all_tasks_done:
+            while self.queue.unfinished_tasks:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self.queue.all_tasks_done.wait(remaining)
+        return True
+
+    def close(self):
+        """Write what is still queued, stop the thread and close the log and archive."""
+        if self.thread and self.thread.is_alive():
+            self.queue.put(None)
+            self.thread.join(timeout=10)
+        if self.log is not None:
+            self.log.close()
+        if self.archive is not None:
+            self.archive.close()
+
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            try:
+                if item is None:
+                    return
+                self._write(*item)
+            finally:
+                self.queue.task_done()
+
+    def _write(self, record: Dict[str, Any], ts: float, archive_fields: Optional[Dict[str, Any]]):
+        if self.archive is not None and archive_fields is not None:
+            try:
+                self.archive.append(record, ts, **archive_fields)
+            except Exception as e:
+                self.errors += 1
+                logger.error(f"Failed to archive {record.get('kind')} event: {e}")
+        if self.log is not None:
+            try:
+                self.log.append(record, ts=ts)
+                self.written += 1
+            except Exception as e:
+                self.errors += 1
+                logger.error(f"Failed to append {record.get('kind')} event to the event log: {e}")
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "queued": self.queue.qsize(),
+            "written": self.written,
+            "dropped": self.dropped,
+            "errors": self.errors,
+        }
@@ -0,0 +1,231 @@
+"""
+Micro-batched MQTT publishing of zone/line events.
+Events are collected per camera into envelopes that are flushed when they
+hold EVENT_BATCH_MAX_EVENTS events or the oldest is EVENT_BATCH_MAX_AGE
+seconds old, and published on vision/{pi_id}/{camera_id}/history/batch.
+Flushing always happens in the "event_batches" telemetry job; a full batch
+only triggers it early.
+Two encodings are available:
+
+json    {"v": 1, "camera", "t0", "names": ["zone:entrance", ...],
+         "events": [[dt_ms, name_idx, id, action_idx, seq], ...]}
+packed  version byte, camera, t0 and name table, then fixed 15-byte records
+
+decode_envelope() accepts both (a packed payload never starts with "{").
+"""
+
+import json
+import struct
+import threading
+import time
+from typing import Any, Dict, List, Tuple
+
+from logging_config import get_logger
+from config import EVENT_ENCODING, EVENT_BATCH_MAX_EVENTS, EVENT_BATCH_MAX_AGE
+from mqtt_serialization import TopicCache, dumps
+
+logger = get_logger(__name__)
+
+ENVELOPE_VERSION = 1
+ACTIONS = ("Entered", "Exited", "In", "Out")
+ACTION_CODES = {action: code for code, action in enumerate(ACTIONS)}
+KINDS = ("zone", "line")
+
+PACKED_HEADER = struct.Struct("<Bd")  # version, t0
+PACKED_EVENT = struct.Struct("<IHiBI")  # dt_ms, name index, track id, action, seq
+JSON_FIELDS = ("dt_ms", "name", "id", "action", "seq")
+
+
+def _names(events: List[Tuple[float, str, str, Dict[str, Any]]]) -> Tuple[List[str], Dict[Tuple[str, str], int]]:
+    names: List[str] = []
+    index: Dict[Tuple[str, str], int] = {}
+    for _, kind, name, _ in events:
+        if (kind, name) not in index:
+            index[(kind, name)] = len(names)
+            names.append(f"{kind}:{name}")
+    return names, index
+
+
+def encode_json(camera_id: str, events: List[Tuple[float, str, str, Dict[str, Any]]]) -> bytes:
+    """events are (ts, kind, name, entry) with entry holding id, action and seq."""
+    t0 = events[0][0]
+    names, index = _names(events)
+    rows = [[int(round((ts - t0) * 1000)), index[(kind, name)], entry.get("id"),
+             ACTION_CODES.get(entry.get("action"), -1), entry.get("seq", 0)]
+            for ts, kind, name, entry in events]
+    envelope = {"v": ENVELOPE_VERSION, "camera": camera_id, "t0": t0, "fields": JSON_FIELDS,
+                "actions": ACTIONS, "names": names, "events": rows}
+    return dumps(envelope)
+
+
+def _pack_str(value: str) -> bytes:
+    raw = value.encode("utf-8")[:255]
+    return bytes((len(raw),)) + raw
+
+
+def encode_packed(camera_id: str, events: List[Tuple[float, str, str, Dict[str, Any]]]) -> bytes:
+    t0 = events[0][0]
+    names, index = _names(events)
+    parts = [PACKED_HEADER.pack(ENVELOPE_VERSION, t0), _pack_str(camera_id), struct.pack("<H", len(names))]
+    for key in names:
+        kind, name = key.split(":", 1)
+        parts.append(bytes((KINDS.index(kind),)) + _pack_str(name))
+    parts.append(struct.pack("<H", len(events)))
+    for ts, kind, name, entry in events:
+        track_id = entry.get("id", -1)
+        parts.append(PACKED_EVENT.pack(int(round((ts - t0) * 1000)), index[(kind, name)],
+                                       track_id if type(track_id) is int else -1,
+                                       ACTION_CODES.get(entry.get("action"), 255), int(entry.get("seq", 0))))
+    return b"".join(parts)
+
+
+ENCODERS = {"json": encode_json, "packed": encode_packed}
+
+
+def decode_envelope(payload: bytes) -> Dict[str, Any]:
+    """Decode either encoding into {"camera", "events": [{"ts", "kind", "name", "id", "action", "seq"}]}."""
+    if payload[:1] == b"{":
+        envelope = json.loads(payload)
+        if envelope.get("v") != ENVELOPE_VERSION:
+            raise ValueError(f"Unsupported envelope version {envelope.get('v')}")
+        t0, names = envelope["t0"], envelope["names"]
+        events = []
+        for dt_ms, name_idx, track_id, action, seq in envelope["events"]:
+            kind, name = names[name_idx].split(":", 1)
+            events.append({"ts": t0 + dt_ms / 1000.0, "kind": kind, "name": name, "id": track_id,
+                           "action": ACTIONS[action] if 0 <= action < len(ACTIONS) else None, "seq": seq})
+        return {"camera": envelope["camera"], "events": events}
+
+    version, t0 = PACKED_HEADER.unpack_from(payload, 0)
+    if version != ENVELOPE_VERSION:
+        raise ValueError(f"Unsupported envelope version {version}")
+    offset = PACKED_HEADER.size
+
+    def read_str() -> str:
+        nonlocal offset
+        length = payload[offset]
+        value = payload[offset + 1:offset + 1 + length].decode("utf-8")
+        offset += 1 + length
+        return value
+
+    camera_id = read_str()
+    (name_count,) = struct.unpack_from("<H", payload, offset)
+    offset += 2
+    names = []
+    for _ in range(name_count):
+        kind = KINDS[payload[offset]]
+        offset += 1
+        names.append((kind, read_str()))
+    (event_count,) = struct.unpack_from("<H", payload, offset)
+    offset += 2
+    events = []
+    for dt_ms, name_idx, track_id, action, seq in PACKED_EVENT.iter_unpack(
+            payload[offset:offset + event_count * PACKED_EVENT.size]):
+        kind, name = names[name_idx]
+        events.append({"ts": t0 + dt_ms / 1000.0, "kind": kind, "name": name, "id": track_id,
+                       "action": ACTIONS[action] if action < len(ACTIONS) else None, "seq": seq})
+    return {"camera": camera_id, "events": events}
+
+
+class EventPublisher:
+    def __init__(self, mqtt_client, pi_id: str, encoding: str = EVENT_ENCODING,
+                 max_events: int = EVENT_BATCH_MAX_EVENTS, max_age: float = EVENT_BATCH_MAX_AGE):
+        if encoding not in ENCODERS:
+            raise ValueError(f"Unknown event encoding '{encoding}', expected one of {list(ENCODERS)}")
+        self.client = mqtt_client
+        self.pi_id = pi_id
+        self.topics = TopicCache(pi_id)
+        self.encoding = encoding
+        self.max_events = max_events
+        self.max_age = max_age
+
+        self.scheduler = None
+        self.lock = threading.Lock()
+        self.batches: Dict[str, List[Tuple[float, str, str, Dict[str, Any]]]] = {}
+        self.opened_at: Dict[str, float] = {}
+        self.stats = {"events": 0, "envelopes": 0, "bytes": 0, "errors": 0}
+
+    def start(self, scheduler):
+        """Flush full and aged batches from the telemetry scheduler."""
+        self.scheduler = scheduler
+        scheduler.add_job("event_batches", lambda context: self._flush_older_than(self.max_age),
+                          interval=min(self.max_age / 2, 0.5), priority=1)
+        logger.info(f"Event publisher started ({self.encoding}, {self.max_events} events / {self.max_age}s)")
+
+    def stop(self):
+        self.flush()
+
+    def publish(self, camera_id: str, kind: str, name: str, entry: Dict[str, Any], ts: float):
+        """Queue one event; called from the frame callback, so it never does network I/O."""
+        with self.lock:
+            batch = self.batches.setdefault(camera_id, [])
+            if not batch:
+                self.opened_at[camera_id] = time.monotonic()
+            batch.append((ts, kind, name, dict(entry)))
+            self.stats["events"] += 1
+            full = len(batch) == self.max_events
+        if full and self.scheduler is not None:
+            self.scheduler.trigger("event_batches")
+
+    def _flush_older_than(self, age: float):
+        """Send batches that are full or whose oldest event is at least age seconds old."""
+        now = time.monotonic()
+        with self.lock:
+            due = [camera_id for camera_id, batch in self.batches.items()
+                   if len(batch) >= self.max_events or (batch and now - self.opened_at.get(camera_id, now) >= age)]
+            ready = [(camera_id, self.batches.pop(camera_id)) for camera_id in due]
+        for camera_id, batch in ready:
+            # Events that arrived before the job ran may overfill a batch; keep envelopes at max_events
+            for start in range(0, len(batch), self.max_events):
+                self._send(camera_id, batch[start:start + self.max_events])
+
+    def flush(self):
+        self._flush_older_than(0.0)
+
+    def _send(self, camera_id: str, batch: List[Tuple[float, str, str, Dict[str, Any]]]):
+        try:
+            payload = ENCODERS[self.encoding](camera_id, batch)
+            self.client.publish(self.topics.get(camera_id, "history", "batch"), payload, qos=1)
+        except Exception as e:
+            self.stats["errors"] += 1
+            logger.error(f"Failed to publish event batch for {camera_id}: {e}")
+            return
+        self.stats["envelopes"] += 1
+        self.stats["bytes"] += len(payload)
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self.lock:
+            stats = dict(self.stats)
+            stats["pending"] = sum(len(batch) for batch in self.batches.values())
+        if stats["envelopes"]:
+            stats["events_per_envelope"] = round(stats["events"] / stats["envelopes"], 1)
+        return stats
+
+
+def benchmark(count: int = 20000, batch_size: int = EVENT_BATCH_MAX_EVENTS):
+    """Compare one JSON message per event with batched JSON and packed envelopes."""
+    t0 = time.time()
+    events = [(t0 + i * 0.05, "zone" if i % 3 else "line", f"shape{i % 4}",
+               {"id": 1000 + i, "action": ACTIONS[i % 4], "time": time.strftime("%Y-%m-%d %H:%M:%S"), "seq": i + 1})
+              for i in range(count)]
+
+    started = time.perf_counter()
+    single = sum(len(json.dumps({kind: name, **entry}).encode("utf-8")) for _, kind, name, entry in events)
+    single_s = time.perf_counter() - started
+    print(f"single JSON: {count} messages, {single / count:.1f} B/event, {count / single_s:,.0f} events/s")
+
+    for encoding, encoder in ENCODERS.items():
+        started = time.perf_counter()
+        payloads = [encoder("camera1", events[i:i + batch_size]) for i in range(0, count, batch_size)]
+        encode_s = time.perf_counter() - started
+        started = time.perf_counter()
+        decoded = sum(len(decode_envelope(payload)["events"]) for payload in payloads)
+        decode_s = time.perf_counter() - started
+        size = sum(len(payload) for payload in payloads)
+        assert decoded == count
+        print(f"{encoding:>6} x{batch_size}: {len(payloads)} messages, {size / count:.1f} B/event, "
+              f"encode {count / encode_s:,.0f} events/s, decode {count / decode_s:,.0f} events/s")
+
+
+if __name__ == "__main__":
+    benchmark()
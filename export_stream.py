@@ -0,0 +1,108 @@
+"""
+Streaming export of zone and line events as CSV or NDJSON.
+Rows come from the event log (or, without one, from a snapshot of the
+in-memory history taken under the counter lock and filtered after it is
+released), are filtered on numeric timestamps and are encoded into chunks
+of bounded size, so an export never holds the lock or the whole result.
+"""
+
+import csv
+import datetime
+import io
+import json
+from typing import Any, Dict, Iterable, Iterator, Optional
+
+from config import EXPORT_CHUNK_BYTES
+
+EXPORT_FIELDS = ("ts", "time", "camera", "kind", "name", "id", "action")
+
+
+def _snapshot_rows(counter, camera_id: Optional[str], kind: Optional[str]) -> Iterator[Dict[str, Any]]:
+    """Copy the in-memory history lists under the lock; parse and sort them after releasing it."""
+    copied = []
+    with counter.lock:
+        for cam_id, cam_data in counter.data.items():
+            if camera_id and cam_id != camera_id:
+                continue
+            for section, section_kind in (("zones", "zone"), ("lines", "line")):
+                if kind and kind != section_kind:
+                    continue
+                for name, item in cam_data.get(section, {}).items():
+                    copied.append((cam_id, section_kind, name, list(item.get("history", []))))
+
+    rows = []
+    for cam_id, section_kind, name, history in copied:
+        for entry in history:
+            try:
+                ts = datetime.datetime.strptime(entry["time"], "%Y-%m-%d %H:%M:%S").timestamp()
+            except (ValueError, KeyError, TypeError):
+                continue
+            rows.append({"ts": ts, "camera": cam_id, "kind": section_kind, "name": name,
+                         "id": entry.get("id"), "action": entry.get("action"), "time": entry.get("time")})
+    rows.sort(key=lambda row: row["ts"])
+    return iter(rows)
+
+
+def iter_events(counter, camera_id: Optional[str] = None, kind: Optional[str] = None,
+                start_ts: Optional[float] = None, end_ts: Optional[float] = None) -> Iterator[Dict[str, Any]]:
+    """Yield event rows in time order for start_ts <= ts <= end_ts."""
+    if counter.event_log is not None:
+        counter.event_writer.flush()
+        for ts, record in counter.event_log.read(start_ts, end_ts):
+            if camera_id and record.get("camera") != camera_id:
+                continue
+            if kind and record.get("kind") != kind:
+                continue
+            yield {"ts": ts, **record}
+        return
+
+    for row in _snapshot_rows(counter, camera_id, kind):
+        if start_ts is not None and row["ts"] < start_ts:
+            continue
+        if end_ts is not None and row["ts"] > end_ts:
+            break
+        yield row
+
+
+def iter_csv(rows: Iterable[Dict[str, Any]], chunk_bytes: int = EXPORT_CHUNK_BYTES) -> Iterator[str]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_FIELDS)
+    for row in rows:
+        writer.writerow([row.get(field, "") for field in EXPORT_FIELDS])
+        if buffer.tell() >= chunk_bytes:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def iter_ndjson(rows: Iterable[Dict[str, Any]], chunk_bytes: int = EXPORT_CHUNK_BYTES) -> Iterator[str]:
+    lines = []
+    size = 0
+    for row in rows:
+        line = json.dumps({field: row.get(field) for field in EXPORT_FIELDS}, separators=(",", ":"))
+        lines.append(line)
+        size += len(line) + 1
+        if size >= chunk_bytes:
+            yield "\n".join(lines) + "\n"
+            lines, size = [], 0
+    if lines:
+        yield "\n".join(lines) + "\n"
+
+
+EXPORT_FORMATS = {
+    "csv": (iter_csv, "text/csv"),
+    "ndjson": (iter_ndjson, "application/x-ndjson"),
+}
+
+
+def stream_export(counter, export_format: str = "csv", camera_id: Optional[str] = None,
+                  kind: Optional[str] = None, start_ts: Optional[float] = None,
+                  end_ts: Optional[float] = None):
+    """Return (chunk generator, mimetype) for the requested format."""
+    if export_format not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown export format '{export_format}', expected one of {list(EXPORT_FORMATS)}")
+    encoder, mimetype = EXPORT_FORMATS[export_format]
+    return encoder(iter_events(counter, camera_id, kind, start_ts, end_ts)), mimetype
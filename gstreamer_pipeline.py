@@ -8,6 +8,10 @@ import subprocess
 import logging
 from gi.repository import Gst, GLib
 from logging_config import get_logger
+from config import HEADLESS_MODE, FPS_WINDOW_SECONDS, SOURCE_WATCHDOG_INTERVAL
+from source_supervisor import SourceSlot, SourceState
+from pipeline_introspection import QueueMonitor
+from latency_tracer import LatencyTracer
 import os
 
 logger = get_logger(__name__)
@@ -295,6 +299,46 @@ def _run_validation_pipeline(test_pipeline, camera_index, timeout, method_name):
     
     return success
 
+class FpsMeter:
+    """Per-camera frame rate measured from the callback probe, independent of the sink."""
+
+    def __init__(self, window_seconds=FPS_WINDOW_SECONDS):
+        self.window_seconds = window_seconds
+        self.lock = threading.Lock()
+        self._frames = {}
+        self._window_start = {}
+        self._fps = {}
+        self._total_frames = {}
+
+    def tick(self, camera_id):
+        now = time.monotonic()
+        with self.lock:
+            start = self._window_start.setdefault(camera_id, now)
+            self._frames[camera_id] = self._frames.get(camera_id, 0) + 1
+            self._total_frames[camera_id] = self._total_frames.get(camera_id, 0) + 1
+            elapsed = now - start
+            if elapsed >= self.window_seconds:
+                self._fps[camera_id] = self._frames[camera_id] / elapsed
+                self._frames[camera_id] = 0
+                self._window_start[camera_id] = now
+
+    def get_fps(self):
+        with self.lock:
+            return {
+                camera_id: {
+                    "fps": round(self._fps.get(camera_id, 0.0), 2),
+                    "total_frames": total
+                }
+                for camera_id, total in self._total_frames.items()
+            }
+
+    def reset(self):
+        with self.lock:
+            self._frames.clear()
+            self._window_start.clear()
+            self._fps.clear()
+            self._total_frames.clear()
+
 def create_visitor_counter_callback(user_data, frame_buffers, pipeline_manager=None):
     def visitor_counter_callback(pad, info, user_data_param):
         buffer = info.get_buffer()
@@ -304,7 +348,13 @@ def create_visitor_counter_callback(user_data, frame_buffers, pipeline_manager=N
 
         try:
             format, width, height = get_caps_from_pad(pad)
-            camera_id = pipeline_manager._extract_camera_id_from_pad(pad)
+            slot = pipeline_manager._get_slot_from_pad(pad)
+            if slot is None:
+                return Gst.PadProbeReturn.OK
+            camera_id = slot.camera_id
+            if not pipeline_manager.on_source_buffer(slot):
+                return Gst.PadProbeReturn.OK
+            pipeline_manager.fps_meter.tick(camera_id)
             logger.debug(f"Processing frame from {camera_id} - Format: {format}, Size: {width}x{height}")
             detected_people = _extract_people_detections(buffer, width, height)
             
@@ -372,9 +422,11 @@ def _draw_visuals_on_frame(frame, user_data, camera_id):
             cv2.putText(frame, line_name, (start_point[0], start_point[1] - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 0), 2)
 
 class PipelineManager:
-    def __init__(self, user_data, frame_buffers):
+    def __init__(self, user_data, frame_buffers, headless=None):
         self.user_data = user_data
         self.frame_buffers = frame_buffers
+        self.headless = HEADLESS_MODE if headless is None else headless
+        self.fps_meter = FpsMeter()
         self.app_instance = None
         self.video_sources = []
         self.is_running_flag = False
@@ -382,15 +434,41 @@ class PipelineManager:
         self.bus_watch_id = None
         self.health_monitor = None
         self.camera_names = []
+        self.callback = None
+
+        # Per-source supervision. sources_lock only guards structural changes and is
+        # never taken from streaming threads (pad probes hand failures to a worker
+        # thread), so bins can be set to NULL while holding it.
+        self.sources = {}
+        self._slot_index = {}
+        self._next_source_index = 0
+        self.sources_lock = threading.RLock()
+        self.source_state_listeners = []
+        self.watchdog_stop_event = None
+
+        # Zero-downtime reconfiguration
+        self._standby = {}
+        self.last_reconfiguration = None
+        self.reconfigure_listeners = []
+
+        self.latency_tracer = LatencyTracer()
+        self.queue_monitor = QueueMonitor(self)
+        # Measured end-to-end latency takes precedence over the queued-time estimate
+        self.queue_monitor.add_latency_source(self.latency_tracer.get_recent_latency_ms)
         logger.info("PipelineManager initialized.")
 
     def _on_bus_message(self, bus, message):
         msg_type = message.type
         if msg_type == Gst.MessageType.ERROR:
             err, debug = message.parse_error()
-            logger.error(f"Gstreamer pipeline error: {err}, {debug}")
-            logger.warning("Critical pipeline erro detected. Attempting to restart the pipeline..")
-            self.trigger_restart()
+            slot = self._find_slot_for_element(message.src)
+            if slot is not None:
+                logger.error(f"Gstreamer error in source {slot.camera_id}: {err}, {debug}")
+                self._handle_source_failure(slot, str(err))
+            else:
+                logger.error(f"Gstreamer pipeline error: {err}, {debug}")
+                logger.warning("Critical pipeline erro detected. Attempting to restart the pipeline..")
+                self.trigger_restart()
 
         elif msg_type == Gst.MessageType.EOS:
             logger.info("End-of-Stream reached. Pipeline is stopping.")
@@ -410,6 +488,7 @@ class PipelineManager:
         if self.is_running():
             logger.info("Restarting pipeline...")
             source_to_restart = self.video_sources.copy()
+            names_to_restart = self.camera_names.copy()
 
             health_monitor_backup = self.health_monitor
 
@@ -419,27 +498,27 @@ class PipelineManager:
             self.health_monitor = health_monitor_backup
 
             if source_to_restart:
-                self.start_pipeline(source_to_restart)
+                self.start_pipeline(source_to_restart, custom_camera_names=names_to_restart)
             else:
                 logger.error("No video sources available to restart the pipeline.")
 
-    
+
     def start_pipeline(self, video_sources, custom_camera_names=None, on_started_callback=None):
         if custom_camera_names is None:
-            self.camera_names = [f"camera{i+1}" for i in range(len(video_sources))]
+            camera_names = [f"camera{i+1}" for i in range(len(video_sources))]
         else:
             if len(custom_camera_names) != len(video_sources):
                 raise ValueError("Length of custom_camera_names must equal length of video_sources.")
-            self.camera_names = custom_camera_names
-        
+            camera_names = custom_camera_names
+
         if self.is_running():
-            logger.info("Pipeline is already running. Stopping first.")
-            self.stop_pipeline()
-            time.sleep(1)
+            logger.info("Pipeline is already running. Reconfiguring without stopping it.")
+            return self.reconfigure(video_sources, camera_names, on_started_callback=on_started_callback)
+        self.camera_names = camera_names
 
         try:
             logger.info("Initializing fresh state for new pipeline...")
-            
+
             if hasattr(self.user_data, 'initialize_sources'):
                  self.user_data.initialize_sources(self.camera_names)
             else:
@@ -454,50 +533,51 @@ class PipelineManager:
             logger.info("RTSP sources validated. Creating GStreamer pipeline...")
             self.video_sources = video_sources
 
-            callback = create_visitor_counter_callback(self.user_data, self.frame_buffers, self)
+            self.callback = create_visitor_counter_callback(self.user_data, self.frame_buffers, self)
 
             self.app_instance = SafeGStreamerMultiSourceDetectionApp(
-                callback, self.user_data, video_sources, self.user_data.data
+                self.callback, self.user_data, video_sources, headless=self.headless
             )
             self.app_instance.create_pipeline()
 
             self.bus = self.app_instance.pipeline.get_bus()
             self.bus_watch_id = self.bus.add_watch(GLib.PRIORITY_DEFAULT, self._on_bus_message)
 
-            for i in range(len(video_sources)):
-                identity_name = f"identity_callback_{i}" if i > 0 else "identity_callback"
-                identity = self.app_instance.pipeline.get_by_name(identity_name)
-                if identity:
-                    src_pad = identity.get_static_pad("src")
-                    if src_pad:
-                        logger.info(f"Adding pad probe to '{identity_name}'")
-                        src_pad.add_probe(Gst.PadProbeType.BUFFER, callback, self.user_data)
-                else:
-                    logger.error(f"Could not find element '{identity_name}' to add a probe.")
+            with self.sources_lock:
+                self.sources = {}
+                self._slot_index = {}
+                for i, (camera_id, video_source) in enumerate(zip(self.camera_names, video_sources)):
+                    slot = SourceSlot(camera_id, video_source, index=i)
+                    slot.source_bin = self.app_instance.source_bins[i]
+                    self.sources[camera_id] = slot
+                    self._slot_index[i] = slot
+                    self._add_source_probes(slot)
+                self._next_source_index = len(video_sources)
 
             threading.Thread(target=self.app_instance.run, daemon=True).start()
             self.is_running_flag = True
+            self.fps_meter.reset()
+            logger.info(f"Pipeline running in {'headless' if self.app_instance.headless else 'display'} mode")
+
+            self.watchdog_stop_event = threading.Event()
+            threading.Thread(
+                target=self._run_source_watchdog, args=(self.watchdog_stop_event,), daemon=True
+            ).start()
+            self.queue_monitor.start()
+
+            for slot in list(self.sources.values()):
+                self._notify_source_state(slot)
 
             if self.health_monitor:
                 logger.info(f"Health monitor linked to pipeline")
             else:
                 logger.warning("Health monitor not set in PipelineManager")
-            
+
             if on_started_callback:
-                threading.Timer(2.0, on_started_callback, args=[self]).start()
+                threading.Thread(target=on_started_callback, args=(self,), daemon=True).start()
+
+            self._update_status_monitor()
 
-            try:
-                from pi_status_monitor import get_status_monitor
-                status_monitor = get_status_monitor(os.getenv("PI_UNIQUE_ID", "pi-default"))
-                if self.camera_names:
-                    cameras = self.camera_names
-                else:
-                    cameras = [f"camera{i+1}" for i in range(len(video_sources))]
-                
-                status_monitor.set_pipeline_status(True, cameras=cameras)
-            except Exception as e:
-                logger.warning(f"Could not update status monitor: {e}")
-                
             logger.info("Pipeline started successfully")
             return True
 
@@ -507,8 +587,383 @@ class PipelineManager:
             self.is_running_flag = False
             return False
 
+    def _update_status_monitor(self):
+        try:
+            from pi_status_monitor import get_status_monitor
+            status_monitor = get_status_monitor(os.getenv("PI_UNIQUE_ID", "pi-default"))
+            if self.is_running():
+                status_monitor.set_pipeline_status(True, cameras=list(self.camera_names))
+            else:
+                status_monitor.set_pipeline_status(False)
+        except Exception as e:
+            logger.warning(f"Could not update status monitor: {e}")
+
+    def _add_source_probes(self, slot):
+        identity_name = f"identity_callback_{slot.index}" if slot.index > 0 else "identity_callback"
+        identity = slot.source_bin.get_by_name(identity_name)
+        if not identity:
+            logger.error(f"Could not find element '{identity_name}' to add a probe.")
+            return
+        src_pad = identity.get_static_pad("src")
+        if src_pad:
+            logger.info(f"Adding pad probe to '{identity_name}' ({slot.camera_id})")
+            src_pad.add_probe(Gst.PadProbeType.BUFFER, self.callback, self.user_data)
+            src_pad.add_probe(Gst.PadProbeType.EVENT_DOWNSTREAM, self._on_source_event, slot)
+        try:
+            self.latency_tracer.attach(slot)
+        except Exception as e:
+            logger.warning(f"Could not attach latency tracing to {slot.camera_id}: {e}")
+
+    def _on_source_event(self, pad, info, slot):
+        event = info.get_event()
+        if event is not None and event.type == Gst.EventType.EOS:
+            logger.warning(f"End-of-Stream from {slot.camera_id}. Restarting this source only.")
+            # Off the streaming thread: the restart takes sources_lock and sets this bin to NULL
+            threading.Thread(target=self._handle_source_failure, args=(slot, "end of stream"),
+                             daemon=True).start()
+            # Keep the sink from going EOS; the bin is about to be replaced
+            return Gst.PadProbeReturn.DROP
+        return Gst.PadProbeReturn.OK
+
+    def _find_slot_for_element(self, element):
+        obj = element
+        while obj is not None:
+            name = obj.get_name() or ""
+            if name.startswith("source_bin_"):
+                try:
+                    return self._slot_index.get(int(name[len("source_bin_"):]))
+                except ValueError:
+                    return None
+            obj = obj.get_parent()
+        return None
+
+    def _attach_source_bin(self, slot):
+        index = self._next_source_index
+        self._next_source_index += 1
+        source_bin = self.app_instance.create_source_bin(index, slot.video_source)
+        slot.index = index
+        slot.source_bin = source_bin
+        self._slot_index[index] = slot
+        self.app_instance.pipeline.add(source_bin)
+        self._add_source_probes(slot)
+        source_bin.sync_state_with_parent()
+        logger.info(f"Attached {source_bin.get_name()} for {slot.camera_id}")
+
+    def _detach_source_bin(self, slot):
+        source_bin = slot.source_bin
+        slot.source_bin = None
+        self._slot_index.pop(slot.index, None)
+        self.latency_tracer.detach(slot)
+        if source_bin is None:
+            return
+        source_bin.set_state(Gst.State.NULL)
+        if self.app_instance and self.app_instance.pipeline:
+            self.app_instance.pipeline.remove(source_bin)
+        self.frame_buffers.pop(slot.camera_id, None)
+        logger.info(f"Detached {source_bin.get_name()} for {slot.camera_id}")
+
+    def _sync_source_lists(self):
+        self.camera_names = [slot.camera_id for slot in self.sources.values()]
+        self.video_sources = [slot.video_source for slot in self.sources.values()]
+
+    def add_source_state_listener(self, listener):
+        self.source_state_listeners.append(listener)
+
+    def _notify_source_state(self, slot):
+        state = slot.to_dict()
+        for listener in list(self.source_state_listeners):
+            try:
+                listener(state)
+            except Exception as e:
+                logger.error(f"Source state listener failed: {e}")
+
+    def _set_source_state(self, slot, state, error=None):
+        if slot.set_state(state, error):
+            logger.info(f"Source {slot.camera_id} -> {state.value}" + (f" ({error})" if error else ""))
+            self._notify_source_state(slot)
+
+    def on_source_buffer(self, slot):
+        """Called for every frame. Returns False if the frame must not be counted."""
+        first_buffer = slot.mark_buffer()
+        if not slot.counting:
+            if slot.standby and first_buffer:
+                slot.set_state(SourceState.RUNNING)
+                threading.Thread(target=self._complete_swap, args=(slot,), daemon=True).start()
+            return False
+
+        if first_buffer:
+            self._set_source_state(slot, SourceState.RUNNING)
+        if slot.pending_gap_from is not None:
+            gap = time.monotonic() - slot.pending_gap_from
+            slot.pending_gap_from = None
+            self._record_counting_gap(slot.camera_id, gap)
+        return True
+
+    def _handle_source_failure(self, slot, reason):
+        if slot.standby:
+            self._abort_standby(slot, reason)
+        else:
+            self.schedule_source_restart(slot.camera_id, reason=reason, index=slot.index)
+
+    def schedule_source_restart(self, camera_id, reason="", index=None):
+        with self.sources_lock:
+            slot = self.sources.get(camera_id)
+            if slot is None or slot.state in (SourceState.BACKOFF, SourceState.STOPPED):
+                return False
+            if index is not None and index != slot.index:
+                return False
+            delay = slot.next_backoff()
+            self._set_source_state(slot, SourceState.BACKOFF, error=reason)
+            slot.cancel_event = threading.Event()
+            cancel_event = slot.cancel_event
+
+        logger.warning(f"Restarting source {camera_id} in {delay:.1f}s (attempt {slot.failures})")
+        threading.Thread(
+            target=self._run_source_restart, args=(slot, delay, cancel_event), daemon=True
+        ).start()
+        return True
+
+    def _run_source_restart(self, slot, delay, cancel_event):
+        try:
+            self._detach_source_bin(slot)
+        except Exception as e:
+            logger.error(f"Error detaching source {slot.camera_id}: {e}")
+
+        if cancel_event.wait(delay):
+            return
+
+        error = None
+        with self.sources_lock:
+            if self.sources.get(slot.camera_id) is not slot or not self.is_running():
+                return
+            try:
+                self._attach_source_bin(slot)
+                slot.restarts += 1
+            except Exception as e:
+                error = f"rebuild failed: {e}"
+                logger.error(f"Failed to rebuild source {slot.camera_id}: {e}")
+            self._set_source_state(slot, SourceState.STARTING)
+
+        if error:
+            self.schedule_source_restart(slot.camera_id, reason=error)
+
+    def _run_source_watchdog(self, stop_event):
+        while not stop_event.wait(SOURCE_WATCHDOG_INTERVAL):
+            now = time.monotonic()
+            for slot in list(self.sources.values()) + list(self._standby.values()):
+                reason = slot.check_health(now)
+                if reason:
+                    self._handle_source_failure(slot, reason)
+
+    def reconfigure(self, video_sources, custom_camera_names=None, on_started_callback=None):
+        """
+        Apply a new source list while the current one keeps counting.
+        Unchanged cameras are left alone, new cameras are attached, removed ones detached,
+        and cameras whose URL changed are warmed up in a standby bin and swapped in on
+        their first frame. Counter state of kept and replaced cameras is not touched.
+        """
+        if custom_camera_names is None:
+            custom_camera_names = [f"camera{i+1}" for i in range(len(video_sources))]
+        if len(custom_camera_names) != len(video_sources):
+            raise ValueError("Length of custom_camera_names must equal length of video_sources.")
+
+        if not self.is_running():
+            return self.start_pipeline(video_sources, custom_camera_names, on_started_callback)
+
+        started = time.monotonic()
+        desired = dict(zip(custom_camera_names, video_sources))
+        with self.sources_lock:
+            current = {camera_id: slot.video_source for camera_id, slot in self.sources.items()}
+            pending = dict(self._standby)
+
+        added = [c for c in desired if c not in current]
+        replaced = [c for c in desired if c in current and current[c] != desired[c]]
+        removed = [c for c in current if c not in desired]
+        kept = [c for c in desired if c in current and current[c] == desired[c]]
+        # A standby still warming up for the same URL is left to finish; any other is superseded
+        warming = [c for c in replaced if c in pending and pending[c].video_source == desired[c]]
+        superseded = [standby for c, standby in pending.items() if c not in warming]
+        logger.info(f"Reconfiguring pipeline: kept={kept} added={added} replaced={replaced} removed={removed}")
+
+        to_start = added + [c for c in replaced if c not in warming]
+        if to_start:
+            is_valid, message, failed_sources = validate_rtsp_sources([desired[c] for c in to_start])
+            if not is_valid:
+                logger.error(f"RTSP validation failed: {message}, Details: {failed_sources}")
+                return False
+
+        for standby in superseded:
+            self._abort_standby(standby, "superseded")
+
+        if added and hasattr(self.user_data, 'initialize_sources'):
+            self.user_data.initialize_sources(added)
+
+        self.last_reconfiguration = {
+            "started_at": time.time(),
+            "completed_at": None,
+            "kept": kept,
+            "added": added,
+            "replaced": replaced,
+            "removed": removed,
+            "pending": list(replaced),
+            "counting_gap_ms": {camera_id: 0.0 for camera_id in kept},
+        }
+
+        try:
+            with self.sources_lock:
+                for camera_id in added:
+                    slot = SourceSlot(camera_id, desired[camera_id])
+                    self.sources[camera_id] = slot
+                    self._attach_source_bin(slot)
+                for camera_id in replaced:
+                    if camera_id in warming:
+                        continue
+                    standby = SourceSlot(camera_id, desired[camera_id])
+                    standby.counting = False
+                    standby.standby = True
+                    self._standby[camera_id] = standby
+                    self._attach_source_bin(standby)
+        except Exception as e:
+            logger.error(f"Failed to prepare new sources: {e}", exc_info=True)
+            return False
+
+        for camera_id in removed:
+            self.remove_source(camera_id)
+
+        with self.sources_lock:
+            self.sources = {c: self.sources[c] for c in custom_camera_names if c in self.sources}
+            self._sync_source_lists()
+        for camera_id in added:
+            self._notify_source_state(self.sources[camera_id])
+
+        self.last_reconfiguration["prepare_seconds"] = round(time.monotonic() - started, 3)
+        if not replaced:
+            self._finish_reconfiguration()
+
+        self._update_status_monitor()
+        if on_started_callback:
+            threading.Thread(target=on_started_callback, args=(self,), daemon=True).start()
+        return True
+
+    def _complete_swap(self, standby):
+        camera_id = standby.camera_id
+        with self.sources_lock:
+            if self._standby.get(camera_id) is not standby:
+                return
+            del self._standby[camera_id]
+            old = self.sources.get(camera_id)
+            standby.pending_gap_from = old.last_buffer_time if old and old.last_buffer_time else time.monotonic()
+            # Stop the old branch counting before the new one starts so no frame is counted twice
+            if old:
+                old.counting = False
+            standby.standby = False
+            standby.counting = True
+            self.sources = {c: (standby if c == camera_id else s) for c, s in self.sources.items()}
+            self._sync_source_lists()
+        logger.info(f"Swapped in new source for {camera_id}")
+        self._notify_source_state(standby)
+
+        if old:
+            old.cancel_event.set()
+            self._detach_source_bin(old)
+
+    def _abort_standby(self, standby, reason):
+        camera_id = standby.camera_id
+        with self.sources_lock:
+            if self._standby.get(camera_id) is not standby:
+                return
+            del self._standby[camera_id]
+        logger.warning(f"Dropping new source for {camera_id} before swap ({reason}). Keeping the current source.")
+        self._detach_source_bin(standby)
+        self._record_counting_gap(camera_id, None)
+
+    def _record_counting_gap(self, camera_id, gap):
+        report = self.last_reconfiguration
+        if not report or camera_id not in report["pending"]:
+            return
+        report["pending"].remove(camera_id)
+        report["counting_gap_ms"][camera_id] = round(gap * 1000, 1) if gap is not None else None
+        if not report["pending"]:
+            self._finish_reconfiguration()
+
+    def _finish_reconfiguration(self):
+        report = self.last_reconfiguration
+        report["completed_at"] = time.time()
+        logger.info(f"Reconfiguration complete. Counting gaps (ms): {report['counting_gap_ms']}")
+        for listener in list(self.reconfigure_listeners):
+            try:
+                listener(report)
+            except Exception as e:
+                logger.error(f"Reconfiguration listener failed: {e}")
+
+    def add_reconfigure_listener(self, listener):
+        self.reconfigure_listeners.append(listener)
+
+    def add_source(self, camera_id, video_source):
+        if not self.is_running():
+            return self.start_pipeline([video_source], custom_camera_names=[camera_id])
+
+        with self.sources_lock:
+            if camera_id in self.sources:
+                logger.warning(f"Source {camera_id} already exists")
+                return False
+
+        is_valid, message, failed_sources = validate_rtsp_sources([video_source])
+        if not is_valid:
+            logger.error(f"RTSP validation failed for {camera_id}: {message}, Details: {failed_sources}")
+            return False
+
+        if hasattr(self.user_data, 'initialize_sources'):
+            self.user_data.initialize_sources([camera_id])
 
-    def _extract_camera_id_from_pad(self, pad):
+        slot = SourceSlot(camera_id, video_source)
+        with self.sources_lock:
+            self.sources[camera_id] = slot
+            try:
+                self._attach_source_bin(slot)
+            except Exception as e:
+                logger.error(f"Failed to add source {camera_id}: {e}", exc_info=True)
+                del self.sources[camera_id]
+                return False
+            self._sync_source_lists()
+        self._notify_source_state(slot)
+        self._update_status_monitor()
+        return True
+
+    def remove_source(self, camera_id):
+        with self.sources_lock:
+            slot = self.sources.pop(camera_id, None)
+            if slot is None:
+                logger.warning(f"Source {camera_id} not found")
+                return False
+            slot.cancel_event.set()
+            self._sync_source_lists()
+            remaining = len(self.sources)
+
+        self._detach_source_bin(slot)
+        self.latency_tracer.forget(camera_id)
+        self._set_source_state(slot, SourceState.STOPPED)
+
+        if remaining == 0:
+            logger.info("Last source removed. Stopping pipeline.")
+            return self.stop_pipeline()
+        self._update_status_monitor()
+        return True
+
+    def restart_source(self, camera_id):
+        with self.sources_lock:
+            slot = self.sources.get(camera_id)
+            if slot is None:
+                logger.warning(f"Source {camera_id} not found")
+                return False
+            slot.failures = 0
+        return self.schedule_source_restart(camera_id, reason="manual restart")
+
+    def get_source_status(self):
+        with self.sources_lock:
+            return [slot.to_dict() for slot in self.sources.values()]
+
+    def _get_slot_from_pad(self, pad):
         element = pad.get_parent_element()
         element_name = element.get_name()
         source_index = 0
@@ -517,17 +972,24 @@ class PipelineManager:
                 source_index = int(element_name.split("identity_callback_")[-1])
             except ValueError:
                 print(f"Couldn't parse source from {element_name}, defaulting to 0")
-        if 0 <= source_index < len(self.camera_names):
-            return self.camera_names[source_index]
-        else:
-            logger.warning(f"Source index {source_index} out of range, defaulting camera name to 'unknown_camera'")
-            return "unknown_camera"
+        return self._slot_index.get(source_index)
 
     def stop_pipeline(self):
         if not self.is_running():
             logger.info("Stop command received, but no pipeline was running.")
             return True
         logger.info("Stopping pipeline...")
+        if self.watchdog_stop_event:
+            self.watchdog_stop_event.set()
+        self.queue_monitor.stop()
+        with self.sources_lock:
+            for slot in self.sources.values():
+                slot.cancel_event.set()
+                slot.set_state(SourceState.STOPPED)
+                self._notify_source_state(slot)
+            self.sources = {}
+            self._standby = {}
+            self._slot_index = {}
         try:
             if self.bus_watch_id:
                 GLib.source_remove(self.bus_watch_id)
@@ -545,18 +1007,13 @@ class PipelineManager:
                     else:
                         logger.warning("Pipeline did not stop cleanly after EOS.")
                 time.sleep(0.5)
-                 
+
             self.app_instance = None
             self.frame_buffers.clear()
             self.video_sources = []
             self.is_running_flag = False
 
-            try:
-                from pi_status_monitor import get_status_monitor
-                status_monitor = get_status_monitor(os.getenv("PI_UNIQUE_ID", "pi-default"))
-                status_monitor.set_pipeline_status(False)
-            except Exception as e:
-                logger.warning(f"Could not update status monitor: {e}")
+            self._update_status_monitor()
 
             logger.info("Pipeline stopped successfully.")
             return True
@@ -571,3 +1028,6 @@ class PipelineManager:
 
     def is_running(self):
         return self.app_instance is not None and self.is_running_flag
+
+    def get_fps(self):
+        return self.fps_meter.get_fps()
@@ -14,14 +14,13 @@ from hailo_apps_infra1.hailo_rpi_common import (
     detect_hailo_arch,
 )
 from hailo_apps_infra1.gstreamer_helper_pipelines import(
-    QUEUE,
     SOURCE_PIPELINE,
     INFERENCE_PIPELINE,
     INFERENCE_PIPELINE_WRAPPER,
     TRACKER_PIPELINE,
     USER_CALLBACK_PIPELINE,
     DISPLAY_PIPELINE,
-    CROP_PIPELINE,
+    HEADLESS_SINK_PIPELINE,
     
 )
 from hailo_apps_infra1.gstreamer_app import (
@@ -118,7 +117,7 @@ class GStreamerDetectionApp(GStreamerApp):
         return pipeline_string
 
 class GStreamerMultiSourceDetectionApp(GStreamerApp):
-    def __init__(self, app_callback, user_data, video_sources):
+    def __init__(self, app_callback, user_data, video_sources, headless=False):
         parser = get_default_parser()
         parser.add_argument(
             "--labels-json",
@@ -131,6 +130,8 @@ class GStreamerMultiSourceDetectionApp(GStreamerApp):
 
         super().__init__(args, user_data)
         self.video_sources = video_sources  # Multiple RTSP sources
+        # Headless mode can be requested by the caller or with --headless
+        self.headless = self.headless or headless
         self.batch_size = 2
         # Determine the architecture if not specified
         if args.arch is None:
@@ -170,91 +171,93 @@ class GStreamerMultiSourceDetectionApp(GStreamerApp):
 
         self.create_pipeline()
 
+    def get_source_pipeline_string(self, i, video_source):
+        """
+        Returns the pipeline string of a single source branch (source ... sink).
+        Element names are suffixed with the index so several branches can share one pipeline.
+        """
+        source_pipeline = SOURCE_PIPELINE(video_source, self.video_width, self.video_height, name=f"src_{i}", source_index=i)
+
+        detection_pipeline = INFERENCE_PIPELINE(
+            hef_path=self.hef_path,
+            post_process_so=self.post_process_so,
+            post_function_name=self.post_function_name,
+            batch_size=self.batch_size,
+            config_json=self.labels_json,
+            additional_params=self.thresholds_str,
+            name=f"infer_{i}") # ✅ Unique name per source
+
+        detection_pipeline_wrapper = INFERENCE_PIPELINE_WRAPPER(detection_pipeline, name=f"inference_wrapper_{i}")
+        tracker_pipeline = TRACKER_PIPELINE(class_id=1, keep_past_metadata=True, name=f"tracker_{i}")  # ✅ Unique tracker per source
+        if i == 0:
+            identity_name = "identity_callback"
+            display_name = "hailo_display"
+        else:
+            identity_name = f"identity_callback_{i}"
+            display_name = f"source_display_{i}"
+
+        user_callback_pipeline = USER_CALLBACK_PIPELINE(name=identity_name)
+        if self.headless:
+            display_pipeline = HEADLESS_SINK_PIPELINE(name=display_name)
+        else:
+            display_pipeline = DISPLAY_PIPELINE(video_sink=self.video_sink, sync=self.sync, show_fps=self.show_fps, name=display_name)
+
+        # Ensure unique queue names per pipeline
+        return (
+            f"{source_pipeline} ! "
+            f"{detection_pipeline_wrapper} ! "
+            f"{tracker_pipeline} ! "
+            f"{user_callback_pipeline} ! {display_pipeline}"
+        )
+
     def get_pipeline_string(self):
         source_pipelines = []
         compositor_elements = []
-        cropper_so_path = os.path.join(self.current_path, '../resources/libdetection_croppers.so')
-        
+
         num_sources = len(self.video_sources)
         screen_width = 1280 if num_sources <= 2 else 1920
         screen_height = 720 if num_sources <= 2 else 1080
 
         for i, video_source in enumerate(self.video_sources):
-            source_pipeline = SOURCE_PIPELINE(video_source, self.video_width, self.video_height, name=f"src_{i}", source_index=i)
-
-            detection_pipeline = INFERENCE_PIPELINE(
-                hef_path=self.hef_path,
-                post_process_so=self.post_process_so,
-                post_function_name=self.post_function_name,
-                batch_size=self.batch_size,
-                config_json=self.labels_json,
-                additional_params=self.thresholds_str,
-                name=f"infer_{i}") # ✅ Unique name per source
-            
-            detection_pipeline_wrapper = INFERENCE_PIPELINE_WRAPPER(detection_pipeline, name=f"inference_wrapper_{i}")
-            tracker_pipeline = TRACKER_PIPELINE(class_id=1, keep_past_metadata=True, name=f"tracker_{i}")  # ✅ Unique tracker per source
-            cropper_pipeline = CROP_PIPELINE(
-                so_path=cropper_so_path,
-                function_name="all_detections",
-                name=f"cropper_{i}",
-                output_path=f"/tmp/crop_{i}_%05d.jpg"
-            )
-            if i == 0:
-                identity_name = "identity_callback"
-                display_name = "hailo_display"
-            else:    
-                identity_name = f"identity_callback_{i}"
-                display_name = f"source_display_{i}"
-                
-            
-            user_callback_pipeline = USER_CALLBACK_PIPELINE(name=identity_name)
-            display_pipeline = DISPLAY_PIPELINE(video_sink=self.video_sink, sync=self.sync, show_fps=self.show_fps, name=display_name)
-            
-            enhancement_pipeline = (
-                f'{QUEUE(name=f"enhance_{i}_q")} ! '
-                f'videoconvert name=enhance_{i}_convert ! '
-            )
-            
-            #user_callback_pipeline = USER_CALLBACK_PIPELINE(name=f"identity_callback_{i}")
-            '''(
-                f'{QUEUE(name=f"identity_callback_{i}_q")} ! '
-                f'identity name=identity_callback_{i} '  #  # ✅ Unique callback per source
-            )'''
-            #display_pipeline = DISPLAY_PIPELINE(video_sink=self.video_sink, sync=self.sync, show_fps=self.show_fps, name=f"source_display_{i}")
             # Define compositor positions dynamically
             xpos = (i % 2) * (screen_width // 2 )
             ypos = (i // 2) * (screen_height // 2 )
             compositor_elements.append(f"sink_{i}::xpos={xpos} sink_{i}::ypos={ypos}")
 
-            # Ensure unique queue names per pipeline
-            full_pipeline = (
-                f"{source_pipeline} ! "
-                f"{detection_pipeline_wrapper} ! "
-                f"{tracker_pipeline} ! "
-                f"{user_callback_pipeline} ! {display_pipeline}"
-            )
-
-            
-            
-            #full_pipeline = f"{source_pipeline} ! {detection_pipeline_wrapper} ! {tracker_pipeline} ! {cropper_pipeline} ! {user_callback_pipeline} ! {display_pipeline} "#! comp.sink_{i} "
-            '''full_pipeline = (
-                f'{source_pipeline} ! '
-                f'queue name=q_infer leaky=no max-size-buffers=3 max-size-bytes=0 max-size-time=0 ! '
-                f'{detection_pipeline} ! '
-                f'queue name=q_tracker leaky=no max-size-buffers=3 max-size-bytes=0 max-size-time=0 ! '
-                f'{tracker_pipeline} ! '
-                f'queue name=q_display leaky=no max-size-buffers=3 max-size-bytes=0 max-size-time=0 ! '
-                f'{display_pipeline} ! '
-                f'comp.sink_{i}'
-            )'''
-            source_pipelines.append(full_pipeline)
+            source_pipelines.append(self.get_source_pipeline_string(i, video_source))
 
         compositor_pipeline = f"compositor name=comp { ' '.join(compositor_elements) } ! videoconvert ! autovideosink sync=false"
 
         pipeline_string = " ".join(source_pipelines) #+ compositor_pipeline
         print("Pipeline:\n", pipeline_string)
         return pipeline_string
-        #
+
+    def create_source_bin(self, i, video_source):
+        """
+        Builds one source branch as an independent bin named source_bin_{i}.
+        The branch ends in its own sink, so the bin needs no ghost pads and can be
+        added to or removed from a running pipeline without touching other sources.
+        """
+        pipeline_string = self.get_source_pipeline_string(i, video_source)
+        print(f"Source {i} pipeline:\n", pipeline_string)
+        source_bin = Gst.parse_bin_from_description(pipeline_string, False)
+        source_bin.set_name(f"source_bin_{i}")
+        return source_bin
+
+    def create_pipeline(self):
+        # Initialize GStreamer
+        Gst.init(None)
+
+        # One bin per source instead of a single parse_launch graph
+        self.pipeline = Gst.Pipeline.new("multi_source_pipeline")
+        self.source_bins = {}
+        for i, video_source in enumerate(self.video_sources):
+            source_bin = self.create_source_bin(i, video_source)
+            self.pipeline.add(source_bin)
+            self.source_bins[i] = source_bin
+
+        # Create a GLib Main Loop
+        self.loop = GLib.MainLoop()
 
 
 
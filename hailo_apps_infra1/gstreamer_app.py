@@ -95,6 +95,7 @@ class GStreamerApp:
 
         self.sync = "false" if (self.options_menu.disable_sync or self.source_type != "file") else "true"
         self.show_fps = self.options_menu.show_fps
+        self.headless = getattr(self.options_menu, 'headless', False)
 
         if self.options_menu.dump_dot:
             os.environ["GST_DEBUG_DUMP_DOT_DIR"] = os.getcwd()
@@ -115,7 +116,7 @@ class GStreamerApp:
             sys.exit(1)
 
         # Connect to hailo_display fps-measurements
-        if self.show_fps:
+        if self.show_fps and not self.headless:
             print("Showing FPS")
             self.pipeline.get_by_name("hailo_display").connect("fps-measurements", self.on_fps_measurement)
 
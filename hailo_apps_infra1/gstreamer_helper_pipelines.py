@@ -305,6 +305,25 @@ def DISPLAY_PIPELINE(video_sink='autovideosink', sync='true', show_fps='false',
 
     return display_pipeline
 
+def HEADLESS_SINK_PIPELINE(name='hailo_display'):
+    """
+    Creates a GStreamer pipeline string that terminates a branch without rendering it.
+    Unlike DISPLAY_PIPELINE, no hailooverlay or videoconvert is run, so frames are only
+    consumed by the user callback probe upstream of this sink.
+
+    Args:
+        name (str, optional): The name of the sink element. Defaults to 'hailo_display'.
+
+    Returns:
+        str: A string representing the GStreamer pipeline for a headless sink.
+    """
+    headless_pipeline = (
+        f'{QUEUE(name=f"{name}_q", leaky="downstream")} ! '
+        f'fakesink name={name} sync=false async=false enable-last-sample=false '
+    )
+
+    return headless_pipeline
+
 def FILE_SINK_PIPELINE(output_file='output.mkv', name='file_sink', bitrate=5000):
     """
     Creates a GStreamer pipeline string for saving the video to a file in .mkv format.
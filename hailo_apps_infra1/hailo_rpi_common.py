@@ -108,6 +108,10 @@ def get_default_parser():
         help="Disables the user's custom callback function in the pipeline. Use this option to run the pipeline without invoking the callback logic."
     )
     parser.add_argument("--dump-dot", action="store_true", help="Dump the pipeline graph to a dot file pipeline.dot")
+    parser.add_argument(
+        "--headless", action="store_true",
+        help="Terminate each source branch in a fakesink instead of the display sink. Skips overlay and color conversion."
+    )
     return parser
 
 
@@ -0,0 +1,263 @@
+"""
+Per-stage latency tracing for the detection pipeline.
+Pad probes on the named elements of each source branch timestamp a sampled
+subset of frames (matched by PTS) and record the time spent between
+consecutive checkpoints into fixed-bucket histograms per camera.
+"""
+
+import threading
+import time
+from bisect import bisect_left
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from gi.repository import Gst
+from logging_config import get_logger
+from config import (
+    LATENCY_TRACING,
+    LATENCY_SAMPLE_EVERY,
+    LATENCY_BUCKETS_MS,
+    LATENCY_MAX_IN_FLIGHT,
+)
+
+logger = get_logger(__name__)
+
+# Checkpoints in the order a frame reaches them, with the stage each one closes.
+# A stage is measured from the previous checkpoint present in the branch, so a
+# missing element (e.g. no decoder for raw sources) merges into the next stage.
+CHECKPOINTS = (
+    ("decode_in", None),
+    ("decoded", "decode"),
+    ("converted", "scale_convert"),
+    ("hailonet_in", "crop"),
+    ("hailonet_out", "hailonet"),
+    ("hailofilter_out", "hailofilter"),
+    ("tracker_out", "tracker"),
+    ("callback_in", "callback_queue"),
+    ("callback_out", "callback"),
+)
+TOTAL_STAGE = "total"
+RECENT_MAX_AGE = 5.0  # seconds before the recent total is considered stale
+
+
+class LatencyHistogram:
+    __slots__ = ("bounds", "counts", "count", "sum_ms", "max_ms")
+
+    def __init__(self, bounds=LATENCY_BUCKETS_MS):
+        self.bounds = tuple(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)  # last bucket is +Inf
+        self.count = 0
+        self.sum_ms = 0.0
+        self.max_ms = 0.0
+
+    def observe(self, value_ms: float):
+        self.counts[bisect_left(self.bounds, value_ms)] += 1
+        self.count += 1
+        self.sum_ms += value_ms
+        if value_ms > self.max_ms:
+            self.max_ms = value_ms
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Upper bound of the bucket holding the q-quantile (max for the overflow bucket)."""
+        if not self.count:
+            return None
+        rank = q * self.count
+        cumulative = 0
+        for i, bucket_count in enumerate(self.counts):
+            cumulative += bucket_count
+            if cumulative >= rank:
+                return float(self.bounds[i]) if i < len(self.bounds) else round(self.max_ms, 2)
+        return round(self.max_ms, 2)
+
+    def to_dict(self) -> Dict[str, Any]:
+        buckets = []
+        cumulative = 0
+        for i, bucket_count in enumerate(self.counts):
+            cumulative += bucket_count
+            buckets.append({"le": self.bounds[i] if i < len(self.bounds) else "+Inf", "count": cumulative})
+        return {
+            "count": self.count,
+            "sum_ms": round(self.sum_ms, 2),
+            "mean_ms": round(self.sum_ms / self.count, 2) if self.count else None,
+            "max_ms": round(self.max_ms, 2),
+            "p50_ms": self.quantile(0.5),
+            "p95_ms": self.quantile(0.95),
+            "p99_ms": self.quantile(0.99),
+            "buckets": buckets,
+        }
+
+
+def _element_pad(source_bin, element_name: str, pad_name: str):
+    element = source_bin.get_by_name(element_name)
+    return element.get_static_pad(pad_name) if element is not None else None
+
+
+def _decoder_sink_pad(source_bin):
+    it = source_bin.iterate_elements()
+    while True:
+        result, element = it.next()
+        if result != Gst.IteratorResult.OK:
+            return None
+        factory = element.get_factory()
+        if factory is not None and "Decoder" in (factory.get_metadata("klass") or ""):
+            return element.get_static_pad("sink")
+
+
+def find_checkpoint_pads(source_bin, index: int) -> List[Tuple[str, Any]]:
+    """Resolve the checkpoint pads of source branch `index` from the names get_source_pipeline_string uses."""
+    identity_name = f"identity_callback_{index}" if index > 0 else "identity_callback"
+    identity_src = _element_pad(source_bin, identity_name, "src")
+    pads = {
+        "decode_in": _decoder_sink_pad(source_bin),
+        "decoded": _element_pad(source_bin, f"src_{index}_scale_q", "sink"),
+        "converted": _element_pad(source_bin, f"src_{index}_convert", "src"),
+        "hailonet_in": _element_pad(source_bin, f"infer_{index}_hailonet", "sink"),
+        "hailonet_out": _element_pad(source_bin, f"infer_{index}_hailonet", "src"),
+        "hailofilter_out": _element_pad(source_bin, f"infer_{index}_hailofilter", "src"),
+        "tracker_out": _element_pad(source_bin, f"tracker_{index}", "src"),
+        "callback_in": _element_pad(source_bin, identity_name, "sink"),
+        # Peer sink pad: its probe runs after the user callback probe on identity's src pad
+        "callback_out": identity_src.get_peer() if identity_src is not None else None,
+    }
+    return [(name, pads[name]) for name, _ in CHECKPOINTS if pads[name] is not None]
+
+
+class CameraLatency:
+    def __init__(self):
+        self.histograms: Dict[str, LatencyHistogram] = {}
+        self.recent_total_ms: Optional[float] = None
+        self.recent_at = 0.0
+
+    def observe(self, stage: str, value_ms: float):
+        histogram = self.histograms.get(stage)
+        if histogram is None:
+            histogram = self.histograms[stage] = LatencyHistogram()
+        histogram.observe(value_ms)
+
+
+class _BinTracer:
+    """Probes of one source bin. Only every Nth frame is timed; the rest return at the first check."""
+
+    def __init__(self, camera: CameraLatency, lock: threading.Lock, sample_every: int):
+        self.camera = camera
+        self.lock = lock
+        self.sample_every = max(1, sample_every)
+        self.frames = 0
+        self.in_flight: "OrderedDict[int, Dict[str, int]]" = OrderedDict()
+        self.stages: Dict[str, Tuple[str, str]] = {}  # checkpoint -> (stage, previous checkpoint)
+        self.first = None
+        self.last = None
+
+    def attach(self, checkpoint_pads: List[Tuple[str, Any]]):
+        stage_names = dict(CHECKPOINTS)
+        previous = None
+        for name, pad in checkpoint_pads:
+            if previous is not None:
+                self.stages[name] = (stage_names[name], previous)
+            pad.add_probe(Gst.PadProbeType.BUFFER, self._on_buffer, name)
+            previous = name
+        self.first = checkpoint_pads[0][0]
+        self.last = previous
+
+    def _on_buffer(self, pad, info, checkpoint):
+        buffer = info.get_buffer()
+        if buffer is None or buffer.pts == Gst.CLOCK_TIME_NONE:
+            return Gst.PadProbeReturn.OK
+        now = time.monotonic_ns()
+        pts = buffer.pts
+
+        if checkpoint == self.first:
+            self.frames += 1
+            if self.frames % self.sample_every:
+                return Gst.PadProbeReturn.OK
+            with self.lock:
+                self.in_flight[pts] = {checkpoint: now}
+                while len(self.in_flight) > LATENCY_MAX_IN_FLIGHT:
+                    self.in_flight.popitem(last=False)
+            return Gst.PadProbeReturn.OK
+
+        entry = self.in_flight.get(pts)
+        if entry is None or checkpoint in entry:
+            return Gst.PadProbeReturn.OK
+        with self.lock:
+            entry[checkpoint] = now
+            stage, previous = self.stages[checkpoint]
+            started = entry.get(previous)
+            if started is not None:
+                self.camera.observe(stage, (now - started) / 1e6)
+            if checkpoint == self.last:
+                self.in_flight.pop(pts, None)
+                total_ms = (now - entry[self.first]) / 1e6
+                self.camera.observe(TOTAL_STAGE, total_ms)
+                recent = self.camera.recent_total_ms
+                self.camera.recent_total_ms = total_ms if recent is None else 0.8 * recent + 0.2 * total_ms
+                self.camera.recent_at = time.time()
+        return Gst.PadProbeReturn.OK
+
+
+class LatencyTracer:
+    def __init__(self, enabled: bool = LATENCY_TRACING, sample_every: int = LATENCY_SAMPLE_EVERY):
+        self.enabled = enabled
+        self.sample_every = sample_every
+        self.lock = threading.Lock()
+        self.cameras: Dict[str, CameraLatency] = {}
+        self._bins: Dict[int, _BinTracer] = {}
+
+    def attach(self, slot):
+        """Add the checkpoint probes to a freshly created source bin (before it starts playing)."""
+        if not self.enabled or slot.source_bin is None:
+            return
+        checkpoint_pads = find_checkpoint_pads(slot.source_bin, slot.index)
+        if len(checkpoint_pads) < 2:
+            logger.warning(f"Latency tracing disabled for {slot.camera_id}: checkpoint elements not found")
+            return
+        with self.lock:
+            camera = self.cameras.setdefault(slot.camera_id, CameraLatency())
+        tracer = _BinTracer(camera, self.lock, self.sample_every)
+        tracer.attach(checkpoint_pads)
+        self._bins[slot.index] = tracer
+        logger.info(f"Latency tracing on {slot.camera_id}: {', '.join(name for name, _ in checkpoint_pads)}")
+
+    def detach(self, slot):
+        self._bins.pop(slot.index, None)
+
+    def forget(self, camera_id: str):
+        with self.lock:
+            self.cameras.pop(camera_id, None)
+
+    def reset(self, camera_id: Optional[str] = None):
+        with self.lock:
+            for cam_id, camera in self.cameras.items():
+                if camera_id is None or cam_id == camera_id:
+                    camera.histograms.clear()
+                    camera.recent_total_ms = None
+
+    def get_recent_latency_ms(self, camera_id: str) -> Optional[float]:
+        """Smoothed end-to-end latency of recent sampled frames, or None when stale."""
+        camera = self.cameras.get(camera_id)
+        if camera is None or camera.recent_total_ms is None or time.time() - camera.recent_at > RECENT_MAX_AGE:
+            return None
+        return camera.recent_total_ms
+
+    def get_histograms(self) -> Dict[str, Any]:
+        with self.lock:
+            cameras = {
+                camera_id: {stage: histogram.to_dict() for stage, histogram in camera.histograms.items()}
+                for camera_id, camera in self.cameras.items()
+            }
+        return {
+            "enabled": self.enabled,
+            "sample_every": self.sample_every,
+            "bucket_bounds_ms": list(LATENCY_BUCKETS_MS),
+            "cameras": cameras,
+        }
+
+    def get_summary(self) -> Dict[str, Any]:
+        """p50/p95 of the end-to-end stage per camera, for the health endpoint."""
+        summary = {}
+        with self.lock:
+            for camera_id, camera in self.cameras.items():
+                total = camera.histograms.get(TOTAL_STAGE)
+                if total is not None:
+                    summary[camera_id] = {"p50_ms": total.quantile(0.5), "p95_ms": total.quantile(0.95)}
+        return summary
@@ -1,7 +1,8 @@
 """
 Independent Multi-Camera Line Visitor Counter
 - Counts people crossing virtual lines in multiple camera feeds.
-- Saves data to its own separate file to ensure isolation.
+- Saves data to its own separate file to ensure isolation, written behind
+  the counting path instead of once per frame.
 - Fully thread-safe with a threading.Lock for stability.
 """
 
@@ -11,6 +12,7 @@ import threading
 from typing import Dict, Set, List, Tuple, Any, Optional
 from hailo_apps_infra1.hailo_rpi_common import app_callback_class
 from config import LINE_HISTORY_FILE # Note: We will add this to config.py
+from persistence import WriteBehindWriter
 
 class LineVisitorCounter(app_callback_class):
     def __init__(self):
@@ -38,6 +40,9 @@ class LineVisitorCounter(app_callback_class):
         
         self.active_camera = list(self.data.keys())[0] if self.data else "camera1"
 
+        self.writer = WriteBehindWriter(LINE_HISTORY_FILE, self._serialize_data)
+        self.writer.start()
+
     def _init_camera(self, camera_id: str) -> None:
         """Initialize all tracking structures for a camera."""
         self.person_last_position[camera_id] = {}
@@ -65,13 +70,25 @@ class LineVisitorCounter(app_callback_class):
             }
             return {"camera1": {"lines": center_line_config}}
 
-    def save_data(self) -> None:
-        """Persist line configurations and counts."""
-        try:
-            with open(LINE_HISTORY_FILE, "w") as f:
-                json.dump(self.data, f, indent=4)
-        except Exception as e:
-            print(f"[ERROR] Failed to save line data: {e}")
+    def _serialize_data(self) -> bytes:
+        with self.lock:
+            return json.dumps(self.data, separators=(",", ":")).encode("utf-8")
+
+    def save_data(self, events: int = 1) -> None:
+        """Mark line configurations and counts dirty; the writer persists them in the background."""
+        self.writer.mark_dirty(events)
+
+    def flush(self) -> None:
+        """Write pending changes now."""
+        self.writer.flush()
+
+    def close(self) -> None:
+        """Stop the background writer after a final flush."""
+        self.writer.stop()
+        print(f"[INFO] Line data persistence stats: {self.writer.get_stats()}")
+
+    def get_persistence_stats(self) -> Dict[str, Any]:
+        return self.writer.get_stats()
 
     def update_counts(self, camera_id: str, detected_people: Set[Tuple]) -> None:
         """Main update method for processing detections and updating line counts."""
@@ -83,6 +100,7 @@ class LineVisitorCounter(app_callback_class):
                 
                 active_ids = {p[0] for p in detected_people if len(p) >= 1}
                 current_time = datetime.datetime.now()
+                crossings = 0
                 
                 cam_last_positions = self.person_last_position[camera_id]
                 for line_name, line_data in self.data[camera_id].get("lines", {}).items():
@@ -112,6 +130,7 @@ class LineVisitorCounter(app_callback_class):
                                     line_data["out_count"] += 1
                                     line_data["history"].append({"id": person_id, "action": "Crossed Out", "time": timestamp_str})
                                 cooldown_tracker[person_id] = current_time + datetime.timedelta(seconds=self.line_crossing_cooldown)
+                                crossings += 1
 
                 for person_data in detected_people:
                     if len(person_data) < 1: continue
@@ -122,7 +141,11 @@ class LineVisitorCounter(app_callback_class):
                     stale_cooldowns = [pid for pid, end_time in cooldown_tracker.items() if current_time >= end_time]
                     for pid in stale_cooldowns: del cooldown_tracker[pid]
                 
-                self.save_data()
+                # Only crossings change persisted state; positions and cooldowns are in-memory
+                if crossings:
+                    self.save_data(crossings)
+                else:
+                    self.writer.note_unchanged()
             except Exception as e:
                 print(f"[ERROR] Failed to update line counts for {camera_id}: {e}")
                 
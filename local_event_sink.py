@@ -0,0 +1,362 @@
+"""
+Local SQLite event sink with the database writer's interface.
+Zone and line events are queued and inserted in batches (one executemany per
+table per transaction) into a WAL-mode database on the device, so nothing is
+lost while the uplink is down. A forwarder thread sends rows the remote
+database has not seen yet to the remote writer in large batches whenever it
+is reachable, and tracks its position with a per-table cursor.
+
+Rows carry their original event time. When the remote writer has a
+synchronous insert_many(table, rows) that returns True once the remote
+transaction has committed, the cursor moves only then, so a failed insert or a
+crash mid-batch resends the batch instead of losing it. Writers without it get
+one write_zone_event/write_line_crossing call per row with a timestamp
+argument; if they do not accept one either, forwarding is disabled (and
+logged) rather than retried every interval or stamped with the forward time.
+"""
+
+import datetime
+import queue
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from logging_config import get_logger
+from config import (
+    LOCAL_SINK_PATH,
+    LOCAL_SINK_FORWARD_BATCH,
+    LOCAL_SINK_FORWARD_INTERVAL,
+    LOCAL_SINK_RETENTION_DAYS,
+)
+
+logger = get_logger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS zone_events (
+    id INTEGER PRIMARY KEY,
+    ts REAL NOT NULL,
+    pi_id TEXT NOT NULL,
+    camera_id TEXT NOT NULL,
+    zone_name TEXT NOT NULL,
+    person_id INTEGER NOT NULL,  -- tracker ids as given; non-numeric ids are stored as text
+    action TEXT NOT NULL,
+    x REAL,
+    y REAL,
+    dwell_time REAL
+);
+CREATE INDEX IF NOT EXISTS zone_events_camera_ts ON zone_events (camera_id, ts);
+CREATE TABLE IF NOT EXISTS line_crossings (
+    id INTEGER PRIMARY KEY,
+    ts REAL NOT NULL,
+    pi_id TEXT NOT NULL,
+    camera_id TEXT NOT NULL,
+    line_name TEXT NOT NULL,
+    person_id INTEGER NOT NULL,
+    direction TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS line_crossings_camera_ts ON line_crossings (camera_id, ts);
+CREATE TABLE IF NOT EXISTS forward_cursor (
+    table_name TEXT PRIMARY KEY,
+    last_id INTEGER NOT NULL
+);
+"""
+
+INSERT_SQL = {
+    "zone_events": "INSERT INTO zone_events (ts, pi_id, camera_id, zone_name, person_id, action, x, y, dwell_time) "
+                   "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+    "line_crossings": "INSERT INTO line_crossings (ts, pi_id, camera_id, line_name, person_id, direction) "
+                      "VALUES (?, ?, ?, ?, ?, ?)",
+}
+
+
+def connect(path: str) -> sqlite3.Connection:
+    conn = sqlite3.connect(path, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.executescript(SCHEMA)
+    return conn
+
+
+class LocalEventSink:
+    def __init__(self, path: str = LOCAL_SINK_PATH, batch_size: int = 50, batch_interval: float = 2.0,
+                 forward_batch: int = LOCAL_SINK_FORWARD_BATCH,
+                 forward_interval: float = LOCAL_SINK_FORWARD_INTERVAL,
+                 retention_days: float = LOCAL_SINK_RETENTION_DAYS):
+        self.path = path
+        self.batch_size = batch_size
+        self.batch_interval = batch_interval
+        self.forward_batch = forward_batch
+        self.forward_interval = forward_interval
+        self.retention_days = retention_days
+
+        self.queue: "queue.Queue[Tuple[str, tuple]]" = queue.Queue()
+        self.stop_event = threading.Event()
+        self.writer_thread: Optional[threading.Thread] = None
+        self.forwarder_thread: Optional[threading.Thread] = None
+        self.db_lock = threading.Lock()
+        self.stats_lock = threading.Lock()
+        self.conn = connect(path)
+        self.remote = None
+        self.remote_started = False
+        self.forwarding_disabled: Optional[str] = None
+
+        self.stats = {
+            "queued": 0,
+            "inserted": 0,
+            "batches": 0,
+            "insert_seconds": 0.0,
+            "forwarded": 0,
+            "forward_batches": 0,
+            "forward_errors": 0,
+            "insert_errors": 0,
+        }
+
+    # --- database writer interface -----------------------------------------------
+
+    def start(self):
+        if self.writer_thread and self.writer_thread.is_alive():
+            return
+        self.stop_event.clear()
+        self.writer_thread = threading.Thread(target=self._write_loop, daemon=True)
+        self.writer_thread.start()
+        self.forwarder_thread = threading.Thread(target=self._forward_loop, daemon=True)
+        self.forwarder_thread.start()
+        logger.info(f"Local event sink started at {self.path}")
+
+    def stop(self):
+        self.stop_event.set()
+        for thread in (self.writer_thread, self.forwarder_thread):
+            if thread and thread.is_alive():
+                thread.join(timeout=10)
+        self._insert_batch(self._drain())
+        if self.remote_started:
+            try:
+                self.remote.stop()
+            except Exception as e:
+                logger.error(f"Error stopping remote database writer: {e}")
+        with self.db_lock:
+            self.conn.close()
+
+    def write_zone_event(self, camera_id: str, zone_name: str, person_id: int, action: str,
+                         x: Optional[float] = None, y: Optional[float] = None,
+                         pi_id: str = "pi-default", dwell_time: Optional[float] = None):
+        self.queue.put(("zone_events", (time.time(), pi_id, camera_id, zone_name, person_id, action,
+                                        x, y, dwell_time)))
+        with self.stats_lock:
+            self.stats["queued"] += 1
+
+    def write_line_crossing(self, camera_id: str, line_name: str, person_id: int, direction: str,
+                            pi_id: str = "pi-default"):
+        self.queue.put(("line_crossings", (time.time(), pi_id, camera_id, line_name, person_id, direction)))
+        with self.stats_lock:
+            self.stats["queued"] += 1
+
+    # --- local inserts -----------------------------------------------------------
+
+    def _drain(self, limit: Optional[int] = None) -> List[Tuple[str, tuple]]:
+        items = []
+        while limit is None or len(items) < limit:
+            try:
+                items.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+        return items
+
+    def _write_loop(self):
+        while not self.stop_event.is_set():
+            try:
+                first = self.queue.get(timeout=self.batch_interval)
+            except queue.Empty:
+                continue
+            # Give the batch up to batch_interval to fill before inserting it
+            deadline = time.monotonic() + self.batch_interval
+            batch = [first]
+            while len(batch) < self.batch_size and not self.stop_event.is_set():
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self.queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self._insert_batch(batch)
+
+    def _insert_batch(self, batch: List[Tuple[str, tuple]]):
+        if not batch:
+            return
+        rows: Dict[str, List[tuple]] = {}
+        for table, row in batch:
+            rows.setdefault(table, []).append(row)
+        started = time.perf_counter()
+        try:
+            with self.db_lock, self.conn:
+                for table, table_rows in rows.items():
+                    self.conn.executemany(INSERT_SQL[table], table_rows)
+        except Exception as e:
+            with self.stats_lock:
+                self.stats["insert_errors"] += 1
+            logger.error(f"Failed to insert {len(batch)} events into the local sink: {e}")
+            return
+        with self.stats_lock:
+            self.stats["inserted"] += len(batch)
+            self.stats["batches"] += 1
+            self.stats["insert_seconds"] += time.perf_counter() - started
+
+    # --- store and forward -------------------------------------------------------
+
+    def _remote_writer(self):
+        """The remote writer, created on first use once the database is reachable."""
+        from database_config import is_db_connected
+        if not is_db_connected():
+            return None
+        if self.remote is None:
+            from database_writer import get_database_writer
+            remote = get_database_writer(batch_size=self.forward_batch, batch_interval=self.forward_interval)
+            if not hasattr(remote, "insert_many"):
+                # Per-row writes go through the writer's own queue thread
+                remote.start()
+                self.remote_started = True
+            self.remote = remote
+            logger.info("Remote database reachable; forwarding buffered events")
+        return self.remote
+
+    def _forward_loop(self):
+        while not self.stop_event.wait(self.forward_interval):
+            if self.forwarding_disabled:
+                return
+            try:
+                remote = self._remote_writer()
+                if remote is None:
+                    continue
+                while not self.stop_event.is_set() and self._forward_batch(remote):
+                    pass
+                self._prune()
+            except Exception as e:
+                with self.stats_lock:
+                    self.stats["forward_errors"] += 1
+                logger.error(f"Error forwarding events to the remote database: {e}")
+
+    def _cursor(self, table: str) -> int:
+        row = self.conn.execute("SELECT last_id FROM forward_cursor WHERE table_name = ?", (table,)).fetchone()
+        return row[0] if row else 0
+
+    def _forward_batch(self, remote) -> bool:
+        """Forward up to forward_batch rows per table; True if a full batch was sent (more may be pending)."""
+        full = False
+        for table in INSERT_SQL:
+            with self.db_lock:
+                last_id = self._cursor(table)
+                rows = self.conn.execute(f"SELECT * FROM {table} WHERE id > ? ORDER BY id LIMIT ?",
+                                         (last_id, self.forward_batch)).fetchall()
+            if not rows:
+                continue
+            try:
+                committed = self._send_rows(remote, table, rows)
+            except TypeError as e:
+                # The remote writer cannot take event timestamps; retrying would fail the same way
+                self.forwarding_disabled = f"remote writer does not accept timestamped rows: {e}"
+                logger.error(f"Forwarding disabled, events stay in {self.path}: {self.forwarding_disabled}")
+                return False
+            if not committed:
+                with self.stats_lock:
+                    self.stats["forward_errors"] += 1
+                logger.warning(f"Remote insert of {len(rows)} {table} rows failed; will retry")
+                return False
+            with self.db_lock, self.conn:
+                self.conn.execute("INSERT OR REPLACE INTO forward_cursor (table_name, last_id) VALUES (?, ?)",
+                                  (table, rows[-1][0]))
+            with self.stats_lock:
+                self.stats["forwarded"] += len(rows)
+                self.stats["forward_batches"] += 1
+            full = full or len(rows) == self.forward_batch
+        return full
+
+    @staticmethod
+    def _send_rows(remote, table: str, rows: List[tuple]) -> bool:
+        """Send rows with their event time; True once the remote writer has taken them."""
+        if hasattr(remote, "insert_many"):
+            return bool(remote.insert_many(table, [_remote_row(table, row) for row in rows]))
+        write = remote.write_zone_event if table == "zone_events" else remote.write_line_crossing
+        for row in rows:
+            write(**_remote_row(table, row))
+        return True
+
+    def _prune(self):
+        """Delete forwarded rows older than the retention window."""
+        cutoff = time.time() - self.retention_days * 86400
+        with self.db_lock, self.conn:
+            for table in INSERT_SQL:
+                self.conn.execute(f"DELETE FROM {table} WHERE id <= ? AND ts < ?", (self._cursor(table), cutoff))
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self.db_lock:
+            pending = sum(
+                self.conn.execute(f"SELECT COUNT(*) FROM {table} WHERE id > ?", (self._cursor(table),)).fetchone()[0]
+                for table in INSERT_SQL
+            )
+        with self.stats_lock:
+            stats = dict(self.stats)
+        stats["pending_forward"] = pending
+        stats["queue_depth"] = self.queue.qsize()
+        stats["remote_connected"] = self.remote is not None
+        stats["forwarding_disabled"] = self.forwarding_disabled
+        if stats["insert_seconds"]:
+            stats["inserts_per_second"] = round(stats["inserted"] / stats["insert_seconds"])
+        stats["insert_seconds"] = round(stats["insert_seconds"], 4)
+        return stats
+
+
+def _remote_row(table: str, row: tuple) -> Dict[str, Any]:
+    """A local row as keyword fields for the remote insert, stamped with the time the event happened."""
+    if table == "zone_events":
+        _, ts, pi_id, camera_id, zone_name, person_id, action, x, y, dwell_time = row
+        return {"timestamp": datetime.datetime.fromtimestamp(ts), "pi_id": pi_id, "camera_id": camera_id,
+                "zone_name": zone_name, "person_id": person_id, "action": action, "x": x, "y": y,
+                "dwell_time": dwell_time}
+    _, ts, pi_id, camera_id, line_name, person_id, direction = row
+    return {"timestamp": datetime.datetime.fromtimestamp(ts), "pi_id": pi_id, "camera_id": camera_id,
+            "line_name": line_name, "person_id": person_id, "direction": direction}
+
+
+_event_sink: Optional[LocalEventSink] = None
+_event_sink_lock = threading.Lock()
+
+
+def get_event_sink(batch_size: int = 50, batch_interval: float = 2.0) -> LocalEventSink:
+    global _event_sink
+    with _event_sink_lock:
+        if _event_sink is None:
+            _event_sink = LocalEventSink(batch_size=batch_size, batch_interval=batch_interval)
+        return _event_sink
+
+
+def benchmark(count: int = 20000, batch_size: int = 50):
+    """Compare one commit per event with batched executemany inserts."""
+    import os
+    import tempfile
+
+    row = (time.time(), "pi-bench", "camera1", "zone1", 1, "Entered", 10.0, 20.0, None)
+    with tempfile.TemporaryDirectory() as directory:
+        conn = connect(os.path.join(directory, "single.db"))
+        started = time.perf_counter()
+        for _ in range(count):
+            with conn:
+                conn.execute(INSERT_SQL["zone_events"], row)
+        single = time.perf_counter() - started
+        conn.close()
+
+        conn = connect(os.path.join(directory, "batched.db"))
+        started = time.perf_counter()
+        for _ in range(0, count, batch_size):
+            with conn:
+                conn.executemany(INSERT_SQL["zone_events"], [row] * batch_size)
+        batched = time.perf_counter() - started
+        conn.close()
+
+    print(f"{count} events, one transaction each: {count / single:,.0f} events/s")
+    print(f"{count} events, batches of {batch_size}:  {count / batched:,.0f} events/s ({single / batched:.1f}x)")
+
+
+if __name__ == "__main__":
+    benchmark()
@@ -3,7 +3,6 @@ import logging
 import sys
 import os
 import signal
-import threading
 import time
 import json
 from dotenv import load_dotenv
@@ -18,14 +17,21 @@ gi.require_version('Gst', '1.0')
 from gi.repository import Gst, GLib
 Gst.init(None)
  
-from config import DEBUG_MODE, load_zone_line_config
+from config import DEBUG_MODE, EVENT_PUBLISH_MODE, CAMERA_STATUS_INTERVAL, load_zone_line_config, flush_config_stores
 from zone_counter import MultiSourceZoneVisitorCounter
+from checkpoint import CheckpointManager
 from gstreamer_pipeline import PipelineManager
-from video_stream import VideoStreamManager
-from command_listener import MqttCommandListener
+from video_stream import VideoStreamManager, MqttCommandListener
  
 from database_config import is_db_connected
-from database_writer import get_database_writer
+from local_event_sink import get_event_sink
+from count_publisher import CountPublisher
+from event_publisher import EventPublisher
+from mqtt_spool import MqttSpool
+from bandwidth_governor import BandwidthGovernor
+from telemetry_scheduler import TelemetryScheduler
+from snapshot_streamer import SnapshotStreamer
+from series_codec import SeriesRecorder
 from pi_status_monitor import get_status_monitor
  
 components = {}
@@ -64,113 +70,37 @@ def create_mqtt_client():
         logger.error(f"Failed to connect to MQTT Broker: {e}")
         return None
  
-def run_counts_pusher(user_data, mqtt_client, stop_event, interval=2.0):
-    logger_pusher = logging.getLogger(f"{__name__}.counts_pusher")
-    pi_id = os.getenv("PI_UNIQUE_ID", "pi-default")
- 
-    logger_pusher.info("Counts pusher thread started.")
- 
-    while not stop_event.is_set():
-        try:
-            with user_data.lock:
-                all_data = user_data.data
-            for camera_id, camera_data in all_data.items():
-                counts_payload = {}
-                for zone_name, zone_data in camera_data.get("zones", {}).items():
-                    counts_payload[zone_name] = {"in": zone_data.get("in_count", 0), "out": zone_data.get("out_count", 0)}
-                for line_name, line_data in camera_data.get("lines", {}).items():
-                    counts_payload[line_name] = {"in": line_data.get("in_count", 0), "out": line_data.get("out_count", 0)}
-                if counts_payload:
-                    topic = f"vision/{pi_id}/{camera_id}/counts/update"
-                    mqtt_client.publish(topic, json.dumps(counts_payload), qos=1)
-                    logger_pusher.debug(f"Published counts for {camera_id}")
-        except Exception as e:
-            logger_pusher.error(f"Error in counts pusher thread: {e}")
-        time.sleep(interval)
-    logger_pusher.info("Counts pusher thread has stopped.")
- 
-def run_zone_data_pusher(user_data, mqtt_client, stop_event, interval=5.0):
-    logger_pusher = logging.getLogger(f"{__name__}.zone_data_pusher")
-    pi_id = os.getenv("PI_UNIQUE_ID", "pi-default")
-    logger_pusher.info("Zone data pusher thread started.")
-    while not stop_event.is_set():
-        try:
-            with user_data.lock:
-                all_data = user_data.data
-            for camera_id, camera_data in all_data.items():
-                zone_payload = camera_data.get("zones", {})
-                if zone_payload:
-                    topic = f"vision/{pi_id}/{camera_id}/zones/full_data"
-                    mqtt_client.publish(topic, json.dumps(zone_payload), qos=1)
-                    logger_pusher.debug(f"Published zone data for {camera_id}")
-        except Exception as e:
-            logger_pusher.error(f"Error in zone data pusher thread: {e}")
-        time.sleep(interval)
-    logger_pusher.info("Zone data pusher thread has stopped.")
- 
- 
-def run_line_data_pusher(user_data, mqtt_client, stop_event, interval=5.0):
-    logger_pusher = logging.getLogger(f"{__name__}.line_data_pusher")
-    pi_id = os.getenv("PI_UNIQUE_ID", "pi-default")
-    logger_pusher.info("Line data pusher thread started.")
-    while not stop_event.is_set():
-        try:
-            with user_data.lock:
-                all_data = user_data.data
-            for camera_id, camera_data in all_data.items():
-                line_payload = camera_data.get("lines", {})
-                if line_payload:
-                    topic = f"vision/{pi_id}/{camera_id}/lines/full_data"
-                    mqtt_client.publish(topic, json.dumps(line_payload), qos=1)
-                    logger_pusher.debug(f"Published line data for {camera_id}")
-        except Exception as e:
-            logger_pusher.error(f"Error in line data pusher thread: {e}")
-        time.sleep(interval)
-    logger_pusher.info("Line data pusher thread has stopped.")
- 
-def run_camera_status_pusher(pipeline_manager, mqtt_client, pi_id, stop_event, interval=5.0):
-    logger_pusher = logging.getLogger(f"{__name__}.camera_status_pusher")
-    logger_pusher.info("Camera status pusher thread started.")
-   
+def publish_camera_status(pipeline_manager, mqtt_client, pi_id):
+    """Telemetry job: publish the retained list of active cameras."""
     camera_list_topic = f"vision/{pi_id}/cameras/active_list"
    
-    while not stop_event.is_set():
-        try:
-            if pipeline_manager.is_running() and hasattr(pipeline_manager, 'video_sources'):
-                if hasattr(pipeline_manager, 'camera_names') and pipeline_manager.camera_names:
-                    expected_cameras = pipeline_manager.camera_names
-                else:
-                    expected_cameras = [f"camera{i+1}" for i in range(len(pipeline_manager.video_sources))]
-               
-                camera_info = {
-                    "active_cameras": expected_cameras,
-                    "active_camera_for_ui": expected_cameras[0] if expected_cameras else None,
-                    "total": len(expected_cameras),
-                    "timestamp": time.time(),
-                    "status": "active"
-                }
-               
-                logger_pusher.debug(f"Publishing {len(expected_cameras)} active cameras")
-            else:
-                camera_info = {
-                    "active_cameras": [],
-                    "active_camera_for_ui": None,
-                    "total": 0,
-                    "timestamp": time.time(),
-                    "status": "pipeline_stopped"
-                }
-               
-                logger_pusher.debug("Publishing empty camera list (pipeline stopped)")
-           
-           
-            mqtt_client.publish(camera_list_topic, json.dumps(camera_info), qos=1, retain=True)
-           
-        except Exception as e:
-            logger_pusher.error(f"Error in camera status pusher: {e}")
+    if pipeline_manager.is_running() and hasattr(pipeline_manager, 'video_sources'):
+        if hasattr(pipeline_manager, 'camera_names') and pipeline_manager.camera_names:
+            expected_cameras = pipeline_manager.camera_names
+        else:
+            expected_cameras = [f"camera{i+1}" for i in range(len(pipeline_manager.video_sources))]
+       
+        camera_info = {
+            "active_cameras": expected_cameras,
+            "active_camera_for_ui": expected_cameras[0] if expected_cameras else None,
+            "total": len(expected_cameras),
+            "timestamp": time.time(),
+            "status": "active"
+        }
+       
+        logger.debug(f"Publishing {len(expected_cameras)} active cameras")
+    else:
+        camera_info = {
+            "active_cameras": [],
+            "active_camera_for_ui": None,
+            "total": 0,
+            "timestamp": time.time(),
+            "status": "pipeline_stopped"
+        }
        
-        time.sleep(interval)
+        logger.debug("Publishing empty camera list (pipeline stopped)")
    
-    logger_pusher.info("Camera status pusher thread has stopped.")
+    mqtt_client.publish(camera_list_topic, json.dumps(camera_info), qos=1, retain=True)
  
  
 def main():
@@ -191,34 +121,47 @@ def main():
         pi_id = os.getenv("PI_UNIQUE_ID", "pi-default")
        
         logger.info("Initializing core components...")
-        user_data = MultiSourceZoneVisitorCounter(mqtt_client=mqtt_client, pi_id=pi_id)
+        # Event and count messages go through the spool so broker outages do not lose them
+        mqtt_spool = MqttSpool(mqtt_client)
+        mqtt_spool.start()
+        components['mqtt_spool'] = mqtt_spool
+        # All publishers share the uplink budget; the governor paces them by traffic class
+        uplink = BandwidthGovernor(mqtt_spool)
+        uplink.start()
+        components['uplink'] = uplink
+ 
+        user_data = MultiSourceZoneVisitorCounter(mqtt_client=uplink, pi_id=pi_id)
        
+        # Events always go to the local sink; it forwards them once the database is reachable
+        try:
+            db_writer = get_event_sink(batch_size=50, batch_interval=2.0)
+            db_writer.start()
+            user_data.db_enabled = True
+            components['db_writer'] = db_writer
+            logger.info("Local event sink started and enabled in user data.")
+        except Exception as e:
+            logger.error(f"Failed to start local event sink: {e}")
+            user_data.db_enabled = False
+ 
         logger.info("Checking database connection...")
         if is_db_connected():
             try:
-                db_writer = get_database_writer(batch_size=50, batch_interval=2.0)
-                db_writer.start()
-                user_data.db_enabled = True
-                components['db_writer'] = db_writer
-                logger.info("Database writer started and enabled in user data.")
- 
                 status_monitor = get_status_monitor(pi_id, heartbeat_interval=30.0)
                 status_monitor.start()
                 components['status_monitor'] = status_monitor
                 logger.info("PiStatusMonitor started.")
             except Exception as e:
-                logger.error(f"Failed to start database writer: {e}")
-                logger.warning("Continuing without database writer.")
-                user_data.db_enabled = False
+                logger.error(f"Failed to start PiStatusMonitor: {e}")
         else:
-            logger.warning("Database not connected. Continuing without database writer.")
-            user_data.db_enabled = False
+            logger.warning("Database not connected. Buffering events locally until it is reachable.")
  
         frame_buffers = {}
        
         pipeline_manager = PipelineManager(user_data, frame_buffers)
         video_stream_manager = VideoStreamManager(frame_buffers, user_data, mqtt_client=mqtt_client, pi_id=pi_id)
-        mqtt_listener = MqttCommandListener(pipeline_manager, user_data, video_stream_manager, mqtt_client=mqtt_client, pi_id=pi_id)
+        snapshot_streamer = SnapshotStreamer(frame_buffers, uplink, pi_id)
+        mqtt_listener = MqttCommandListener(pipeline_manager, user_data, video_stream_manager, mqtt_client=mqtt_client, pi_id=pi_id,
+                                            snapshot_streamer=snapshot_streamer, publisher=uplink)
        
         health_monitor = HealthMonitor(user_data, pipeline_manager, port=8080)
         health_monitor.start()
@@ -228,6 +171,12 @@ def main():
         load_zone_line_config(user_data)
         logger.info("Loaded zone/line configuration from disk")
  
+        checkpointer = CheckpointManager(user_data)
+        checkpointer.restore()
+        user_data.checkpointer = checkpointer
+        checkpointer.start()
+        components['checkpointer'] = checkpointer
+ 
         components.update({
             'user_data': user_data,
             'pipeline_manager': pipeline_manager,
@@ -238,29 +187,33 @@ def main():
        
         logger.info("Starting MQTT pusher threads...")
  
-        video_stream_manager.start_snapshot_pusher(interval=0.5)
-       
-        counts_pusher_stop_event = threading.Event()
-        counts_pusher_thread = threading.Thread(
-            target=run_counts_pusher,
-            args=(user_data, mqtt_client, counts_pusher_stop_event),
-            daemon=True
-        )
-        counts_pusher_thread.start()
-       
-        components['counts_pusher_stop_event'] = counts_pusher_stop_event
+        # Counts, event batches and camera status all run on one telemetry thread
+        scheduler = TelemetryScheduler(user_data)
+        components['telemetry_scheduler'] = scheduler
  
-       
-       
-        camera_status_pusher_stop_event = threading.Event()
-        camera_status_pusher_thread = threading.Thread(
-            target=run_camera_status_pusher,
-            args=(pipeline_manager, mqtt_client, pi_id, camera_status_pusher_stop_event, 5.0),
-            daemon=True
-        )
-        camera_status_pusher_thread.start()
-        components['camera_status_pusher_stop_event'] = camera_status_pusher_stop_event
-        logger.info("Started camera status pusher thread (5s interval)")
+        count_publisher = CountPublisher(user_data, uplink, pi_id, scheduler)
+        count_publisher.start()
+        components['count_publisher'] = count_publisher
+ 
+        if EVENT_PUBLISH_MODE == "batch":
+            event_publisher = EventPublisher(uplink, pi_id)
+            event_publisher.start(scheduler)
+            user_data.event_publisher = event_publisher
+            components['event_publisher'] = event_publisher
+ 
+        series_recorder = SeriesRecorder(uplink, pi_id)
+        series_recorder.start(scheduler)
+        components['series_recorder'] = series_recorder
+ 
+        # Snapshots are only encoded and sent while a client holds a watch_camera lease
+        snapshot_streamer.start(scheduler)
+        components['snapshot_streamer'] = snapshot_streamer
+ 
+        scheduler.add_job("camera_status",
+                          lambda context: publish_camera_status(pipeline_manager, uplink, pi_id),
+                          interval=CAMERA_STATUS_INTERVAL, priority=20)
+        scheduler.start()
+        logger.info(f"Started telemetry scheduler (camera status every {CAMERA_STATUS_INTERVAL}s)")
  
  
         logger.info("Core components initialized and running. Starting GStreamer MainLoop...")
@@ -281,14 +234,36 @@ def main():
         if 'health_monitor' in components:
             components['health_monitor'].stop()
  
-        for key in ['counts_pusher_stop_event']:
-            if key in components:
-                components[key].set()
-                logger.info(f"Stopped {key.replace('_stop_event', '')}")
+        # No new events once the pipeline is down; everything below flushes what was counted
+        if 'pipeline_manager' in components:
+            components['pipeline_manager'].stop_pipeline()
+            logger.info("Stopped GStreamer pipeline")
+ 
+        if 'checkpointer' in components:
+            try:
+                components['checkpointer'].stop()
+                logger.info("Wrote final counter checkpoint.")
+            except Exception as e:
+                logger.error(f"Error writing final checkpoint: {e}")
+ 
+        if 'telemetry_scheduler' in components:
+            components['telemetry_scheduler'].stop()
+            logger.info(f"Stopped telemetry scheduler: {components['telemetry_scheduler'].get_stats()}")
+ 
+        if 'event_publisher' in components:
+            components['event_publisher'].stop()
+            logger.info(f"Stopped event publisher: {components['event_publisher'].get_stats()}")
+ 
+        if 'count_publisher' in components:
+            components['count_publisher'].stop()
+            logger.info(f"Stopped count publisher: {components['count_publisher'].get_stats()}")
+ 
+        if 'series_recorder' in components:
+            components['series_recorder'].stop()
+            logger.info(f"Flushed count series: {components['series_recorder'].get_stats()}")
  
-        if 'video_stream_manager' in components:
-            components['video_stream_manager'].stop_snapshot_pusher()
-            logger.info("Stopped snapshot pusher")
+        if 'snapshot_streamer' in components:
+            logger.info(f"Snapshot streamer stats: {components['snapshot_streamer'].get_stats()}")
  
         if 'db_writer' in components:
             try:
@@ -307,9 +282,30 @@ def main():
             except Exception as e:
                 logger.error(f"Error stopping PiStatusMonitor: {e}")
  
-        if 'pipeline_manager' in components:
-            components['pipeline_manager'].stop_pipeline()
-            logger.info("Stopped GStreamer pipeline")
+        if 'user_data' in components:
+            try:
+                components['user_data'].rollups.close()
+                logger.info("Spilled in-memory rollups to disk.")
+            except Exception as e:
+                logger.error(f"Error closing rollups: {e}")
+            try:
+                components['user_data'].event_writer.close()
+            except Exception as e:
+                logger.error(f"Error closing the event log and archive: {e}")
+ 
+        if 'uplink' in components:
+            try:
+                components['uplink'].stop()
+                logger.info(f"Uplink usage: {components['uplink'].get_stats()}")
+            except Exception as e:
+                logger.error(f"Error stopping bandwidth governor: {e}")
+ 
+        if 'mqtt_spool' in components:
+            try:
+                logger.info(f"MQTT spool stats: {components['mqtt_spool'].get_stats()}")
+                components['mqtt_spool'].stop()
+            except Exception as e:
+                logger.error(f"Error stopping MQTT spool: {e}")
  
         if 'mqtt_client' in components:
             mqtt_client = components['mqtt_client']
@@ -317,9 +313,11 @@ def main():
             mqtt_client.disconnect()
             logger.info("MQTT client disconnected.")
  
-        if 'camera_status_pusher_stop_event' in components:
-            components['camera_status_pusher_stop_event'].set()
-            logger.info("Stopped camera_status_pusher")
+        try:
+            flush_config_stores()
+            logger.info("Flushed pending configuration changes.")
+        except Exception as e:
+            logger.error(f"Error flushing configuration: {e}")
  
         if main_loop.is_running():
             main_loop.quit()
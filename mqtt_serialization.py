@@ -0,0 +1,176 @@
+"""
+Serialization helpers for the MQTT hot paths.
+- TopicCache builds each vision/{pi_id}/{camera_id}/... topic string once.
+- dumps() returns compact JSON bytes, using orjson when it is installed and
+  the standard library otherwise.
+- encode_history_event() and encode_counts() are schema-specific encoders for
+  the per-event and counts messages. For every shape (or set of shapes) the
+  constant part of the JSON is pre-serialized once into a bytes template, and
+  only the changing numbers and strings are filled in.
+
+The output is compact JSON with the same content as json.dumps of the
+equivalent dict. Entries that do not match the schema fall back to dumps().
+
+python mqtt_serialization.py benchmarks the three hottest payload types.
+"""
+
+import json
+import time
+from typing import Any, Dict, Tuple
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+FRAGMENT_CACHE_SIZE = 10000
+
+
+def _dumps_std(obj: Any) -> bytes:
+    return json.dumps(obj, separators=(",", ":")).encode("utf-8")
+
+
+def _dumps_orjson(obj: Any) -> bytes:
+    return orjson.dumps(obj)
+
+
+dumps = _dumps_orjson if orjson is not None else _dumps_std
+JSON_BACKEND = "orjson" if orjson is not None else "json"
+
+_strings: Dict[str, bytes] = {}
+_history_templates: Dict[Tuple[str, str], bytes] = {}
+_counts_templates: Dict[Tuple[str, ...], bytes] = {}
+HISTORY_KEYS = ("id", "action", "time", "seq")
+
+
+def _string(value: str) -> bytes:
+    """JSON string literal of value; cached, since actions and timestamps repeat constantly."""
+    fragment = _strings.get(value)
+    if fragment is None:
+        if len(_strings) >= FRAGMENT_CACHE_SIZE:
+            _strings.clear()
+        fragment = _strings[value] = json.dumps(value).encode("utf-8")
+    return fragment
+
+
+def _escape(value: str) -> bytes:
+    """value as a JSON string literal, safe to use inside a %-template."""
+    return json.dumps(value).encode("utf-8").replace(b"%", b"%%")
+
+
+class TopicCache:
+    def __init__(self, pi_id: str):
+        self.pi_id = pi_id
+        self._topics: Dict[Tuple[str, ...], str] = {}
+
+    def get(self, camera_id: str, *parts: str) -> str:
+        """vision/{pi_id}/{camera_id}/{parts...}"""
+        key = (camera_id,) + parts
+        topic = self._topics.get(key)
+        if topic is None:
+            topic = self._topics[key] = "/".join(("vision", self.pi_id, camera_id) + parts)
+        return topic
+
+
+def encode_history_event(kind: str, name: str, entry: Dict[str, Any]) -> bytes:
+    """{"zone"|"line": name, "id", "action", "time", "seq"} as published per event."""
+    track_id, seq = entry.get("id"), entry.get("seq")
+    if tuple(entry) != HISTORY_KEYS or type(track_id) is not int or type(seq) is not int:
+        return dumps({kind: name, **entry})
+    template = _history_templates.get((kind, name))
+    if template is None:
+        template = _history_templates[(kind, name)] = (
+            b"{" + _escape(kind) + b":" + _escape(name) + b',"id":%d,"action":%s,"time":%s,"seq":%d}')
+    return template % (track_id, _string(entry["action"]), _string(entry["time"]), seq)
+
+
+def encode_counts(camera_state: Dict[str, Any]) -> bytes:
+    """{name: {"in", "out"}} for every zone and line of one camera's state digest."""
+    names = []
+    values = []
+    for section in ("zones", "lines"):
+        for name, item in camera_state.get(section, {}).items():
+            names.append(name)
+            values.append(int(item["in"]))
+            values.append(int(item["out"]))
+    key = tuple(names)
+    template = _counts_templates.get(key)
+    if template is None:
+        if len(_counts_templates) >= FRAGMENT_CACHE_SIZE:
+            _counts_templates.clear()
+        template = _counts_templates[key] = (
+            b"{" + b",".join(_escape(name) + b':{"in":%d,"out":%d}' for name in names) + b"}")
+    return template % tuple(values)
+
+
+def benchmark(count: int = 50000):
+    """Per-event history message, counts update and event batch envelope: json.dumps vs these encoders."""
+    from event_publisher import encode_json, ACTIONS
+
+    topics = TopicCache("pi-bench")
+    stamp = time.strftime("%Y-%m-%d %H:%M:%S")
+    entries = [{"id": 1000 + i, "action": ACTIONS[i % 2], "time": stamp, "seq": i + 1} for i in range(count)]
+    state = {"zones": {f"zone{i}": {"in": 1200 + i, "out": 1100 + i, "seq": 2300} for i in range(4)},
+             "lines": {f"line{i}": {"in": 800 + i, "out": 750 + i, "seq": 1550} for i in range(2)}}
+
+    def timed(label, fn, n):
+        started = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - started
+        print(f"{label:<44} {elapsed / n * 1e6:7.2f} us/message")
+
+    pi_id, camera_id, zone = "pi-bench", "camera1", "entrance"
+
+    def history_baseline():
+        for entry in entries:
+            _ = f"vision/{pi_id}/{camera_id}/history/zone/entry"
+            json.dumps({"zone": zone, **entry})
+
+    def history_encoder():
+        for entry in entries:
+            topics.get(camera_id, "history", "zone", "entry")
+            encode_history_event("zone", zone, entry)
+
+    def counts_baseline():
+        for _ in range(count):
+            _ = f"vision/{pi_id}/{camera_id}/counts/update"
+            payload = {}
+            for section in ("zones", "lines"):
+                for name, item in state[section].items():
+                    payload[name] = {"in": item["in"], "out": item["out"]}
+            json.dumps(payload)
+
+    def counts_encoder():
+        for _ in range(count):
+            topics.get(camera_id, "counts", "update")
+            encode_counts(state)
+
+    batches = [[(time.time() + j * 0.05, "zone", "entrance", entries[i + j]) for j in range(100)]
+               for i in range(0, min(count, 20000) - 100, 100)]
+
+    def batch_encoder():
+        for batch in batches:
+            encode_json("camera1", batch)
+
+    def batch_baseline():
+        for batch in batches:
+            _dumps_std({"v": 1, "camera": "camera1", "t0": batch[0][0],
+                        "events": [[int((ts - batch[0][0]) * 1000), 0, entry["id"], 0, entry["seq"]]
+                                   for ts, _, _, entry in batch]})
+
+    print(f"JSON backend: {JSON_BACKEND}")
+    timed("history event  f-string + json.dumps", history_baseline, count)
+    timed("history event  cached topic + template", history_encoder, count)
+    timed("counts update  dict rebuild + json.dumps", counts_baseline, count)
+    timed("counts update  cached topic + template", counts_encoder, count)
+    timed("event batch x100  json.dumps", batch_baseline, len(batches))
+    timed(f"event batch x100  encode_json ({JSON_BACKEND})", batch_encoder, len(batches))
+
+    assert json.loads(encode_history_event("zone", "entrance", entries[0])) == {"zone": "entrance", **entries[0]}
+    assert json.loads(encode_counts(state)) == {name: {"in": item["in"], "out": item["out"]}
+                                                for section in ("zones", "lines")
+                                                for name, item in state[section].items()}
+
+
+if __name__ == "__main__":
+    benchmark()
@@ -0,0 +1,195 @@
+"""
+Disk-backed store-and-forward spool for outbound MQTT messages.
+MqttSpool wraps the MQTT client with the same publish() call. While the broker
+is reachable and nothing is spooled, messages go straight out. While it is
+down, or while a backlog is still draining, messages are appended to a
+segmented on-disk log, so order is kept and memory stays flat. After a
+reconnect a background thread drains the backlog at MQTT_SPOOL_DRAIN_RATE
+messages per second. The spool is bounded by MQTT_SPOOL_MAX_BYTES; beyond
+that the oldest segments are dropped.
+
+Each record is stored under its spool sequence number (used as the log
+timestamp). A persisted cursor records how far the backlog has been sent, so
+after a crash at most the last unpersisted drain batch is sent again.
+"""
+
+import base64
+import os
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from logging_config import get_logger
+from event_log import SegmentedLog
+from persistence import atomic_write
+from config import (
+    MQTT_SPOOL_DIR,
+    MQTT_SPOOL_MAX_BYTES,
+    MQTT_SPOOL_SEGMENT_BYTES,
+    MQTT_SPOOL_DRAIN_RATE,
+)
+
+logger = get_logger(__name__)
+
+CURSOR_FILE = "cursor"
+MQTT_ERR_SUCCESS = 0
+
+
+class MqttSpool:
+    def __init__(self, client, directory: str = MQTT_SPOOL_DIR, max_bytes: int = MQTT_SPOOL_MAX_BYTES,
+                 segment_bytes: int = MQTT_SPOOL_SEGMENT_BYTES, drain_rate: float = MQTT_SPOOL_DRAIN_RATE):
+        self.client = client
+        self.directory = directory
+        self.drain_rate = drain_rate
+        self.log = SegmentedLog(directory, segment_max_bytes=segment_bytes,
+                                max_total_bytes=max_bytes, fsync_interval=1.0)
+        self.cursor_path = os.path.join(directory, CURSOR_FILE)
+
+        self.lock = threading.Lock()
+        self.drained_seq = self._load_cursor()
+        self.next_seq = int(self.log.get_stats()["last_ts"] or self.drained_seq) + 1
+        self.stop_event = threading.Event()
+        self.wake_event = threading.Event()
+        self.thread: Optional[threading.Thread] = None
+        self.stats = {"direct": 0, "spooled": 0, "drained": 0, "dropped": 0, "errors": 0}
+
+        if self.backlog():
+            logger.info(f"MQTT spool has {self.backlog()} messages from a previous run")
+
+    # --- cursor ------------------------------------------------------------------
+
+    def _load_cursor(self) -> int:
+        try:
+            with open(self.cursor_path, "r") as f:
+                return int(f.read().strip() or 0)
+        except FileNotFoundError:
+            return 0
+        except Exception as e:
+            logger.error(f"Failed to read MQTT spool cursor: {e}")
+            return 0
+
+    def _save_cursor(self):
+        atomic_write(self.cursor_path, str(self.drained_seq).encode("ascii"))
+
+    # --- publishing --------------------------------------------------------------
+
+    def is_connected(self) -> bool:
+        try:
+            return bool(self.client.is_connected())
+        except Exception:
+            return False
+
+    def backlog(self) -> int:
+        return self.next_seq - 1 - self.drained_seq
+
+    def publish(self, topic: str, payload: Any = None, qos: int = 0, retain: bool = False):
+        """Publish now if possible, otherwise spool. Same call signature as paho's publish."""
+        with self.lock:
+            if not self.backlog() and self.is_connected():
+                try:
+                    info = self.client.publish(topic, payload, qos=qos, retain=retain)
+                    if getattr(info, "rc", MQTT_ERR_SUCCESS) == MQTT_ERR_SUCCESS:
+                        self.stats["direct"] += 1
+                        return info
+                except Exception as e:
+                    logger.warning(f"Direct publish to {topic} failed, spooling: {e}")
+            self._append(topic, payload, qos, retain)
+        self.wake_event.set()
+        return None
+
+    def _append(self, topic: str, payload: Any, qos: int, retain: bool):
+        record = {"t": topic, "q": qos, "r": retain, "w": time.time()}
+        if isinstance(payload, (bytes, bytearray)):
+            record["b"] = base64.b64encode(payload).decode("ascii")
+        else:
+            record["p"] = payload
+        try:
+            self.log.append(record, ts=float(self.next_seq))
+            self.next_seq += 1
+            self.stats["spooled"] += 1
+        except Exception as e:
+            self.stats["errors"] += 1
+            logger.error(f"Failed to spool MQTT message for {topic}: {e}")
+
+    # --- draining ----------------------------------------------------------------
+
+    def start(self):
+        if self.thread and self.thread.is_alive():
+            return
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        self.wake_event.set()
+        if self.thread and self.thread.is_alive():
+            self.thread.join(timeout=5)
+        with self.lock:
+            self._save_cursor()
+        self.log.close()
+
+    def _run(self):
+        while not self.stop_event.is_set():
+            self.wake_event.wait(1.0)
+            self.wake_event.clear()
+            if not self.backlog() or not self.is_connected():
+                continue
+            try:
+                self._drain()
+            except Exception as e:
+                self.stats["errors"] += 1
+                logger.error(f"Error draining MQTT spool: {e}")
+                self.stop_event.wait(1.0)
+
+    def _drain(self):
+        """Send the backlog in order, at most drain_rate messages per second."""
+        logger.info(f"Draining {self.backlog()} spooled MQTT messages")
+        batch = max(1, int(self.drain_rate))
+        while not self.stop_event.is_set() and self.backlog() and self.is_connected():
+            started = time.monotonic()
+            sent = 0
+            readable = False
+            for seq, record in self.log.read(self.drained_seq + 1):
+                readable = True
+                seq = int(seq)
+                if seq > self.drained_seq + 1:
+                    # Records up to seq - 1 were dropped by the size bound
+                    self.stats["dropped"] += seq - self.drained_seq - 1
+                payload = base64.b64decode(record["b"]) if "b" in record else record.get("p")
+                info = self.client.publish(record["t"], payload, qos=record.get("q", 0), retain=record.get("r", False))
+                if getattr(info, "rc", MQTT_ERR_SUCCESS) != MQTT_ERR_SUCCESS:
+                    logger.warning(f"Publishing spooled message failed (rc={info.rc}); retrying later")
+                    break
+                self.drained_seq = seq
+                self.stats["drained"] += 1
+                sent += 1
+                if sent >= batch:
+                    break
+            with self.lock:
+                self._save_cursor()
+                if not readable and self.backlog():
+                    # Everything left was dropped by the size bound
+                    self.stats["dropped"] += self.backlog()
+                    self.drained_seq = self.next_seq - 1
+                    self._save_cursor()
+            self.log.truncate_before(self.drained_seq + 1)
+            if not sent:
+                break
+            self.stop_event.wait(max(0.0, 1.0 - (time.monotonic() - started)))
+        if not self.backlog():
+            logger.info("MQTT spool drained")
+
+    def get_stats(self) -> Dict[str, Any]:
+        oldest_age = None
+        if self.backlog():
+            for _, record in self.log.read(self.drained_seq + 1):
+                oldest_age = round(time.time() - record.get("w", time.time()), 1)
+                break
+        return {
+            **self.stats,
+            "backlog_messages": self.backlog(),
+            "backlog_bytes": self.log.get_stats()["total_bytes"],
+            "oldest_age_seconds": oldest_age,
+            "connected": self.is_connected(),
+        }
@@ -0,0 +1,145 @@
+"""
+Write-behind persistence for counter state.
+Callers mark their state dirty on every change; a background thread writes a
+snapshot when the flush interval elapses or enough changes have accumulated,
+atomically via a temp file and rename, and once more on shutdown.
+"""
+
+import atexit
+import os
+import tempfile
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+from logging_config import get_logger
+from config import PERSIST_FLUSH_INTERVAL, PERSIST_FLUSH_EVENTS
+
+logger = get_logger(__name__)
+
+
+def atomic_write(path: str, payload: bytes) -> None:
+    """Write payload to path so readers see either the old or the new file, never a partial one."""
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(prefix=f".{os.path.basename(path)}.", suffix=".tmp", dir=directory)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(payload)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+class WriteBehindWriter:
+    def __init__(self, path: str, serialize: Callable[[], bytes],
+                 flush_interval: float = PERSIST_FLUSH_INTERVAL,
+                 flush_events: int = PERSIST_FLUSH_EVENTS):
+        """
+        serialize() must return the bytes to persist; it is called from the writer
+        thread and is responsible for taking the owner's lock while snapshotting.
+        """
+        self.path = path
+        self.serialize = serialize
+        self.flush_interval = flush_interval
+        self.flush_events = flush_events
+
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+        self.dirty = False
+        self.pending_events = 0
+        self.wake_event = threading.Event()
+        self.stop_event = threading.Event()
+        self.thread: Optional[threading.Thread] = None
+
+        # Metrics. Every mark_dirty() and note_unchanged() used to be a full rewrite of
+        # the file, so the old figure is estimated as their count x the last snapshot size.
+        self.started_at = time.time()
+        self.bytes_written = 0
+        self.flushes = 0
+        self.marks = 0
+        self.unchanged = 0
+        self.last_size = 0
+        self.last_flush_at: Optional[float] = None
+        self.errors = 0
+
+    def start(self):
+        if self.thread and self.thread.is_alive():
+            return
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+        atexit.register(self.stop)
+
+    def stop(self):
+        """Stop the writer thread and flush whatever is still dirty."""
+        if self.stop_event.is_set():
+            return
+        self.stop_event.set()
+        self.wake_event.set()
+        if self.thread and self.thread.is_alive() and self.thread is not threading.current_thread():
+            self.thread.join(timeout=5)
+        self.flush()
+
+    def mark_dirty(self, events: int = 1):
+        with self.lock:
+            self.dirty = True
+            self.pending_events += events
+            self.marks += events
+            flush_now = self.pending_events >= self.flush_events
+        if flush_now:
+            self.wake_event.set()
+
+    def note_unchanged(self):
+        """Record an update that changed nothing persistent (formerly still a full save)."""
+        self.unchanged += 1
+
+    def _run(self):
+        while not self.stop_event.is_set():
+            self.wake_event.wait(self.flush_interval)
+            self.wake_event.clear()
+            if self.stop_event.is_set():
+                break
+            self.flush()
+
+    def flush(self) -> bool:
+        with self.flush_lock:
+            with self.lock:
+                if not self.dirty:
+                    return False
+                self.dirty = False
+                self.pending_events = 0
+            try:
+                payload = self.serialize()
+                atomic_write(self.path, payload)
+            except Exception as e:
+                logger.error(f"Failed to persist {self.path}: {e}")
+                self.errors += 1
+                with self.lock:
+                    self.dirty = True
+                return False
+            self.bytes_written += len(payload)
+            self.last_size = len(payload)
+            self.flushes += 1
+            self.last_flush_at = time.time()
+            return True
+
+    def get_stats(self) -> Dict[str, Any]:
+        hours = max((time.time() - self.started_at) / 3600.0, 1e-9)
+        return {
+            "path": self.path,
+            "flushes": self.flushes,
+            "changes": self.marks,
+            "unchanged_updates": self.unchanged,
+            "bytes_written": self.bytes_written,
+            "bytes_per_hour": round(self.bytes_written / hours),
+            "estimated_save_per_update_bytes_per_hour": round((self.marks + self.unchanged) * self.last_size / hours),
+            "last_flush_at": self.last_flush_at,
+            "dirty": self.dirty,
+            "errors": self.errors,
+        }
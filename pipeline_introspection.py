@@ -0,0 +1,195 @@
+"""
+Live introspection of the queues in the generated pipelines.
+Samples the fill level of every queue per source bin and, in adaptive mode,
+makes the queues feeding inference leak their oldest frames while a camera
+is over its latency budget.
+"""
+
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from gi.repository import Gst
+from logging_config import get_logger
+from config import (
+    QUEUE_SAMPLE_INTERVAL,
+    QUEUE_ADAPTIVE_MODE,
+    QUEUE_LATENCY_BUDGET_MS,
+    QUEUE_LATENCY_BUDGETS_MS,
+    QUEUE_ADAPTIVE_RECOVERY_RATIO,
+    QUEUE_ADAPTIVE_RECOVERY_SAMPLES,
+)
+
+logger = get_logger(__name__)
+
+LEAKY_NAMES = {0: "no", 1: "upstream", 2: "downstream"}
+LEAKY_NO = 0
+LEAKY_DOWNSTREAM = 2  # drops the oldest buffers in the queue
+
+
+def is_inference_feed_queue(queue_name: str) -> bool:
+    return queue_name.endswith("_hailonet_q") or (
+        queue_name.startswith("inference_wrapper_") and queue_name.endswith("_input_q"))
+
+
+def iterate_queues(source_bin):
+    it = source_bin.iterate_recurse()
+    while True:
+        result, element = it.next()
+        if result != Gst.IteratorResult.OK:
+            break
+        factory = element.get_factory()
+        if factory is not None and factory.get_name() == "queue":
+            yield element
+
+
+class QueueMonitor:
+    def __init__(self, pipeline_manager, interval: float = QUEUE_SAMPLE_INTERVAL,
+                 adaptive: bool = QUEUE_ADAPTIVE_MODE):
+        self.pipeline_manager = pipeline_manager
+        self.interval = interval
+        self.adaptive = adaptive
+        self.default_budget_ms = QUEUE_LATENCY_BUDGET_MS
+        self.budgets_ms: Dict[str, float] = dict(QUEUE_LATENCY_BUDGETS_MS)
+
+        self.lock = threading.Lock()
+        self.snapshot: Dict[str, Any] = {}
+        self.peaks: Dict[str, Dict[str, int]] = {}
+        self._leaking: Dict[int, bool] = {}
+        self._below_budget_samples: Dict[int, int] = {}
+        self._latency_sources = []
+
+        self.stop_event = threading.Event()
+        self.thread: Optional[threading.Thread] = None
+
+    def start(self):
+        if self.thread and self.thread.is_alive():
+            return
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+        logger.info(f"Queue monitor started (interval={self.interval}s, adaptive={self.adaptive})")
+
+    def stop(self):
+        self.stop_event.set()
+        with self.lock:
+            self.snapshot = {}
+            self._leaking.clear()
+            self._below_budget_samples.clear()
+
+    def set_adaptive(self, enabled: bool, budget_ms: Optional[float] = None, camera_id: Optional[str] = None):
+        self.adaptive = enabled
+        if budget_ms is not None:
+            if camera_id:
+                self.budgets_ms[camera_id] = float(budget_ms)
+            else:
+                self.default_budget_ms = float(budget_ms)
+        logger.info(f"Adaptive queues {'enabled' if enabled else 'disabled'} (budget={budget_ms}, camera={camera_id})")
+
+    def get_budget_ms(self, camera_id: str) -> float:
+        return self.budgets_ms.get(camera_id, self.default_budget_ms)
+
+    def add_latency_source(self, latency_source):
+        """Register a callable(camera_id) -> latency in ms used instead of the queued-time estimate."""
+        self._latency_sources.append(latency_source)
+
+    def _run(self):
+        while not self.stop_event.wait(self.interval):
+            try:
+                self.sample()
+            except Exception as e:
+                logger.error(f"Error sampling queue levels: {e}")
+
+    def sample(self) -> Dict[str, Any]:
+        snapshot = {}
+        peaks = {}
+        for slot in list(self.pipeline_manager.sources.values()):
+            source_bin = slot.source_bin
+            if source_bin is None:
+                continue
+            queues = {}
+            queued_ns = 0
+            for queue in iterate_queues(source_bin):
+                name = queue.get_name()
+                level_buffers = queue.get_property("current-level-buffers")
+                level_time = queue.get_property("current-level-time")
+                queued_ns += level_time
+                peak = peaks[name] = self.peaks.get(name, {"buffers": 0, "time_ns": 0})
+                peak["buffers"] = max(peak["buffers"], level_buffers)
+                peak["time_ns"] = max(peak["time_ns"], level_time)
+                queues[name] = {
+                    "current_level_buffers": level_buffers,
+                    "current_level_time_ms": round(level_time / 1e6, 2),
+                    "current_level_bytes": queue.get_property("current-level-bytes"),
+                    "max_size_buffers": queue.get_property("max-size-buffers"),
+                    "leaky": LEAKY_NAMES.get(int(queue.get_property("leaky")), "unknown"),
+                    "peak_level_buffers": peak["buffers"],
+                    "peak_level_time_ms": round(peak["time_ns"] / 1e6, 2),
+                }
+
+            camera_id = slot.camera_id
+            latency_ms = self._measured_latency_ms(camera_id)
+            if latency_ms is None:
+                latency_ms = queued_ns / 1e6
+            if self.adaptive:
+                self._adapt(slot, latency_ms)
+
+            snapshot[camera_id] = {
+                "latency_ms": round(latency_ms, 2),
+                "queued_latency_ms": round(queued_ns / 1e6, 2),
+                "budget_ms": self.get_budget_ms(camera_id),
+                "inference_queues_leaky": self._leaking.get(slot.index, False),
+                "queues": queues,
+            }
+
+        self.peaks = peaks
+        with self.lock:
+            self.snapshot = snapshot
+        return snapshot
+
+    def _measured_latency_ms(self, camera_id: str) -> Optional[float]:
+        for latency_source in self._latency_sources:
+            try:
+                latency_ms = latency_source(camera_id)
+            except Exception:
+                latency_ms = None
+            if latency_ms is not None:
+                return latency_ms
+        return None
+
+    def _adapt(self, slot, latency_ms: float):
+        # Keyed by bin index: a rebuilt bin starts with non-leaky queues again
+        camera_id, key = slot.camera_id, slot.index
+        budget_ms = self.get_budget_ms(camera_id)
+        leaking = self._leaking.get(key, False)
+
+        if not leaking and latency_ms > budget_ms:
+            self._set_inference_leaky(slot.source_bin, LEAKY_DOWNSTREAM)
+            self._leaking[key] = True
+            self._below_budget_samples[key] = 0
+            logger.warning(f"{camera_id}: latency {latency_ms:.0f}ms over budget {budget_ms:.0f}ms, "
+                           f"inference queues now drop oldest frames")
+        elif leaking:
+            if latency_ms < budget_ms * QUEUE_ADAPTIVE_RECOVERY_RATIO:
+                self._below_budget_samples[key] = self._below_budget_samples.get(key, 0) + 1
+            else:
+                self._below_budget_samples[key] = 0
+            if self._below_budget_samples[key] >= QUEUE_ADAPTIVE_RECOVERY_SAMPLES:
+                self._set_inference_leaky(slot.source_bin, LEAKY_NO)
+                self._leaking[key] = False
+                logger.info(f"{camera_id}: latency {latency_ms:.0f}ms back within budget, inference queues no longer leaky")
+
+    def _set_inference_leaky(self, source_bin, leaky: int):
+        for queue in iterate_queues(source_bin):
+            if is_inference_feed_queue(queue.get_name()):
+                queue.set_property("leaky", leaky)
+
+    def get_snapshot(self) -> Dict[str, Any]:
+        with self.lock:
+            cameras = self.snapshot
+        return {
+            "timestamp": time.time(),
+            "adaptive": self.adaptive,
+            "default_budget_ms": self.default_budget_ms,
+            "cameras": cameras,
+        }
@@ -0,0 +1,249 @@
+"""
+Time-bucketed rollups of zone and line activity.
+Every counted event and occupancy change updates one bucket per granularity
+(1 min, 15 min, 1 h, 1 day) for its camera/zone/line. Recent buckets stay in
+memory; older ones are spilled, in start order, to a segmented log per
+granularity so range queries seek instead of scanning. Updates run under the
+counter lock on the frame path, so they only evict aged buckets; a spill
+thread appends them to disk.
+"""
+
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from logging_config import get_logger
+from event_log import SegmentedLog
+from config import ROLLUP_DIR, ROLLUP_MEMORY_BUCKETS, ROLLUP_MAX_QUERY_BUCKETS
+
+logger = get_logger(__name__)
+
+GRANULARITIES = {"1m": 60, "15m": 900, "1h": 3600, "1d": 86400}
+
+# Bucket fields, kept as a list for cheap in-place updates
+IN, OUT, PEAK, LAST = range(4)
+
+Key = Tuple[str, str, str]  # camera_id, kind ("zone" | "line"), name
+
+
+def bucket_start(ts: float, size: int) -> int:
+    """Start of the bucket holding ts, aligned to local time so days start at midnight."""
+    offset = time.localtime(ts).tm_gmtoff
+    return int(ts - (ts + offset) % size)
+
+
+class RollupStore:
+    def __init__(self, directory: str = ROLLUP_DIR, memory_buckets: Optional[Dict[str, int]] = None):
+        self.directory = directory
+        self.memory_buckets = dict(ROLLUP_MEMORY_BUCKETS if memory_buckets is None else memory_buckets)
+        self.lock = threading.Lock()
+        self.buckets: Dict[str, Dict[Key, Dict[int, List[int]]]] = {g: {} for g in GRANULARITIES}
+        self.occupancy: Dict[Key, int] = {}
+        self._swept_at: Dict[str, int] = {g: 0 for g in GRANULARITIES}
+        # Evicted buckets not yet on disk: (granularity, start, key, bucket), oldest first per granularity
+        self.pending: List[Tuple[str, int, Key, List[int]]] = []
+        self.spill_lock = threading.Lock()  # one drain at a time, so each log is appended in start order
+        self.spill_wakeup = threading.Event()
+        self._stopped = False
+        self.spilled = 0
+        self.logs: Dict[str, SegmentedLog] = {}
+        for granularity in GRANULARITIES:
+            try:
+                self.logs[granularity] = SegmentedLog(os.path.join(directory, granularity))
+            except Exception as e:
+                logger.error(f"Rollup spill log for {granularity} unavailable, keeping memory only: {e}")
+        self.spill_thread = threading.Thread(target=self._spill_loop, daemon=True)
+        self.spill_thread.start()
+
+    # --- updates (called under the counter lock) -------------------------------------
+
+    def _bucket(self, granularity: str, key: Key, ts: float) -> List[int]:
+        size = GRANULARITIES[granularity]
+        start = bucket_start(ts, size)
+        series = self.buckets[granularity].setdefault(key, {})
+        bucket = series.get(start)
+        if bucket is None:
+            current = self.occupancy.get(key, 0)
+            bucket = series[start] = [0, 0, current, current]
+            if start > self._swept_at[granularity]:
+                self._swept_at[granularity] = start
+                self._evict(granularity, start - self.memory_buckets[granularity] * size)
+        return bucket
+
+    def record_event(self, camera_id: str, kind: str, name: str, direction: str, ts: float) -> None:
+        """Count one entry/exit ("in") or ("out") crossing."""
+        key = (camera_id, kind, name)
+        field = IN if direction == "in" else OUT
+        with self.lock:
+            for granularity in GRANULARITIES:
+                self._bucket(granularity, key, ts)[field] += 1
+
+    def observe_occupancy(self, camera_id: str, zone: str, occupancy: int, ts: float) -> None:
+        """Record a change of the number of people inside a zone."""
+        key = (camera_id, "zone", zone)
+        with self.lock:
+            self.occupancy[key] = occupancy
+            for granularity in GRANULARITIES:
+                bucket = self._bucket(granularity, key, ts)
+                bucket[LAST] = occupancy
+                if occupancy > bucket[PEAK]:
+                    bucket[PEAK] = occupancy
+
+    # --- spilling ---------------------------------------------------------------
+
+    def _evict(self, granularity: str, before: int) -> None:
+        """Queue buckets starting before `before` for spilling, oldest first across all keys. Needs self.lock."""
+        evicted = []
+        for key, series in self.buckets[granularity].items():
+            for start in [s for s in series if s < before]:
+                evicted.append((start, key, series.pop(start)))
+        if not evicted:
+            return
+        evicted.sort(key=lambda item: item[0])
+        self.pending.extend((granularity, start, key, bucket) for start, key, bucket in evicted)
+        self.spill_wakeup.set()
+
+    def _spill_loop(self):
+        while not self._stopped:
+            self.spill_wakeup.wait()
+            self.spill_wakeup.clear()
+            self.flush_spills()
+
+    def flush_spills(self) -> None:
+        """Append evicted buckets to their logs; never called with the counter lock held."""
+        with self.spill_lock:
+            with self.lock:
+                pending, self.pending = self.pending, []
+            for granularity, start, key, bucket in pending:
+                log = self.logs.get(granularity)
+                if log is None:
+                    continue
+                try:
+                    log.append({"c": key[0], "k": key[1], "n": key[2], "b": bucket}, ts=start)
+                    self.spilled += 1
+                except Exception as e:
+                    logger.error(f"Failed to spill {granularity} rollup: {e}")
+
+    def close(self) -> None:
+        """Spill every in-memory bucket so nothing is lost on shutdown."""
+        with self.lock:
+            for granularity in GRANULARITIES:
+                self._evict(granularity, float("inf"))
+        self._stopped = True
+        self.spill_wakeup.set()
+        self.spill_thread.join(timeout=10)
+        self.flush_spills()
+        for log in self.logs.values():
+            log.close()
+
+    # --- checkpoints ----------------------------------------------------------------
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self.lock:
+            buckets = {
+                g: {key: {start: list(bucket) for start, bucket in series.items()} for key, series in keyed.items()}
+                for g, keyed in self.buckets.items()
+            }
+            # Evicted buckets still waiting for the spill thread; restore skips them once they are on disk
+            for granularity, start, key, bucket in self.pending:
+                buckets[granularity].setdefault(key, {})[start] = list(bucket)
+            return {"buckets": buckets, "occupancy": dict(self.occupancy)}
+
+    def restore(self, snapshot: Dict[str, Any]) -> None:
+        """Load in-memory buckets from a checkpoint, dropping any that were spilled after it was taken."""
+        with self.lock:
+            for granularity, keyed in snapshot.get("buckets", {}).items():
+                if granularity not in GRANULARITIES:
+                    continue
+                log = self.logs.get(granularity)
+                spilled_through = log.get_stats()["last_ts"] if log is not None else None
+                for key, series in keyed.items():
+                    for start, bucket in series.items():
+                        if spilled_through is not None and start <= spilled_through:
+                            continue
+                        self.buckets[granularity].setdefault(key, {})[start] = list(bucket)
+            self.occupancy.update(snapshot.get("occupancy", {}))
+
+    # --- queries --------------------------------------------------------------------
+
+    def query(self, camera_id: str, kind: Optional[str] = None, name: Optional[str] = None,
+              granularity: str = "15m", start_ts: Optional[float] = None,
+              end_ts: Optional[float] = None) -> Dict[str, Any]:
+        """
+        Buckets per zone/line of a camera in [start_ts, end_ts], gaps filled with zero counts
+        and the carried-over occupancy. Cost is proportional to the number of buckets returned.
+        """
+        if granularity not in GRANULARITIES:
+            raise ValueError(f"Unknown granularity '{granularity}', expected one of {list(GRANULARITIES)}")
+        size = GRANULARITIES[granularity]
+        end_ts = time.time() if end_ts is None else end_ts
+        if start_ts is None:
+            start_ts = end_ts - self.memory_buckets[granularity] * size
+        first = bucket_start(start_ts, size)
+        last = bucket_start(end_ts, size)
+        if (last - first) // size + 1 > ROLLUP_MAX_QUERY_BUCKETS:
+            raise ValueError(f"Range spans more than {ROLLUP_MAX_QUERY_BUCKETS} {granularity} buckets")
+        # Evicted buckets are in neither memory nor the log until spilled
+        self.flush_spills()
+
+        def wanted(key: Key) -> bool:
+            return key[0] == camera_id and (kind is None or key[1] == kind) and (name is None or key[2] == name)
+
+        merged: Dict[Key, Dict[int, List[int]]] = {}
+        with self.lock:
+            for key, series in self.buckets[granularity].items():
+                if not wanted(key):
+                    continue
+                target = merged.setdefault(key, {})
+                for start, bucket in series.items():
+                    if first <= start <= last:
+                        target[start] = list(bucket)
+
+        # A bucket can be partly on disk and partly in memory (spilled on shutdown, then
+        # continued after the restart); _merge adds the two halves together
+        log = self.logs.get(granularity)
+        spilled_through = log.get_stats()["last_ts"] if log is not None else None
+        if spilled_through is not None and spilled_through >= first:
+            for start, record in log.read(first, last):
+                key = (record["c"], record["k"], record["n"])
+                if not wanted(key):
+                    continue
+                self._merge(merged.setdefault(key, {}), int(start), record["b"])
+
+        result = {}
+        for key, series in merged.items():
+            rows = []
+            carried = None
+            start = first
+            while start <= last:
+                bucket = series.get(start)
+                if bucket is None:
+                    occupancy = carried if carried is not None else 0
+                    bucket = [0, 0, occupancy, occupancy]
+                carried = bucket[LAST]
+                row = {"start": start, "in": bucket[IN], "out": bucket[OUT]}
+                if key[1] == "zone":
+                    row["peak_occupancy"] = bucket[PEAK]
+                rows.append(row)
+                # Re-align each step: local days are 23 or 25 hours long around DST changes
+                start = bucket_start(start + size + size // 2, size)
+            result.setdefault(f"{key[1]}s", {})[key[2]] = rows
+        return {"camera_id": camera_id, "granularity": granularity, "start": first, "end": last, "series": result}
+
+    @staticmethod
+    def _merge(series: Dict[int, List[int]], start: int, bucket: List[int]) -> None:
+        existing = series.get(start)
+        if existing is None:
+            series[start] = list(bucket)
+            return
+        existing[IN] += bucket[IN]
+        existing[OUT] += bucket[OUT]
+        existing[PEAK] = max(existing[PEAK], bucket[PEAK])
+        existing[LAST] = bucket[LAST]
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self.lock:
+            in_memory = {g: sum(len(series) for series in keyed.values()) for g, keyed in self.buckets.items()}
+            pending = len(self.pending)
+        return {"in_memory_buckets": in_memory, "pending_spill": pending, "spilled_buckets": self.spilled}
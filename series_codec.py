@@ -0,0 +1,278 @@
+"""
+Compressed per-interval count series for central dashboards.
+SeriesRecorder samples the cumulative in/out counts of every zone and line once
+per SERIES_INTERVAL (a telemetry job), and after SERIES_BLOCK_POINTS samples
+publishes one block per camera on vision/{pi_id}/{camera_id}/series/block.
+A block is flushed early when the set of shapes changes, so every series in a
+block has a value at every timestamp and decoding is exact.
+
+Block layout (all integers are LEB128 varints, signed ones zig-zag encoded):
+
+    version (1 byte), camera (varint length + utf-8)
+    series count, then per series: kind (0 zone, 1 line) + name
+    point count, first timestamp (unix seconds), then for each later point
+    the zig-zag delta-of-delta of the timestamps (0 for a regular interval)
+    per series, column-wise: first in and out value, then zig-zag deltas
+
+Steady sampling makes the timestamp column almost all zero bytes, and quiet
+shapes make the count columns almost all zero bytes.
+"""
+
+import json
+import sys
+import time
+from typing import Any, Dict, List, Tuple
+
+from logging_config import get_logger
+from config import SERIES_INTERVAL, SERIES_BLOCK_POINTS
+
+logger = get_logger(__name__)
+
+BLOCK_VERSION = 1
+KINDS = ("zone", "line")
+
+SeriesKey = Tuple[str, str]  # kind, name
+Point = Tuple[int, Dict[SeriesKey, Tuple[int, int]]]  # ts, {(kind, name): (in, out)}
+
+
+def zigzag(value: int) -> int:
+    return (value << 1) ^ (value >> 63)
+
+
+def unzigzag(value: int) -> int:
+    return (value >> 1) ^ -(value & 1)
+
+
+def write_varint(out: bytearray, value: int):
+    while value > 0x7F:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def read_varint(data: bytes, offset: int) -> Tuple[int, int]:
+    value = shift = 0
+    while True:
+        byte = data[offset]
+        offset += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, offset
+        shift += 7
+
+
+def _write_str(out: bytearray, value: str):
+    raw = value.encode("utf-8")
+    write_varint(out, len(raw))
+    out += raw
+
+
+def _read_str(data: bytes, offset: int) -> Tuple[str, int]:
+    length, offset = read_varint(data, offset)
+    return data[offset:offset + length].decode("utf-8"), offset + length
+
+
+def encode_block(camera_id: str, points: List[Point]) -> bytes:
+    """Encode samples that all cover the same series (see module docstring)."""
+    keys = sorted(points[0][1])
+    out = bytearray((BLOCK_VERSION,))
+    _write_str(out, camera_id)
+    write_varint(out, len(keys))
+    for kind, name in keys:
+        out.append(KINDS.index(kind))
+        _write_str(out, name)
+
+    write_varint(out, len(points))
+    previous_ts = previous_delta = 0
+    for i, (ts, _) in enumerate(points):
+        if i == 0:
+            write_varint(out, ts)
+        else:
+            delta = ts - previous_ts
+            write_varint(out, zigzag(delta - previous_delta))
+            previous_delta = delta
+        previous_ts = ts
+
+    for key in keys:
+        for column in (0, 1):
+            previous = 0
+            for i, (_, values) in enumerate(points):
+                value = values[key][column]
+                write_varint(out, value if i == 0 else zigzag(value - previous))
+                previous = value
+    return bytes(out)
+
+
+def decode_block(payload: bytes) -> Dict[str, Any]:
+    """Inverse of encode_block: {"camera", "series": {"zone:name": [[ts, in, out], ...]}}."""
+    if payload[0] != BLOCK_VERSION:
+        raise ValueError(f"Unsupported series block version {payload[0]}")
+    camera_id, offset = _read_str(payload, 1)
+    key_count, offset = read_varint(payload, offset)
+    keys = []
+    for _ in range(key_count):
+        kind = KINDS[payload[offset]]
+        name, offset = _read_str(payload, offset + 1)
+        keys.append(f"{kind}:{name}")
+
+    point_count, offset = read_varint(payload, offset)
+    timestamps: List[int] = []
+    delta = 0
+    for i in range(point_count):
+        value, offset = read_varint(payload, offset)
+        if i == 0:
+            timestamps.append(value)
+        else:
+            delta += unzigzag(value)
+            timestamps.append(timestamps[-1] + delta)
+
+    series = {}
+    for key in keys:
+        columns = []
+        for _ in (0, 1):
+            values: List[int] = []
+            for i in range(point_count):
+                value, offset = read_varint(payload, offset)
+                values.append(value if i == 0 else values[-1] + unzigzag(value))
+            columns.append(values)
+        series[key] = [[ts, count_in, count_out] for ts, count_in, count_out in zip(timestamps, *columns)]
+    return {"camera": camera_id, "series": series}
+
+
+class SeriesRecorder:
+    def __init__(self, mqtt_client, pi_id: str, interval: float = SERIES_INTERVAL,
+                 block_points: int = SERIES_BLOCK_POINTS):
+        self.client = mqtt_client
+        self.pi_id = pi_id
+        self.interval = interval
+        self.block_points = block_points
+        self.points: Dict[str, List[Point]] = {}
+        self.stats = {"samples": 0, "blocks": 0, "bytes": 0, "raw_json_bytes": 0}
+
+    def start(self, scheduler):
+        scheduler.add_job("count_series", self._sample, interval=self.interval, priority=15, run_now=False)
+        logger.info(f"Series recorder started ({self.interval}s interval, {self.block_points} points per block)")
+
+    def stop(self):
+        for camera_id in list(self.points):
+            self._flush(camera_id)
+
+    def _sample(self, context):
+        ts = int(round(context.now))
+        for camera_id, camera_state in context.counter_state().items():
+            values = {(kind, name): (item["in"], item["out"])
+                      for section, kind in (("zones", "zone"), ("lines", "line"))
+                      for name, item in camera_state.get(section, {}).items()}
+            if not values:
+                continue
+            points = self.points.setdefault(camera_id, [])
+            if points and set(points[0][1]) != set(values):
+                self._flush(camera_id)
+                points = self.points.setdefault(camera_id, [])
+            points.append((ts, values))
+            self.stats["samples"] += 1
+            if len(points) >= self.block_points:
+                self._flush(camera_id)
+
+    def _flush(self, camera_id: str):
+        points = self.points.pop(camera_id, None)
+        if not points:
+            return
+        try:
+            payload = encode_block(camera_id, points)
+            self.client.publish(f"vision/{self.pi_id}/{camera_id}/series/block", payload, qos=1)
+        except Exception as e:
+            logger.error(f"Failed to publish count series for {camera_id}: {e}")
+            return
+        self.stats["blocks"] += 1
+        self.stats["bytes"] += len(payload)
+        self.stats["raw_json_bytes"] += len(json.dumps(_as_json(camera_id, points)))
+
+    def get_stats(self) -> Dict[str, Any]:
+        stats = dict(self.stats)
+        if stats["bytes"]:
+            stats["compression_ratio"] = round(stats["raw_json_bytes"] / stats["bytes"], 1)
+        return stats
+
+
+def _as_json(camera_id: str, points: List[Point]) -> Dict[str, Any]:
+    """The same samples as one JSON message per point, as the latest-totals publisher would send them."""
+    return {"camera": camera_id, "points": [
+        {"ts": ts, "counts": {f"{kind}:{name}": {"in": count_in, "out": count_out}
+                              for (kind, name), (count_in, count_out) in values.items()}}
+        for ts, values in points]}
+
+
+def series_from_config(path: str, interval: int) -> Dict[str, List[Point]]:
+    """Cumulative counts per interval from the history lists of a saved zone/line file."""
+    with open(path, "r") as f:
+        data = json.load(f)
+    histories: Dict[str, Dict[SeriesKey, List[Tuple[float, str]]]] = {}
+    for camera_id, camera in data.items():
+        if camera_id == "_lines":
+            continue
+        for name, zone in camera.get("zones", {}).items():
+            histories.setdefault(camera_id, {})[("zone", name)] = _parse_history(zone.get("history", []))
+    for camera_id, lines in data.get("_lines", {}).items():
+        for name, line in lines.items():
+            histories.setdefault(camera_id, {})[("line", name)] = _parse_history(line.get("history", []))
+
+    series = {}
+    for camera_id, shapes in histories.items():
+        stamps = [ts for events in shapes.values() for ts, _ in events]
+        if not stamps:
+            continue
+        start, end = int(min(stamps)) // interval * interval, int(max(stamps)) + interval
+        points: List[Point] = []
+        for ts in range(start, end + 1, interval):
+            values = {}
+            for key, events in shapes.items():
+                count_in = sum(1 for t, action in events if t < ts and action in ("Entered", "In"))
+                count_out = sum(1 for t, action in events if t < ts and action in ("Exited", "Out"))
+                values[key] = (count_in, count_out)
+            points.append((ts, values))
+        series[camera_id] = points
+    return series
+
+
+def _parse_history(history: List[Dict[str, Any]]) -> List[Tuple[float, str]]:
+    return [(time.mktime(time.strptime(entry["time"], "%Y-%m-%d %H:%M:%S")), entry.get("action"))
+            for entry in history if "time" in entry]
+
+
+def benchmark(path: str = "multisource1.json", interval: int = 1, repeat: int = 3600,
+              block_points: int = SERIES_BLOCK_POINTS):
+    """Encode the recorded counts of `path` (tiled `repeat` times) and compare with per-point JSON."""
+    recorded = series_from_config(path, interval)
+    for camera_id, points in recorded.items():
+        span = points[-1][0] - points[0][0] + interval
+        tiled: List[Point] = []
+        for r in range(repeat):
+            base = tiled[-1][1] if tiled else None
+            for ts, values in points:
+                if base is not None:
+                    values = {key: (v[0] + base[key][0], v[1] + base[key][1]) for key, v in values.items()}
+                tiled.append((ts + r * span, values))
+        blocks = [tiled[i:i + block_points] for i in range(0, len(tiled), block_points)]
+
+        started = time.perf_counter()
+        payloads = [encode_block(camera_id, block) for block in blocks]
+        encode_s = time.perf_counter() - started
+        started = time.perf_counter()
+        decoded = [decode_block(payload) for payload in payloads]
+        decode_s = time.perf_counter() - started
+
+        for block, result in zip(blocks, decoded):
+            for kind, name in block[0][1]:
+                expected = [[ts, *values[(kind, name)]] for ts, values in block]
+                assert result["series"][f"{kind}:{name}"] == expected, "decoded series differ"
+
+        encoded = sum(len(payload) for payload in payloads)
+        raw = sum(len(json.dumps(_as_json(camera_id, block))) for block in blocks)
+        print(f"{camera_id}: {len(tiled)} points x {len(tiled[0][1])} series in {len(blocks)} blocks, "
+              f"{raw} B JSON -> {encoded} B ({raw / encoded:.1f}x), "
+              f"encode {encode_s / len(tiled) * 1e6:.1f} us/point, decode {decode_s / len(tiled) * 1e6:.1f} us/point")
+
+
+if __name__ == "__main__":
+    benchmark(*sys.argv[1:2])
@@ -0,0 +1,197 @@
+"""
+On-demand JPEG snapshots over MQTT.
+Nothing is encoded until a client watches a camera: the watch_camera command
+takes a lease of N seconds (capped at SNAPSHOT_LEASE_MAX_SECONDS) that the
+client renews by sending it again. While a camera is watched, the "snapshots"
+telemetry job publishes its latest frame on vision/{pi_id}/{camera_id}/snapshot
+at most SNAPSHOT_MAX_FPS times per second.
+
+- Frames that look the same as the last published one (mean absolute
+  difference of a small grayscale thumbnail below SNAPSHOT_CHANGE_THRESHOLD)
+  are skipped, except for a refresh every SNAPSHOT_REFRESH_SECONDS.
+- Scale and JPEG quality follow a ladder of levels. After each publish the
+  level moves so that all watched cameras together stay within
+  SNAPSHOT_BANDWIDTH_BUDGET bytes per second, or within the uplink headroom
+  left by more important traffic when publishing through the governor.
+- Encodings are cached per frame, so MQTT and HTTP (get_jpeg) consumers
+  asking for the same frame at the same settings share one encode.
+"""
+
+import threading
+import time
+from typing import Any, Dict, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from logging_config import get_logger
+from config import (
+    JPEG_QUALITY,
+    SNAPSHOT_MAX_FPS,
+    SNAPSHOT_BANDWIDTH_BUDGET,
+    SNAPSHOT_LEASE_MAX_SECONDS,
+    SNAPSHOT_CHANGE_THRESHOLD,
+    SNAPSHOT_REFRESH_SECONDS,
+)
+
+logger = get_logger(__name__)
+
+# (scale, JPEG quality), best first
+QUALITY_LADDER = (
+    (1.0, 80), (1.0, 70), (0.75, 70), (0.75, 60), (0.5, 60), (0.5, 50), (0.35, 50), (0.25, 40),
+)
+THUMBNAIL_SIZE = (32, 18)
+
+
+class EncodeCache:
+    """JPEG encodings of the latest frame per camera, keyed by (scale, quality)."""
+
+    def __init__(self, frame_buffers: Dict[str, Any]):
+        self.frame_buffers = frame_buffers
+        self.lock = threading.Lock()
+        self.entries: Dict[str, Tuple[Any, Dict[Tuple[float, int], bytes]]] = {}
+        self.stats = {"encodes": 0, "hits": 0}
+
+    def get(self, camera_id: str, scale: float = 1.0, quality: int = JPEG_QUALITY) -> Tuple[Any, Optional[bytes]]:
+        """Return (frame, jpeg) for the current frame of a camera; (None, None) if there is none."""
+        frame = self.frame_buffers.get(camera_id)
+        if frame is None:
+            return None, None
+        key = (scale, quality)
+        with self.lock:
+            cached_frame, encodings = self.entries.get(camera_id, (None, {}))
+            if cached_frame is frame and key in encodings:
+                self.stats["hits"] += 1
+                return frame, encodings[key]
+
+        image = frame
+        if scale < 1.0:
+            height, width = frame.shape[:2]
+            image = cv2.resize(frame, (max(1, int(width * scale)), max(1, int(height * scale))),
+                               interpolation=cv2.INTER_AREA)
+        ok, buffer = cv2.imencode(".jpg", image, [int(cv2.IMWRITE_JPEG_QUALITY), int(quality)])
+        if not ok:
+            return frame, None
+        jpeg = buffer.tobytes()
+
+        with self.lock:
+            self.stats["encodes"] += 1
+            cached_frame, encodings = self.entries.get(camera_id, (None, {}))
+            if cached_frame is not frame:
+                encodings = {}
+                self.entries[camera_id] = (frame, encodings)
+            encodings[key] = jpeg
+        return frame, jpeg
+
+    def drop(self, camera_id: str):
+        with self.lock:
+            self.entries.pop(camera_id, None)
+
+
+class SnapshotStreamer:
+    def __init__(self, frame_buffers: Dict[str, Any], mqtt_client, pi_id: str,
+                 budget: float = SNAPSHOT_BANDWIDTH_BUDGET, max_fps: float = SNAPSHOT_MAX_FPS):
+        self.client = mqtt_client
+        self.pi_id = pi_id
+        self.budget = budget
+        self.max_fps = max_fps
+        self.cache = EncodeCache(frame_buffers)
+
+        self.lock = threading.Lock()
+        self.leases: Dict[str, float] = {}
+        self.levels: Dict[str, int] = {}
+        self.last_thumbnail: Dict[str, Any] = {}
+        self.last_published: Dict[str, float] = {}
+        self.stats = {"published": 0, "unchanged": 0, "bytes": 0, "expired": 0}
+
+    def start(self, scheduler):
+        scheduler.add_job("snapshots", self._publish_watched, interval=1.0 / self.max_fps, priority=30)
+        logger.info(f"Snapshot streamer started (budget {self.budget / 1024:.0f} KB/s, max {self.max_fps} fps)")
+
+    # --- leases ------------------------------------------------------------------
+
+    def watch(self, camera_id: str, seconds: float) -> float:
+        """Start or renew a lease; returns its expiry as a unix timestamp."""
+        seconds = max(0.0, min(float(seconds), SNAPSHOT_LEASE_MAX_SECONDS))
+        expires = time.monotonic() + seconds
+        with self.lock:
+            new = camera_id not in self.leases
+            self.leases[camera_id] = max(self.leases.get(camera_id, 0.0), expires)
+            if new:
+                # A new watcher gets the next frame even if nothing changed
+                self.last_thumbnail.pop(camera_id, None)
+            remaining = self.leases[camera_id] - time.monotonic()
+        return time.time() + remaining
+
+    def unwatch(self, camera_id: str):
+        with self.lock:
+            self._release(camera_id)
+
+    def _release(self, camera_id: str):
+        self.leases.pop(camera_id, None)
+        self.last_thumbnail.pop(camera_id, None)
+        self.cache.drop(camera_id)
+
+    # --- publishing --------------------------------------------------------------
+
+    def _publish_watched(self, context):
+        now = time.monotonic()
+        with self.lock:
+            for camera_id in [c for c, expires in self.leases.items() if expires <= now]:
+                self._release(camera_id)
+                self.stats["expired"] += 1
+            watched = list(self.leases)
+        if not watched:
+            return
+        budget = self.budget
+        headroom = getattr(self.client, "headroom", None)
+        if headroom is not None:
+            # Behind the bandwidth governor only what more important traffic leaves is used
+            budget = min(budget, headroom("snapshots"))
+        frame_budget = budget / len(watched) / self.max_fps
+        for camera_id in watched:
+            self._publish_camera(camera_id, frame_budget, now)
+
+    def _publish_camera(self, camera_id: str, frame_budget: float, now: float):
+        frame = self.cache.frame_buffers.get(camera_id)
+        if frame is None:
+            return
+        thumbnail = cv2.cvtColor(cv2.resize(frame, THUMBNAIL_SIZE, interpolation=cv2.INTER_AREA),
+                                 cv2.COLOR_BGR2GRAY).astype(np.int16)
+        previous = self.last_thumbnail.get(camera_id)
+        stale = now - self.last_published.get(camera_id, 0.0) >= SNAPSHOT_REFRESH_SECONDS
+        if previous is not None and not stale and \
+                float(np.mean(np.abs(thumbnail - previous))) < SNAPSHOT_CHANGE_THRESHOLD:
+            self.stats["unchanged"] += 1
+            return
+
+        level = self.levels.get(camera_id, 0)
+        scale, quality = QUALITY_LADDER[level]
+        _, jpeg = self.cache.get(camera_id, scale, quality)
+        if jpeg is None:
+            return
+        self.client.publish(f"vision/{self.pi_id}/{camera_id}/snapshot", jpeg, qos=0)
+        self.last_thumbnail[camera_id] = thumbnail
+        self.last_published[camera_id] = now
+        self.stats["published"] += 1
+        self.stats["bytes"] += len(jpeg)
+
+        # Step down when over budget, back up once there is clear headroom
+        if len(jpeg) > frame_budget and level < len(QUALITY_LADDER) - 1:
+            self.levels[camera_id] = level + 1
+        elif len(jpeg) < frame_budget * 0.6 and level > 0:
+            self.levels[camera_id] = level - 1
+
+    def get_jpeg(self, camera_id: str, quality: int = JPEG_QUALITY) -> Optional[bytes]:
+        """Full-size JPEG of the latest frame for HTTP consumers, shared with MQTT publishing."""
+        _, jpeg = self.cache.get(camera_id, 1.0, quality)
+        return jpeg
+
+    def get_stats(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        with self.lock:
+            watched = {camera_id: {"lease_seconds": round(expires - now, 1),
+                                   "scale": QUALITY_LADDER[self.levels.get(camera_id, 0)][0],
+                                   "quality": QUALITY_LADDER[self.levels.get(camera_id, 0)][1]}
+                       for camera_id, expires in self.leases.items()}
+        return {**self.stats, **self.cache.stats, "watched": watched}
@@ -4,6 +4,7 @@ Contains all WebSocket event handlers for real-time communication.
 """
 
 from flask_socketio import SocketIO, emit
+from edit_coalescer import EditCoalescer
 
 def register_socketio_handlers(socketio: SocketIO, user_data, pipeline_manager):
     """
@@ -13,12 +14,15 @@ def register_socketio_handlers(socketio: SocketIO, user_data, pipeline_manager):
         socketio: Flask-SocketIO instance
         user_data: MultiSourceZoneVisitorCounter instance
     """
+    # Drag/resize edits are coalesced per shape; clients receive geometry deltas only
+    edit_coalescer = EditCoalescer(user_data, on_applied=lambda delta: socketio.emit("shape_geometry", delta))
 
     @socketio.on('request_pipeline_status')
     def handle_pipeline_status_request():
         status = {
             "running": pipeline_manager.is_running(),
-            "sources": pipeline_manager.video_sources if pipeline_manager.is_running() else []
+            "sources": pipeline_manager.video_sources if pipeline_manager.is_running() else [],
+            "source_states": pipeline_manager.get_source_status()
         }
         emit('pipeline_status_update', status)
 
@@ -34,23 +38,11 @@ def register_socketio_handlers(socketio: SocketIO, user_data, pipeline_manager):
 
         camera_id = data["camera_id"]
         zone = data["zone"]
-        top_left = data["top_left"]
-        bottom_right = data["bottom_right"]
+        geometry = {"top_left": data["top_left"], "bottom_right": data["bottom_right"]}
 
-        success = user_data.create_or_update_zone(camera_id, zone, top_left, bottom_right)
-        
-        if success:
-            zone_data = user_data.data[camera_id]["zones"][zone]
-            print(f"[Socket.IO] Zone updated - Camera: {camera_id}, Zone: {zone}")
-            print(f"[Socket.IO] Zone data: {zone_data}")
-            
-            emit("zone_updated", {
-                "data": user_data.data,
-                "camera": camera_id,
-                "zone": zone,
-                "message": "Zone successfully updated"
-            })
-        else:
+        success = edit_coalescer.submit(camera_id, "zone", zone, geometry, final=data.get("final", False))
+
+        if not success:
             print(f"[Socket.IO] Failed to update zone {zone} for camera {camera_id}")
             emit("error", {"message": "Invalid zone coordinates"})
 
@@ -65,21 +57,31 @@ def register_socketio_handlers(socketio: SocketIO, user_data, pipeline_manager):
 
         camera_id = data["camera_id"]
         line = data["line"]
-        start = data["start"]
-        end = data["end"]
+        geometry = {"start": data["start"], "end": data["end"]}
 
-        success = user_data.create_or_update_line(camera_id, line, start, end)
+        success = edit_coalescer.submit(camera_id, "line", line, geometry, final=data.get("final", False))
 
-        if success:
-            emit("line_updated", {
-                "lines": user_data.get_all_lines(),
+        if not success:
+            emit("error", {"message": "Invalid line coordinates"})
+
+
+    @socketio.on("set_layout")
+    def handle_set_layout(data):
+        """Apply a full camera layout (zones and lines) in one transaction."""
+        camera_id = data.get("camera_id")
+        if not camera_id:
+            emit("error", {"message": "Missing camera_id"})
+            return
+
+        result = user_data.apply_camera_layout(camera_id, data, replace=data.get("replace", True))
+        if result["success"]:
+            emit("layout_updated", {
+                "data": user_data.data,
                 "camera": camera_id,
-                "line": line,
-                "message": f"Line '{line}' updated successfully"
+                "result": result
             }, broadcast=True)
         else:
-            emit("error", {"message": "Invalid line coordinates"})
-
+            emit("error", {"message": "Invalid layout", "details": result["errors"]})
 
     @socketio.on("reset_zone_counts")
     def handle_reset_zone_counts(data):
@@ -0,0 +1,98 @@
+"""
+Per-source supervision for the multi-source GStreamer pipeline.
+Tracks the lifecycle of every camera branch and computes its restart backoff,
+so a single flaky camera can be restarted without stopping the others.
+"""
+
+import time
+import threading
+from enum import Enum
+from typing import Any, Dict, Optional
+
+from config import (
+    SOURCE_RESTART_BACKOFF_INITIAL,
+    SOURCE_RESTART_BACKOFF_MAX,
+    SOURCE_STABLE_SECONDS,
+    SOURCE_START_TIMEOUT,
+    SOURCE_STALL_TIMEOUT,
+)
+
+
+class SourceState(Enum):
+    STARTING = "starting"
+    RUNNING = "running"
+    BACKOFF = "backoff"
+    STOPPED = "stopped"
+
+
+class SourceSlot:
+    """State of one camera branch. The GStreamer bin itself is owned by PipelineManager."""
+
+    def __init__(self, camera_id: str, video_source: str, index: int = -1):
+        self.camera_id = camera_id
+        self.video_source = video_source
+        self.index = index
+        self.source_bin = None
+        self.state = SourceState.STARTING
+        self.state_since = time.monotonic()
+        self.failures = 0
+        self.restarts = 0
+        self.last_error: Optional[str] = None
+        self.last_buffer_time: Optional[float] = None
+        self.frames = 0
+        self.cancel_event = threading.Event()
+
+        # Reconfiguration: a standby slot warms up next to the slot it replaces and
+        # only starts counting once it delivers frames, at which point the two swap.
+        self.counting = True
+        self.standby = False
+        self.pending_gap_from: Optional[float] = None
+
+    def set_state(self, state: SourceState, error: Optional[str] = None) -> bool:
+        if error:
+            self.last_error = error
+        if state == self.state:
+            return False
+        self.state = state
+        self.state_since = time.monotonic()
+        if state == SourceState.STARTING:
+            self.last_buffer_time = None
+        return True
+
+    def next_backoff(self) -> float:
+        delay = min(SOURCE_RESTART_BACKOFF_INITIAL * (2 ** self.failures), SOURCE_RESTART_BACKOFF_MAX)
+        self.failures += 1
+        return delay
+
+    def mark_buffer(self) -> bool:
+        """Record a buffer from the branch. Returns True on the first buffer after a (re)start."""
+        self.last_buffer_time = time.monotonic()
+        self.frames += 1
+        return self.state == SourceState.STARTING
+
+    def check_health(self, now: float) -> Optional[str]:
+        """Return a restart reason if the branch is stuck, otherwise None."""
+        if self.state == SourceState.STARTING:
+            if now - self.state_since > SOURCE_START_TIMEOUT:
+                return f"no frames within {SOURCE_START_TIMEOUT:.0f}s of start"
+        elif self.state == SourceState.RUNNING:
+            if self.last_buffer_time and now - self.last_buffer_time > SOURCE_STALL_TIMEOUT:
+                return f"no frames for {SOURCE_STALL_TIMEOUT:.0f}s"
+            if self.failures and now - self.state_since > SOURCE_STABLE_SECONDS:
+                self.failures = 0
+        return None
+
+    def to_dict(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        return {
+            "camera_id": self.camera_id,
+            "source": self.video_source,
+            "state": self.state.value,
+            "state_age_seconds": round(now - self.state_since, 1),
+            "failures": self.failures,
+            "restarts": self.restarts,
+            "frames": self.frames,
+            "last_frame_age_seconds": round(now - self.last_buffer_time, 1) if self.last_buffer_time else None,
+            "last_error": self.last_error,
+            "counting": self.counting,
+        }
@@ -567,7 +567,8 @@ function handleSnapshotMouseUp(e) {
             camera_id: currentCamera,
             zone: selectedZone,
             top_left: topLeft.map(Math.round),
-            bottom_right: bottomRight.map(Math.round)
+            bottom_right: bottomRight.map(Math.round),
+            final: true
         });
         showToast(`Zone ${selectedZone} set successfully`);
 
@@ -582,7 +583,8 @@ function handleSnapshotMouseUp(e) {
             camera_id: currentCamera,
             line: selectedLine,
             start: start.map(Math.round),
-            end: end.map(Math.round)
+            end: end.map(Math.round),
+            final: true
         });
         showToast(`Line ${selectedLine} set successfully`);
 
@@ -625,7 +627,8 @@ function saveZone(start, end) {
         camera_id: currentCamera,
         zone: selectedZone,
         top_left: topLeft.map(Math.round),
-        bottom_right: bottomRight.map(Math.round)
+        bottom_right: bottomRight.map(Math.round),
+        final: true
     });
     
     // Reset selection
@@ -660,7 +663,8 @@ function saveZoneFromSnapshot(start, end) {
         camera_id: currentCamera,
         zone: selectedZone,
         top_left: topLeft.map(Math.round),
-        bottom_right: bottomRight.map(Math.round)
+        bottom_right: bottomRight.map(Math.round),
+        final: true
     });
     
     showToast(`Zone ${selectedZone} set successfully`);
@@ -1171,6 +1175,31 @@ socket.on('zone_updated', (data) => {
     updateHistory();
 });
 
+// Compact geometry delta for one zone or line; counts restart with the new geometry
+socket.on('shape_geometry', (delta) => {
+    if (delta.kind === 'zone') {
+        if (!zones[delta.camera]) zones[delta.camera] = { zones: {}, lines: {} };
+        if (!zones[delta.camera].zones) zones[delta.camera].zones = {};
+        zones[delta.camera].zones[delta.name] = {
+            ...delta.geometry,
+            in_count: 0,
+            out_count: 0,
+            inside_ids: [],
+            history: []
+        };
+        updateZoneBoxes();
+    } else {
+        if (!lines[delta.camera]) lines[delta.camera] = {};
+        lines[delta.camera][delta.name] = {
+            ...delta.geometry,
+            in_count: 0,
+            out_count: 0,
+            history: []
+        };
+    }
+    drawAllZones(ctx, canvasOverlay.width, canvasOverlay.height);
+});
+
 socket.on('camera_changed', (data) => {
     zones = data.data;
     currentCamera = data.active_camera;
@@ -0,0 +1,204 @@
+"""
+Single scheduler thread for outbound telemetry.
+Jobs are periodic (interval) or change-triggered (trigger() with a coalescing
+delay), kept in one priority queue ordered by due time and priority. All jobs
+due in a tick share a TickContext. The context takes at most one snapshot of
+the counter state per tick and caches serialized fragments, so jobs that
+publish the same data only serialize it once. A per-tick CPU budget defers
+lower-priority jobs to the next tick instead of letting telemetry starve the
+frame callbacks. Per-job timing is reported by get_stats().
+"""
+
+import heapq
+import itertools
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from logging_config import get_logger
+from config import TELEMETRY_TICK_BUDGET_MS
+from mqtt_serialization import dumps
+
+logger = get_logger(__name__)
+
+DEFER_DELAY = 0.05
+
+
+class TickContext:
+    def __init__(self, counter):
+        self.counter = counter
+        self.now = time.time()
+        self._state: Optional[Dict[str, Any]] = None
+        self._fragments: Dict[Any, bytes] = {}
+
+    def counter_state(self) -> Dict[str, Dict[str, Any]]:
+        """Counts and sequence numbers per camera, taken once per tick under the counter lock."""
+        if self._state is None:
+            self._state = self.counter.get_state_digest()
+        return self._state
+
+    def fragment(self, key: Any, build: Callable[[], Any], encode: Callable[[Any], bytes] = dumps) -> bytes:
+        """encode(build()), serialized once per tick and shared by every job asking for the same key."""
+        cached = self._fragments.get(key)
+        if cached is None:
+            cached = self._fragments[key] = encode(build())
+        return cached
+
+
+class TelemetryJob:
+    def __init__(self, name: str, fn: Callable[[TickContext], None], interval: Optional[float],
+                 priority: int, delay: float):
+        self.name = name
+        self.fn = fn
+        self.interval = interval
+        self.priority = priority
+        self.delay = delay
+        self.next_run: Optional[float] = None
+
+        self.runs = 0
+        self.deferred = 0
+        self.errors = 0
+        self.total_cpu = 0.0
+        self.max_cpu = 0.0
+        self.total_wall = 0.0
+        self.last_error: Optional[str] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "interval": self.interval,
+            "priority": self.priority,
+            "runs": self.runs,
+            "deferred": self.deferred,
+            "errors": self.errors,
+            "avg_cpu_ms": round(self.total_cpu / self.runs * 1000, 3) if self.runs else 0.0,
+            "max_cpu_ms": round(self.max_cpu * 1000, 3),
+            "avg_wall_ms": round(self.total_wall / self.runs * 1000, 3) if self.runs else 0.0,
+            "last_error": self.last_error,
+        }
+
+
+class TelemetryScheduler:
+    def __init__(self, counter, tick_budget_ms: float = TELEMETRY_TICK_BUDGET_MS):
+        self.counter = counter
+        self.tick_budget = tick_budget_ms / 1000.0
+        self.jobs: Dict[str, TelemetryJob] = {}
+        self.queue: List[Tuple[float, int, int, str]] = []
+        self._seq = itertools.count()
+
+        self.lock = threading.Lock()
+        self.wakeup = threading.Condition(self.lock)
+        self._stopped = False
+        self.thread: Optional[threading.Thread] = None
+        self.ticks = 0
+        self.over_budget_ticks = 0
+
+    def add_job(self, name: str, fn: Callable[[TickContext], None], interval: Optional[float] = None,
+                priority: int = 10, delay: float = 0.0, run_now: bool = True):
+        """Register a job. Periodic jobs have an interval; triggered jobs run `delay` after trigger().
+        Lower priority values run first."""
+        job = TelemetryJob(name, fn, interval, priority, delay)
+        with self.lock:
+            self.jobs[name] = job
+            if interval is not None:
+                self._schedule(job, time.monotonic() if run_now else time.monotonic() + interval)
+
+    def trigger(self, name: str):
+        """Run a job after its coalescing delay; further triggers before then are merged."""
+        with self.lock:
+            job = self.jobs.get(name)
+            if job is None:
+                return
+            due = time.monotonic() + job.delay
+            if job.next_run is None or due < job.next_run:
+                self._schedule(job, due)
+
+    def _schedule(self, job: TelemetryJob, due: float):
+        job.next_run = due
+        heapq.heappush(self.queue, (due, job.priority, next(self._seq), job.name))
+        self.wakeup.notify()
+
+    def start(self):
+        if self.thread and self.thread.is_alive():
+            return
+        self._stopped = False
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+        logger.info(f"Telemetry scheduler started with {len(self.jobs)} jobs")
+
+    def stop(self):
+        with self.lock:
+            self._stopped = True
+            self.wakeup.notify()
+        if self.thread and self.thread.is_alive():
+            self.thread.join(timeout=5)
+
+    def _due_jobs(self) -> Optional[List[TelemetryJob]]:
+        """Wait for the next due time and pop every job due by then, highest priority first."""
+        with self.lock:
+            while not self._stopped:
+                now = time.monotonic()
+                # Drop heap entries superseded by an earlier (re)schedule of the same job
+                while self.queue and self.jobs[self.queue[0][3]].next_run != self.queue[0][0]:
+                    heapq.heappop(self.queue)
+                if not self.queue:
+                    self.wakeup.wait()
+                    continue
+                if self.queue[0][0] > now:
+                    self.wakeup.wait(self.queue[0][0] - now)
+                    continue
+                due = []
+                while self.queue and self.queue[0][0] <= now:
+                    _, _, _, name = heapq.heappop(self.queue)
+                    job = self.jobs[name]
+                    if job.next_run is not None and job.next_run <= now and job not in due:
+                        job.next_run = None
+                        due.append(job)
+                due.sort(key=lambda job: job.priority)
+                return due
+            return None
+
+    def _run(self):
+        while True:
+            due = self._due_jobs()
+            if due is None:
+                return
+            self._tick(due)
+
+    def _tick(self, due: List[TelemetryJob]):
+        self.ticks += 1
+        context = TickContext(self.counter)
+        tick_started = time.thread_time()
+        for i, job in enumerate(due):
+            if i and time.thread_time() - tick_started > self.tick_budget:
+                self.over_budget_ticks += 1
+                with self.lock:
+                    for deferred in due[i:]:
+                        deferred.deferred += 1
+                        if deferred.next_run is None:
+                            self._schedule(deferred, time.monotonic() + DEFER_DELAY)
+                break
+            cpu_started, wall_started = time.thread_time(), time.monotonic()
+            try:
+                job.fn(context)
+            except Exception as e:
+                job.errors += 1
+                job.last_error = str(e)
+                logger.error(f"Telemetry job {job.name} failed: {e}")
+            cpu = time.thread_time() - cpu_started
+            job.runs += 1
+            job.total_cpu += cpu
+            job.max_cpu = max(job.max_cpu, cpu)
+            job.total_wall += time.monotonic() - wall_started
+            if job.interval is not None:
+                with self.lock:
+                    if job.next_run is None:
+                        self._schedule(job, max(time.monotonic(), wall_started + job.interval))
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self.lock:
+            return {
+                "ticks": self.ticks,
+                "over_budget_ticks": self.over_budget_ticks,
+                "tick_budget_ms": self.tick_budget * 1000,
+                "jobs": {name: job.to_dict() for name, job in self.jobs.items()},
+            }
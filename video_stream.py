@@ -5,26 +5,69 @@ import logging
 import time
 import threading
 from logging_config import get_logger
+from command_executor import CommandExecutor
+from config import CAMERA_READY_TIMEOUT
 
 logger = get_logger(__name__)
 
+# Known commands and their conflict group; commands of one group run one at a time
+COMMAND_GROUPS = {
+    "start_pipeline": "pipeline",
+    "stop_pipeline": "pipeline",
+    "add_source": "pipeline",
+    "remove_source": "pipeline",
+    "restart_source": "pipeline",
+    "set_zone": "layout",
+    "delete_zone": "layout",
+    "reset_zone_counts": "layout",
+    "set_line": "layout",
+    "delete_line": "layout",
+    "reset_line_counts": "layout",
+    "set_layout": "layout",
+    "set_queue_adaptive": "queues",
+    "request_snapshot": None,
+    "watch_camera": None,
+    "unwatch_camera": None,
+    "get_active_cameras": None,
+    "get_source_status": None,
+    "query_rollups": None,
+    "resync_history": None,
+    "get_queue_levels": None,
+}
+
 class MqttCommandListener:
-    def __init__(self, pipeline_manager, user_data, video_stream_manager, mqtt_client, pi_id):
+    def __init__(self, pipeline_manager, user_data, video_stream_manager, mqtt_client, pi_id, snapshot_streamer=None, publisher=None):
         self.logger = logging.getLogger(__name__)
         self.pipeline_manager = pipeline_manager
         self.user_data = user_data
         self.video_stream_manager = video_stream_manager
+        self.snapshot_streamer = snapshot_streamer
 
         self.client = mqtt_client
+        # Outbound messages may go through a wrapper (e.g. the bandwidth governor); callbacks stay on the client
+        self.publisher = publisher or mqtt_client
         self.pi_id = pi_id
         
         self.command_topic = f"vision/{self.pi_id}/command/request"
         self.response_topic = f"vision/{self.pi_id}/command/response"
 
         self.camera_list_topic = f"vision/{self.pi_id}/cameras/active_list"
+        self.source_status_topic = f"vision/{self.pi_id}/cameras/source_status"
         
         self.client.on_message = self.on_message
         self.client.on_connect = self.on_connect
+
+        self.reconfiguration_topic = f"vision/{self.pi_id}/pipeline/reconfiguration"
+
+        self.executor = CommandExecutor(self._respond)
+        # Notified on every source state change, so waiting for cameras needs no polling
+        self.source_state_changed = threading.Condition()
+        self.source_states = {}
+
+        if hasattr(self.pipeline_manager, 'add_source_state_listener'):
+            self.pipeline_manager.add_source_state_listener(self.publish_source_state)
+        if hasattr(self.pipeline_manager, 'add_reconfigure_listener'):
+            self.pipeline_manager.add_reconfigure_listener(self.publish_reconfiguration_report)
         
     '''def subscribe_to_commands(self):
         if self.client and self.client.is_connected():
@@ -42,88 +85,185 @@ class MqttCommandListener:
             self.logger.error(f"Command Listener: Failed to connect, return code {rc}")
 
     def on_message(self, client, userdata, msg):
+        """Runs on the MQTT network thread: parse, acknowledge and hand the command to the executor."""
         if msg.topic != self.command_topic:
             return
 
         self.logger.info(f"Command Listener: Received command on topic '{msg.topic}'")
-        status = "failed"
-        error_message = ""
         command = "unknown"
-        success = False
+        command_id = None
 
         try:
             data = json.loads(msg.payload.decode())
             command = data.get("command")
+            command_id = data.get("command_id")
             payload = data.get("payload", {})
-            
-            self.logger.info(f"Executing command: '{command}' with payload: {payload}")
-
-            if command == "start_pipeline":
-                sources = payload.get("sources")
-                if sources: 
-                    if isinstance(sources, dict):
-                        custom_camera_names = list(sources.keys())
-                        rtsp_urls = list(sources.values())
-                        success = self.pipeline_manager.start_pipeline(rtsp_urls, custom_camera_names=custom_camera_names, on_started_callback=self.wait_and_publish_active_cameras)
-                    elif isinstance(sources, list):
-                        success = self.pipeline_manager.start_pipeline(sources, on_started_callback=self.wait_and_publish_active_cameras)
-            
-                    
-            
-            elif command == "stop_pipeline":
-                success = self.pipeline_manager.stop_pipeline()
+        except (json.JSONDecodeError, UnicodeDecodeError, AttributeError):
+            self._respond({"command": command, "status": "failed",
+                           "error": "Could not decode JSON from command message."})
+            self.logger.error("Could not decode JSON from command message.")
+            return
+
+        if command not in COMMAND_GROUPS:
+            error_message = f"Unknown command: {command}"
+            self.logger.warning(error_message)
+            self._respond({"command": command, "command_id": command_id, "status": "failed", "error": error_message})
+            return
+
+        self.executor.submit(command, lambda progress: self._execute(command, payload, progress),
+                             command_id=command_id, group=COMMAND_GROUPS[command])
+
+    def _respond(self, response):
+        self.publisher.publish(self.response_topic, json.dumps(response), qos=1)
+        self.logger.info(f"Published response to '{self.response_topic}': {response}")
+
+    def _execute(self, command, payload, progress):
+        """Run one command on an executor thread. Returns (success, error_message)."""
+        error_message = ""
+        success = False
+        self.logger.info(f"Executing command: '{command}' with payload: {payload}")
+
+        if command == "start_pipeline":
+            sources = payload.get("sources")
+            if sources: 
+                progress("validating_sources", sources=len(sources))
+                if isinstance(sources, dict):
+                    custom_camera_names = list(sources.keys())
+                    rtsp_urls = list(sources.values())
+                    success = self.pipeline_manager.start_pipeline(rtsp_urls, custom_camera_names=custom_camera_names, on_started_callback=self.wait_and_publish_active_cameras)
+                elif isinstance(sources, list):
+                    success = self.pipeline_manager.start_pipeline(sources, on_started_callback=self.wait_and_publish_active_cameras)
+        
+                
+        
+        elif command == "stop_pipeline":
+            progress("stopping_pipeline")
+            success = self.pipeline_manager.stop_pipeline()
+
+            if success:
+                empty_camera_info = {
+                    "cameras": [],
+                    "total": 0,
+                    "timestamp": time.time(),
+                    "status": "pipeline_stopped"
+                }
+                self.publisher.publish(self.camera_list_topic, json.dumps(empty_camera_info), qos=1, retain=True)
+                self.logger.info(f"Published empty camera list (pipeline stopped)")
 
+        elif command == "request_snapshot":
+            camera_id = payload.get("camera_id")
+            if camera_id:
+                self.video_stream_manager.handle_snapshot_request(camera_id)
+                success = True
+        elif command == "watch_camera":
+            if "camera_id" in payload and self.snapshot_streamer is not None:
+                expires = self.snapshot_streamer.watch(payload["camera_id"], payload.get("seconds", 30))
+                progress("watching", camera_id=payload["camera_id"], expires=expires)
+                success = True
+        elif command == "unwatch_camera":
+            if "camera_id" in payload and self.snapshot_streamer is not None:
+                self.snapshot_streamer.unwatch(payload["camera_id"])
+                success = True
+        elif command == "set_zone":
+            if all(k in payload for k in ["camera_id", "zone", "top_left", "bottom_right"]):
+                success = self.user_data.create_or_update_zone(**payload)
+        elif command == "delete_zone":
+            if all(k in payload for k in ["camera_id", "zone"]):
+                success = self.user_data.delete_zone(**payload)
+        elif command == "reset_zone_counts":
+             if all(k in payload for k in ["camera_id", "zone"]):
+                success = self.user_data.reset_zone_counts(**payload)
+        elif command == "set_line":
+            if all(k in payload for k in ["camera_id", "line_name", "start", "end"]):
+                success = self.user_data.create_or_update_line(**payload)
+        elif command == "delete_line":
+            if all(k in payload for k in ["camera_id", "line_name"]):
+                success = self.user_data.delete_line(**payload)
+        elif command == "set_layout":
+            if "camera_id" in payload:
+                result = self.user_data.apply_camera_layout(
+                    payload["camera_id"], payload, replace=payload.get("replace", True))
+                success = result["success"]
+                if not success:
+                    error_message = "; ".join(result["errors"])
+        elif command == "get_active_cameras":
+            self.publish_active_cameras()
+            success = True
+        elif command == "reset_line_counts":
+            if all(k in payload for k in ["camera_id", "line_name"]):
+                success = self.user_data.reset_line_counts(**payload)
+        elif command == "add_source":
+            if all(k in payload for k in ["camera_id", "source"]):
+                success = self.pipeline_manager.add_source(payload["camera_id"], payload["source"])
                 if success:
-                    empty_camera_info = {
-                        "cameras": [],
-                        "total": 0,
-                        "timestamp": time.time(),
-                        "status": "pipeline_stopped"
-                    }
-                    self.client.publish(self.camera_list_topic, json.dumps(empty_camera_info), qos=1, retain=True)
-                    self.logger.info(f"Published empty camera list (pipeline stopped)")
-
-            elif command == "request_snapshot":
-                camera_id = payload.get("camera_id")
-                if camera_id:
-                    self.video_stream_manager.handle_snapshot_request(camera_id)
-                    success = True
-            elif command == "set_zone":
-                if all(k in payload for k in ["camera_id", "zone", "top_left", "bottom_right"]):
-                    success = self.user_data.create_or_update_zone(**payload)
-            elif command == "delete_zone":
-                if all(k in payload for k in ["camera_id", "zone"]):
-                    success = self.user_data.delete_zone(**payload)
-            elif command == "reset_zone_counts":
-                 if all(k in payload for k in ["camera_id", "zone"]):
-                    success = self.user_data.reset_zone_counts(**payload)
-            elif command == "set_line":
-                if all(k in payload for k in ["camera_id", "line_name", "start", "end"]):
-                    success = self.user_data.create_or_update_line(**payload)
-            elif command == "delete_line":
-                if all(k in payload for k in ["camera_id", "line_name"]):
-                    success = self.user_data.delete_line(**payload)
-            elif command == "get_active_cameras":
-                self.publish_active_cameras()
+                    self.publish_active_cameras()
+        elif command == "remove_source":
+            if "camera_id" in payload:
+                success = self.pipeline_manager.remove_source(payload["camera_id"])
+                if success:
+                    self.publish_active_cameras()
+        elif command == "restart_source":
+            if "camera_id" in payload:
+                success = self.pipeline_manager.restart_source(payload["camera_id"])
+        elif command == "get_source_status":
+            self.publish_source_status()
+            success = True
+        elif command == "query_rollups":
+            if "camera_id" in payload:
+                self.publish_rollups(payload)
+                success = True
+        elif command == "resync_history":
+            if all(k in payload for k in ["camera_id", "kind", "name"]):
+                self.publish_history_resync(payload)
+                success = True
+        elif command == "get_queue_levels":
+            topic = f"vision/{self.pi_id}/pipeline/queues"
+            self.publisher.publish(topic, json.dumps(self.pipeline_manager.queue_monitor.get_snapshot()), qos=1)
+            success = True
+        elif command == "set_queue_adaptive":
+            if "enabled" in payload:
+                self.pipeline_manager.queue_monitor.set_adaptive(
+                    bool(payload["enabled"]), budget_ms=payload.get("budget_ms"), camera_id=payload.get("camera_id"))
                 success = True
-            elif command == "reset_line_counts":
-                if all(k in payload for k in ["camera_id", "line_name"]):
-                    success = self.user_data.reset_line_counts(**payload)
-            else:
-                error_message = f"Unknown command: {command}"
-                self.logger.warning(error_message)
 
-            status = "success" if success else "failed"
+        return success, error_message
 
-        except json.JSONDecodeError:
-            error_message = "Could not decode JSON from command message."
-            self.logger.error(error_message)
-        except Exception as e:
-            error_message = f"Error processing command '{command}': {str(e)}"
-            self.logger.error(error_message, exc_info=True)
-        response_payload = {"command": command, "status": status, "error": error_message}
-        self.client.publish(self.response_topic, json.dumps(response_payload), qos=1)
-        self.logger.info(f"Published response to '{self.response_topic}': {response_payload}")
+    def publish_rollups(self, payload):
+        """Answer a rollup query on vision/{pi_id}/rollups/response, echoing the request_id if given."""
+        start = payload.get("start")
+        end = payload.get("end")
+        result = self.user_data.rollups.query(
+            payload["camera_id"],
+            kind=payload.get("kind"),
+            name=payload.get("name"),
+            granularity=payload.get("granularity", "15m"),
+            start_ts=float(start) if start is not None else None,
+            end_ts=float(end) if end is not None else None)
+        if "request_id" in payload:
+            result["request_id"] = payload["request_id"]
+        topic = f"vision/{self.pi_id}/rollups/response"
+        self.publisher.publish(topic, json.dumps(result), qos=1)
+
+    def publish_history_resync(self, payload):
+        """Send the events of one zone/line after from_seq on vision/{pi_id}/{camera_id}/history/resync."""
+        since = payload.get("since")
+        events, complete = self.user_data.get_events_since(
+            payload["camera_id"], payload["kind"], payload["name"],
+            from_seq=int(payload.get("from_seq", 0)),
+            since_ts=float(since) if since is not None else None,
+            limit=int(payload.get("limit", 500)))
+        response = {
+            "camera_id": payload["camera_id"],
+            "kind": payload["kind"],
+            "name": payload["name"],
+            "from_seq": payload.get("from_seq", 0),
+            "events": events,
+            "complete": complete,
+        }
+        if "request_id" in payload:
+            response["request_id"] = payload["request_id"]
+        topic = f"vision/{self.pi_id}/{payload['camera_id']}/history/resync"
+        self.publisher.publish(topic, json.dumps(response), qos=1)
 
     def wait_and_publish_active_cameras(self, pipeline_manager_instance):
         self.logger.info("Pipeline has started, waiting for camera sources to initialize...")
@@ -134,24 +274,26 @@ class MqttCommandListener:
             expected_cameras = [f"camera{i+1}" for i in range(len(pipeline_manager_instance.video_sources))]
         expected_count = len(expected_cameras)
         
-        timeout_seconds = 10 
-        start_time = time.time()
+        # Called with source_state_changed held; the pipeline notifies under its sources lock,
+        # so only the states recorded by publish_source_state are consulted here
+        def sources_ready():
+            with self.user_data.lock:
+                initialized = [cam_id for cam_id in expected_cameras if cam_id in self.user_data.data]
+            return [cam_id for cam_id in initialized if self.source_states.get(cam_id) == "running"]
 
+        with self.source_state_changed:
+            ready = self.source_state_changed.wait_for(
+                lambda: len(sources_ready()) >= expected_count, timeout=CAMERA_READY_TIMEOUT)
 
-        while time.time() - start_time < timeout_seconds:
-            with self.user_data.lock:
-                current_cameras = [cam_id for cam_id in self.user_data.data.keys() if cam_id in expected_cameras]
-                current_count = len(current_cameras)
-                
-            if current_count >= expected_count:
-                self.logger.info(f"All {current_count} camera sources are initialized. Publishing camera list.")
-                self.publish_active_cameras()
-                return
-            time.sleep(0.5)
-        
-        self.logger.warning(f"Timeout reached while waiting for {expected_count} sources. Publishing current list of {current_count} cameras.")
+        if ready:
+            self.logger.info(f"All {expected_count} camera sources are initialized. Publishing camera list.")
+        else:
+            with self.source_state_changed:
+                current_count = len(sources_ready())
+            self.logger.warning(f"Timeout reached while waiting for {expected_count} sources. "
+                                f"Publishing current list of {current_count} running cameras.")
         self.publish_active_cameras()
-    
+
     def publish_active_cameras(self):
         if self.pipeline_manager.is_running() and hasattr(self.pipeline_manager, 'video_sources'):
             if hasattr(self.pipeline_manager, 'camera_names'):
@@ -174,12 +316,33 @@ class MqttCommandListener:
                 "timestamp": time.time(),
                 "status": "pipeline_stopped"
             }
-        self.client.publish(self.camera_list_topic, json.dumps(camera_info), qos=1, retain=True)
+        self.publisher.publish(self.camera_list_topic, json.dumps(camera_info), qos=1, retain=True)
         self.logger.info(f"Published active camera info to '{self.camera_list_topic}': {camera_info}")
 
+    def publish_source_state(self, source_state):
+        topic = f"vision/{self.pi_id}/{source_state['camera_id']}/source_status"
+        self.publisher.publish(topic, json.dumps(source_state), qos=1, retain=True)
+        with self.source_state_changed:
+            self.source_states[source_state["camera_id"]] = source_state["state"]
+            self.source_state_changed.notify_all()
+
+    def publish_reconfiguration_report(self, report):
+        self.publisher.publish(self.reconfiguration_topic, json.dumps(report), qos=1)
+        self.logger.info(f"Published reconfiguration report: counting gaps {report.get('counting_gap_ms')}")
+
+    def publish_source_status(self):
+        status = {
+            "running": self.pipeline_manager.is_running(),
+            "sources": self.pipeline_manager.get_source_status(),
+            "timestamp": time.time()
+        }
+        self.publisher.publish(self.source_status_topic, json.dumps(status), qos=1)
+        self.logger.info(f"Published source status to '{self.source_status_topic}'")
+
     def stop(self):
         self.logger.info("Command Listener: Stopping..")
         if self.client:
             self.client.on_message = None
+        self.executor.shutdown()
     
 
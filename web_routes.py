@@ -1,10 +1,34 @@
+import datetime
+import time
 from flask import Flask, render_template, jsonify, request, Response
 from video_stream import VideoStreamManager
 from config import TEMPLATE_FILE, load_config, save_active_sources
+from export_stream import stream_export
 
 
 
-def register_routes(app: Flask, user_data, pipeline_manager, video_stream_manager):
+def parse_time_param(value):
+    """Parse an ISO 8601 string or unix seconds into a naive local datetime."""
+    if value is None or value == "":
+        return None
+    try:
+        return datetime.datetime.fromtimestamp(float(value))
+    except ValueError:
+        pass
+    try:
+        parsed = datetime.datetime.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f"Invalid time value: {value}")
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone().replace(tzinfo=None)
+    return parsed
+
+
+def parse_time_range(args):
+    return parse_time_param(args.get("start")), parse_time_param(args.get("end"))
+
+
+def register_routes(app: Flask, user_data, pipeline_manager, video_stream_manager, snapshot_streamer=None):
     """
     Register all Flask routes.
 
@@ -13,6 +37,7 @@ def register_routes(app: Flask, user_data, pipeline_manager, video_stream_manage
         user_data: MultiSourceZoneVisitorCounter instance
         pipeline_manager: PipelineManager instance
         video_stream_manager: VideoStreamManager instance
+        snapshot_streamer: optional SnapshotStreamer; /get_snapshot then reuses its encodes
     """
 
     @app.route("/")
@@ -60,9 +85,54 @@ def register_routes(app: Flask, user_data, pipeline_manager, video_stream_manage
         """Get the current pipeline status."""
         return jsonify({
             "running": pipeline_manager.is_running(),
-            "sources": pipeline_manager.video_sources if pipeline_manager.is_running() else []
+            "sources": pipeline_manager.video_sources if pipeline_manager.is_running() else [],
+            "headless": pipeline_manager.headless,
+            "fps": pipeline_manager.get_fps() if pipeline_manager.is_running() else {},
+            "source_states": pipeline_manager.get_source_status(),
+            "last_reconfiguration": pipeline_manager.last_reconfiguration
         })
 
+    @app.route("/api/pipeline/queues", methods=["GET"])
+    def get_queue_levels():
+        """Return the latest sampled level of every named queue, per camera."""
+        return jsonify(pipeline_manager.queue_monitor.get_snapshot())
+
+    @app.route("/api/pipeline/queues/adaptive", methods=["POST"])
+    def set_queue_adaptive():
+        """Enable or disable adaptive leaky inference queues, optionally with a latency budget."""
+        data = request.json or {}
+        if "enabled" not in data:
+            return jsonify({"error": "Missing required field: enabled"}), 400
+        pipeline_manager.queue_monitor.set_adaptive(
+            bool(data["enabled"]), budget_ms=data.get("budget_ms"), camera_id=data.get("camera_id"))
+        return jsonify({"success": True, "adaptive": pipeline_manager.queue_monitor.adaptive})
+
+    @app.route("/api/sources", methods=["POST"])
+    def add_source():
+        """Attach a single source to the running pipeline."""
+        data = request.json
+        if not data or "camera_id" not in data or "source" not in data:
+            return jsonify({"success": False, "message": "Missing 'camera_id' or 'source'"}), 400
+
+        success = pipeline_manager.add_source(data["camera_id"], data["source"])
+        if success:
+            return jsonify({"success": True, "message": f"Source {data['camera_id']} added"}), 201
+        return jsonify({"success": False, "message": f"Failed to add source {data['camera_id']}"}), 400
+
+    @app.route("/api/sources/<camera_id>", methods=["DELETE"])
+    def remove_source(camera_id):
+        """Detach a single source without stopping the others."""
+        if pipeline_manager.remove_source(camera_id):
+            return jsonify({"success": True, "message": f"Source {camera_id} removed"})
+        return jsonify({"error": f"Source {camera_id} not found"}), 404
+
+    @app.route("/api/sources/<camera_id>/restart", methods=["POST"])
+    def restart_source(camera_id):
+        """Restart a single source without stopping the others."""
+        if pipeline_manager.restart_source(camera_id):
+            return jsonify({"success": True, "message": f"Restart scheduled for {camera_id}"})
+        return jsonify({"error": f"Source {camera_id} not found or already restarting"}), 404
+
     @app.route("/video_feed")
     def video_feed():
         """Stream video feed from specified camera."""
@@ -73,6 +143,11 @@ def register_routes(app: Flask, user_data, pipeline_manager, video_stream_manage
     def get_snapshot():
         """Get a snapshot from the specified camera."""
         camera_id = request.args.get("camera_id", user_data.active_camera)
+        if snapshot_streamer is not None:
+            # Shares the encode with MQTT snapshots of the same frame
+            jpeg = snapshot_streamer.get_jpeg(camera_id)
+            if jpeg is not None:
+                return Response(jpeg, mimetype='image/jpeg')
         success, data = video_stream_manager.get_snapshot(camera_id)
 
         if success:
@@ -258,6 +333,21 @@ def register_routes(app: Flask, user_data, pipeline_manager, video_stream_manage
             return jsonify({"error": "Invalid line coordinates"}), 400
 
     
+    @app.route("/api/camera/<camera_id>/layout", methods=["PUT"])
+    def put_camera_layout(camera_id):
+        """
+        Replace all zones and lines of a camera in one transaction.
+        Body: {"zones": {name: {top_left, bottom_right}}, "lines": {name: {start, end}}, "replace": true}
+        """
+        data = request.json
+        if not data:
+            return jsonify({"error": "No data provided"}), 400
+
+        result = user_data.apply_camera_layout(camera_id, data, replace=data.get("replace", True))
+        if not result["success"]:
+            return jsonify({"error": "Invalid layout", "details": result["errors"]}), 400
+        return jsonify(result)
+
     @app.route("/api/camera/<camera_id>/lines", methods=["GET"])
     def get_camera_lines(camera_id):
         """Get all lines configured for a specific camera."""
@@ -334,31 +424,140 @@ def register_routes(app: Flask, user_data, pipeline_manager, video_stream_manage
             "status": "healthy",
             "pipeline_running": pipeline_manager.is_running(),
             "cameras_count": len(user_data.data),
-            "active_camera": user_data.active_camera
+            "active_camera": user_data.active_camera,
+            "latency_ms": pipeline_manager.latency_tracer.get_summary()
         })
 
+    @app.route("/metrics")
+    def metrics():
+        """Per-camera, per-stage latency histograms and the current frame rates."""
+        return jsonify({
+            "timestamp": time.time(),
+            "fps": pipeline_manager.get_fps() if pipeline_manager.is_running() else {},
+            "latency": pipeline_manager.latency_tracer.get_histograms()
+        })
+
+    @app.route("/metrics/latency/reset", methods=["POST"])
+    def reset_latency_metrics():
+        """Clear the latency histograms, optionally for one camera only."""
+        camera_id = (request.json or {}).get("camera_id") if request.is_json else None
+        pipeline_manager.latency_tracer.reset(camera_id)
+        return jsonify({"success": True})
+
     @app.route("/get_line_history/<camera_id>", methods=["GET"])
     def get_line_history(camera_id):
         """
         Return historical in/out events for each line of a given camera.
+        Optional query params: ?start=...&end=... (ISO 8601 or unix seconds), ?limit=N
         """
-        if camera_id not in user_data.lines:
+        try:
+            start_time, end_time = parse_time_range(request.args)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        if camera_id not in user_data.data:
             return jsonify({
                 "camera_id": camera_id,
                 "line_history": {}
             })
 
-        def extract_line_history(lines):
-            return {
-                line_name: line_data.get("history", [])
-                for line_name, line_data in lines.items()
-            }
-
+        history = user_data.get_history(camera_id, kind="line", start_time=start_time, end_time=end_time,
+                                        limit=request.args.get("limit", type=int))
         return jsonify({
             "camera_id": camera_id,
-            "line_history": extract_line_history(user_data.lines[camera_id])
+            "line_history": history["lines"]
         })
 
+    @app.route("/api/export", methods=["GET"])
+    def export_data():
+        """Export counts and, for a start/end range, the matching history. Optional: ?camera_id=camera1"""
+        try:
+            start_time, end_time = parse_time_range(request.args)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        return jsonify(user_data.export_data(request.args.get("camera_id"), start_time, end_time))
+
+    @app.route("/api/export/stream", methods=["GET"])
+    def export_stream():
+        """
+        Stream zone/line events as CSV or NDJSON without holding the counter lock.
+        Query params: format=csv|ndjson, camera_id, kind=zone|line, start, end
+        """
+        export_format = request.args.get("format", "csv")
+        try:
+            start_time, end_time = parse_time_range(request.args)
+            chunks, mimetype = stream_export(
+                user_data,
+                export_format=export_format,
+                camera_id=request.args.get("camera_id"),
+                kind=request.args.get("kind"),
+                start_ts=start_time.timestamp() if start_time else None,
+                end_ts=end_time.timestamp() if end_time else None)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        filename = f"events_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}.{export_format}"
+        return Response(chunks, mimetype=mimetype,
+                        headers={"Content-Disposition": f"attachment; filename={filename}"})
+
+    @app.route("/api/rollups", methods=["GET"])
+    def get_rollups():
+        """
+        Bucketed in/out counts (and peak occupancy for zones) of a camera.
+        Query params: camera_id (required), granularity=1m|15m|1h|1d, kind, name, start, end
+        """
+        camera_id = request.args.get("camera_id")
+        if not camera_id:
+            return jsonify({"error": "Missing required parameter: camera_id"}), 400
+        try:
+            start_time, end_time = parse_time_range(request.args)
+            result = user_data.query_rollups(
+                camera_id,
+                kind=request.args.get("kind"),
+                name=request.args.get("name"),
+                granularity=request.args.get("granularity", "15m"),
+                start_time=start_time,
+                end_time=end_time)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        return jsonify(result)
+
+    @app.route("/api/archive/summary", methods=["GET"])
+    def get_archive_summary():
+        """
+        Counts per action and dwell percentiles per zone/line from the event archive.
+        Optional query params: camera_id, kind=zone|line, start, end (ISO 8601 or unix seconds)
+        """
+        try:
+            start_time, end_time = parse_time_range(request.args)
+            result = user_data.query_archive(
+                camera_id=request.args.get("camera_id"),
+                kind=request.args.get("kind"),
+                start_time=start_time,
+                end_time=end_time)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        return jsonify(result)
+
+    @app.route("/api/camera/<camera_id>/history", methods=["GET"])
+    def get_camera_history(camera_id):
+        """
+        Zone and line events of a camera from the event log.
+        Optional query params: kind=zone|line, name, start, end (ISO 8601 or unix seconds), limit
+        """
+        if camera_id not in user_data.data:
+            return jsonify({"error": f"Camera {camera_id} not found"}), 404
+        try:
+            start_time, end_time = parse_time_range(request.args)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        history = user_data.get_history(
+            camera_id,
+            kind=request.args.get("kind"),
+            name=request.args.get("name"),
+            start_time=start_time,
+            end_time=end_time,
+            limit=request.args.get("limit", type=int))
+        return jsonify({"camera_id": camera_id, "history": history})
+
 
 
     @app.errorhandler(404)
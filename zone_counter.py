@@ -1,17 +1,22 @@
-import json
+import copy
 import datetime
 import numpy as np
 import time
 import threading
 import logging
-from typing import Dict, Set, List, Tuple, Any, Optional, Union
+from typing import Callable, Dict, Set, List, Tuple, Any, Optional, Union
 from dataclasses import dataclass
 from collections import defaultdict
 from enum import Enum
 from hailo_apps_infra1.hailo_rpi_common import app_callback_class
-from config import save_zone_line_config
+from config import save_zone_line_config, EVENT_LOG_DIR
+from event_log import SegmentedLog, EventWriter
+from rollups import RollupStore
+from event_archive import EventArchive
+from export_stream import iter_events
 from logging_config import get_logger
-from database_writer import get_database_writer
+from local_event_sink import get_event_sink
+from mqtt_serialization import TopicCache, encode_history_event
 
 
 logging.basicConfig(level=logging.INFO)
@@ -43,7 +48,7 @@ class CounterConfig:
     crossing_cooldown_seconds: float = 2.0
     min_movement_threshold: float = 5.0
     state_confirmation_frames: int = 3
-    max_history_entries: int = 1000
+    max_history_entries: int = 100  # recent entries kept in memory; the full history is in the event log
     cleanup_interval_minutes: int = 5
 
 
@@ -54,10 +59,26 @@ class MultiSourceZoneVisitorCounter(app_callback_class):
         self.config = config or CounterConfig()
         self.mqtt_client = mqtt_client
         self.pi_id = pi_id
+        self.topics = TopicCache(pi_id)
 
-        self.db_writer = get_database_writer(batch_size=50, batch_interval=2.0)
+        self.db_writer = get_event_sink(batch_size=50, batch_interval=2.0)
         self.db_enabled = False
 
+        try:
+            self.event_log = SegmentedLog(EVENT_LOG_DIR)
+        except Exception as e:
+            logger.error(f"Event log unavailable, history is kept in memory only: {e}")
+            self.event_log = None
+        self.rollups = RollupStore()
+        try:
+            self.archive = EventArchive()
+        except Exception as e:
+            logger.error(f"Event archive unavailable: {e}")
+            self.archive = None
+        # Event log and archive appends happen on this writer's thread, never under self.lock
+        self.event_writer = EventWriter(self.event_log, self.archive)
+        self.event_writer.start()
+
         self.lock = threading.Lock()
         self.data: Dict[str, Dict[str, Any]] = {}
 
@@ -73,6 +94,25 @@ class MultiSourceZoneVisitorCounter(app_callback_class):
 
         self.last_cleanup = datetime.datetime.now()
 
+        # Set by main once checkpointing runs; resets and edits then checkpoint promptly
+        self.checkpointer = None
+        # Set by main when history events are published in batched envelopes instead of one message each
+        self.event_publisher = None
+        self.started_monotonic = time.monotonic()
+        self.time_to_first_count: Optional[float] = None
+
+        # Per (camera, kind, name) sequence number of the last event; carried by every event
+        self.shape_seq: Dict[Tuple[str, str, str], int] = {}
+
+        # Called with a camera id (under self.lock) whenever its counts or shapes may have changed
+        self.change_listeners: List[Callable[[str], None]] = []
+
+        # People counted inside before a restart, under track ids of the previous tracker
+        # session: camera -> {"zones": {zone: ids}, "until": end of the debounce window}
+        self.stale_occupants: Dict[str, Dict[str, Any]] = {}
+        # Occupant ids of a checkpoint while the event log is replayed: camera -> zone -> ids
+        self.restored_occupants: Dict[str, Dict[str, Set[Any]]] = {}
+
     def _validate_coordinates(self, top_left: List[int], bottom_right: List[int]) -> bool:
         try:
             if len(top_left) != 2 or len(bottom_right) != 2:
@@ -152,14 +192,15 @@ class MultiSourceZoneVisitorCounter(app_callback_class):
                     logger.info(f"Initialized new camera: {camera_id}")
                 else:
                     for zone_name, zone_data in self.data[camera_id].get("zones", {}).items():
-                        zone_data["inside_ids"] = []
                         logger.info(f"Preserved counts for {camera_id}/{zone_name}:")
                     
                     for line_name, line_data in self.data[camera_id].get("lines", {}).items():
                         logger.info(f"Preserved counts for {camera_id}/{line_name}:")
-                self._init_camera(camera_id)
+                # Keep restored dwell, line and cooldown state; only create what is missing
+                if camera_id not in self.inside_zones:
+                    self._init_camera(camera_id)
             
-            logger.info(f"[INFO] Cleared all old data. Initialized fresh state for cameras:{camera_ids}")
+            logger.info(f"[INFO] Initialized tracking state for cameras:{camera_ids}")
 
     def _clear_trackers(self) -> None:
         self.inside_zones.clear()
@@ -341,10 +382,272 @@ class MultiSourceZoneVisitorCounter(app_callback_class):
             return history[-max_entries:]
         return history
 
-    def _publish_mqtt_event(self, topic: str, payload: Dict[str, Any]) -> None:
+    def _record_event(self, camera_id: str, kind: str, name: str,
+                      history_entry: Dict[str, Any], current_time: datetime.datetime,
+                      position: Optional[Tuple[float, float]] = None, dwell: Optional[float] = None) -> None:
+        if self.time_to_first_count is None:
+            self.time_to_first_count = round(time.monotonic() - self.started_monotonic, 3)
+            logger.info(f"First count {self.time_to_first_count}s after startup")
+        key = (camera_id, kind, name)
+        self.shape_seq[key] = self.shape_seq.get(key, 0) + 1
+        history_entry["seq"] = self.shape_seq[key]
+        self.rollups.record_event(camera_id, kind, name, self._direction(history_entry["action"]),
+                                  current_time.timestamp())
+        self._notify_change(camera_id)
+        if self.event_publisher is not None:
+            self.event_publisher.publish(camera_id, kind, name, history_entry, current_time.timestamp())
+        record = {"camera": camera_id, "kind": kind, "name": name, **history_entry}
+        x, y = position if position else (float("nan"), float("nan"))
+        self.event_writer.submit(record, current_time.timestamp(), {"x": x, "y": y, "dwell": dwell})
+
+    def _find_position(self, detected_people: Set[Tuple], person_id: int) -> Optional[Tuple[float, float]]:
+        for person_data in detected_people:
+            if person_data[0] == person_id:
+                return self._get_person_position(person_data, method="center")
+        return None
+
+    def import_legacy_history(self, entries: List[Tuple[str, str, str, Dict[str, Any]]]) -> None:
+        """Move history lists from older config files into the event log (once, into an empty log)."""
+        timed = []
+        for camera_id, kind, name, entry in entries:
+            try:
+                ts = datetime.datetime.strptime(entry["time"], "%Y-%m-%d %H:%M:%S").timestamp()
+            except (ValueError, KeyError, TypeError):
+                continue
+            timed.append((ts, camera_id, kind, name, entry))
+        timed.sort(key=lambda item: item[0])
+
+        with self.lock:
+            for ts, camera_id, kind, name, entry in timed:
+                item = self.data.get(camera_id, {}).get(f"{kind}s", {}).get(name)
+                if item is not None:
+                    item.setdefault("history", []).append(entry)
+                    item["history"] = self._trim_history(item["history"])
+
+        if self.event_log is None or self.event_log.get_stats()["total_bytes"]:
+            return
+        for ts, camera_id, kind, name, entry in timed:
+            self.event_log.append({"camera": camera_id, "kind": kind, "name": name, **entry}, ts=ts)
+        logger.info(f"Imported {len(timed)} legacy history entries into the event log")
+
+    @staticmethod
+    def _direction(action: str) -> str:
+        return "in" if action in (ActionType.ENTRY.value, ActionType.IN.value) else "out"
+
+    def _notify_change(self, camera_id: str) -> None:
+        for listener in self.change_listeners:
+            try:
+                listener(camera_id)
+            except Exception as e:
+                logger.error(f"Change listener failed: {e}")
+
+    def _request_checkpoint(self) -> None:
+        if self.checkpointer is not None:
+            self.checkpointer.request()
+
+    def _counted_occupants(self, camera_id: str) -> Dict[str, Set[Any]]:
+        """Ids counted inside each zone of a camera, including stale occupants not yet dropped."""
+        occupants = {zone: {pid for pid, entry in tracker.items() if entry.get('counted')}
+                     for zone, tracker in self.person_dwell_tracker.get(camera_id, {}).items()}
+        for zone, ids in self.stale_occupants.get(camera_id, {}).get("zones", {}).items():
+            occupants.setdefault(zone, set()).update(ids)
+        return {zone: ids for zone, ids in occupants.items() if ids}
+
+    def snapshot_state(self) -> Dict[str, Any]:
+        """Copy counts and the per-zone occupant ids for a checkpoint."""
+        with self.lock:
+            return {
+                "wall_time": time.time(),
+                "data": copy.deepcopy(self.data),
+                "occupants": {camera_id: self._counted_occupants(camera_id) for camera_id in self.data},
+                "rollups": self.rollups.snapshot(),
+                "shape_seq": dict(self.shape_seq),
+            }
+
+    def restore_state(self, state: Dict[str, Any]) -> None:
+        """
+        Apply a checkpoint on top of the loaded configuration. Geometry comes from the
+        configuration; counts and occupants are restored for zones and lines that still exist.
+        """
+        self.rollups.restore(state.get("rollups", {}))
+        with self.lock:
+            self.shape_seq.update(state.get("shape_seq", {}))
+            for camera_id, camera_data in state.get("data", {}).items():
+                if camera_id not in self.data:
+                    continue
+                for section in ("zones", "lines"):
+                    live_items = self.data[camera_id].setdefault(section, {})
+                    for name, item in camera_data.get(section, {}).items():
+                        if name not in live_items:
+                            continue
+                        for key in ("in_count", "out_count", "inside_ids", "history"):
+                            if key in item:
+                                live_items[name][key] = item[key]
+
+                live_zones = self.data[camera_id].get("zones", {})
+                self.restored_occupants[camera_id] = {
+                    zone: set(ids) for zone, ids in state.get("occupants", {}).get(camera_id, {}).items()
+                    if zone in live_zones
+                }
+
+    def replay_events(self, since: Optional[float]) -> int:
+        """Re-apply events logged after the checkpoint taken at `since` (unix time)."""
+        if self.event_log is None or since is None:
+            return 0
+        replayed = 0
+        with self.lock:
+            for ts, record in self.event_log.read(since):
+                if ts <= since:
+                    continue
+                if self._apply_replayed_event(record):
+                    self.rollups.record_event(record["camera"], record["kind"], record["name"],
+                                              self._direction(record["action"]), ts)
+                    replayed += 1
+        return replayed
+
+    def _apply_replayed_event(self, record: Dict[str, Any]) -> bool:
+        camera_id, kind, name = record.get("camera"), record.get("kind"), record.get("name")
+        item = self.data.get(camera_id, {}).get(f"{kind}s", {}).get(name)
+        if item is None:
+            return False
+        action, pid = record.get("action"), record.get("id")
+        if action in (ActionType.ENTRY.value, ActionType.IN.value):
+            item["in_count"] += 1
+        elif action in (ActionType.EXIT.value, ActionType.OUT.value):
+            item["out_count"] += 1
+        else:
+            return False
+        entry = {"id": pid, "action": action, "time": record.get("time")}
+        if "seq" in record:
+            entry["seq"] = record["seq"]
+            key = (camera_id, kind, name)
+            self.shape_seq[key] = max(self.shape_seq.get(key, 0), record["seq"])
+        item.setdefault("history", []).append(entry)
+        item["history"] = self._trim_history(item["history"])
+
+        if kind == "zone":
+            occupants = self.restored_occupants.setdefault(camera_id, {}).setdefault(name, set())
+            if action == ActionType.ENTRY.value:
+                occupants.add(pid)
+            else:
+                occupants.discard(pid)
+            item["inside_ids"] = list(occupants)
+        return True
+
+    def mark_restored_ids_stale(self) -> int:
+        """
+        Retire the track ids restored from a checkpoint and the replayed log. The tracker
+        restarts its ids with the process, so they will not be reported again (or belong to
+        someone else). People counted inside stay in occupancy as stale occupants for one
+        debounce window after the camera's first frame; a new id qualifying for their zone
+        takes one over instead of counting a second entry. The rest are then dropped without
+        Exit events. Returns the number of stale occupants.
+        """
+        marked = 0
+        with self.lock:
+            for camera_id, zones in self.restored_occupants.items():
+                occupants = {zone: ids for zone, ids in zones.items() if ids}
+                if occupants:
+                    self.stale_occupants[camera_id] = {"zones": occupants, "until": None}
+                    marked += sum(len(ids) for ids in occupants.values())
+            self.restored_occupants.clear()
+        return marked
+
+    def _age_stale_occupants(self, camera_id: str, current_time: datetime.datetime) -> None:
+        stale = self.stale_occupants[camera_id]
+        if stale["until"] is None:
+            stale["until"] = current_time + datetime.timedelta(
+                seconds=self.config.min_dwell_time + self.config.exit_grace_time)
+        elif current_time >= stale["until"]:
+            dropped = sum(len(ids) for ids in stale["zones"].values())
+            del self.stale_occupants[camera_id]
+            if dropped:
+                logger.info(f"Dropped {dropped} restored occupants of {camera_id} not seen since the restart")
+
+    def query_rollups(self, camera_id: str, kind: Optional[str] = None, name: Optional[str] = None,
+                      granularity: str = "15m", start_time: Optional[datetime.datetime] = None,
+                      end_time: Optional[datetime.datetime] = None) -> Dict[str, Any]:
+        return self.rollups.query(camera_id, kind, name, granularity,
+                                  start_time.timestamp() if start_time else None,
+                                  end_time.timestamp() if end_time else None)
+
+    def query_archive(self, camera_id: Optional[str] = None, kind: Optional[str] = None,
+                      start_time: Optional[datetime.datetime] = None,
+                      end_time: Optional[datetime.datetime] = None) -> Dict[str, Any]:
+        if self.archive is None:
+            raise ValueError("Event archive is not available")
+        self.event_writer.flush()
+        return self.archive.aggregate(start_time.timestamp() if start_time else None,
+                                      end_time.timestamp() if end_time else None,
+                                      camera_id=camera_id, kind=kind)
+
+    def get_events_since(self, camera_id: str, kind: str, name: str, from_seq: int,
+                         since_ts: Optional[float] = None, limit: int = 500) -> Tuple[List[Dict[str, Any]], bool]:
+        """
+        Events of one shape with a sequence number above from_seq, oldest first.
+        since_ts (e.g. the time of the consumer's last event) bounds the event log scan.
+        Returns (events, complete); complete is False when limit cut the result short.
+        """
+        events = []
+        if self.event_log is not None:
+            self.event_writer.flush()
+            rows = (record for _, record in self.event_log.read(since_ts))
+        else:
+            with self.lock:
+                item = self.data.get(camera_id, {}).get(f"{kind}s", {}).get(name, {})
+                rows = [{"camera": camera_id, "kind": kind, "name": name, **entry}
+                        for entry in item.get("history", [])]
+        for record in rows:
+            if (record.get("camera") != camera_id or record.get("kind") != kind or record.get("name") != name
+                    or record.get("seq", 0) <= from_seq):
+                continue
+            if len(events) >= limit:
+                return events, False
+            events.append({key: record.get(key) for key in ("seq", "id", "action", "time")})
+        return events, True
+
+    def get_state_digest(self) -> Dict[str, Dict[str, Any]]:
+        """Counts and last event sequence number of every zone and line, per camera."""
+        digest = {}
+        with self.lock:
+            for camera_id, camera_data in self.data.items():
+                digest[camera_id] = {
+                    section: {
+                        name: {"in": item.get("in_count", 0), "out": item.get("out_count", 0),
+                               "seq": self.shape_seq.get((camera_id, section[:-1], name), 0)}
+                        for name, item in camera_data.get(section, {}).items()
+                    }
+                    for section in ("zones", "lines")
+                }
+        return digest
+
+    def get_history(self, camera_id: str, kind: Optional[str] = None, name: Optional[str] = None,
+                    start_time: Optional[datetime.datetime] = None,
+                    end_time: Optional[datetime.datetime] = None,
+                    limit: Optional[int] = None) -> Dict[str, Dict[str, List[Dict[str, Any]]]]:
+        """History entries per zone and line of a camera, answered from the event log by time range."""
+        result = {"zones": {}, "lines": {}}
+        count = 0
+        for row in iter_events(self, camera_id, kind,
+                               start_time.timestamp() if start_time else None,
+                               end_time.timestamp() if end_time else None):
+            if name and row.get("name") != name:
+                continue
+            section = result["zones" if row.get("kind") == "zone" else "lines"]
+            section.setdefault(row.get("name"), []).append(
+                {"id": row.get("id"), "action": row.get("action"), "time": row.get("time")})
+            count += 1
+            if limit and count >= limit:
+                break
+        return result
+
+    def _publish_mqtt_event(self, camera_id: str, kind: str, name: str, event: str,
+                            history_entry: Dict[str, Any]) -> None:
+        """Single-message mode: {kind: name, **history_entry} on .../history/{kind}/{event}."""
         try:
             if self.mqtt_client:
-                self.mqtt_client.publish(topic, json.dumps(payload), qos=1)
+                self.mqtt_client.publish(self.topics.get(camera_id, "history", kind, event),
+                                         encode_history_event(kind, name, history_entry), qos=1)
         except Exception as e:
             logger.error(f"Failed to publish MQTT message: {e}")
 
@@ -369,6 +672,8 @@ class MultiSourceZoneVisitorCounter(app_callback_class):
 
                 active_ids = {p[0] for p in valid_people if len(p) >= 1}
                 current_time = datetime.datetime.now()
+                if camera_id in self.stale_occupants:
+                    self._age_stale_occupants(camera_id, current_time)
 
                 self._process_zones(camera_id, valid_people, active_ids, current_time)
 
@@ -390,6 +695,7 @@ class MultiSourceZoneVisitorCounter(app_callback_class):
                 current_inside = set()
                 entries_to_count = []
                 exits_to_count = []
+                exit_dwell = {}
 
                 for person_data in detected_people:
                     person_id = person_data[0]
@@ -407,24 +713,33 @@ class MultiSourceZoneVisitorCounter(app_callback_class):
                                 entries_to_count.append(person_id)
                             elif dwell_result['action'] == 'confirmed_exit':
                                 exits_to_count.append(person_id)
+                                exit_dwell[person_id] = dwell_result['dwell_time']
 
                 for person_id in list(self.person_dwell_tracker[camera_id].get(zone, {}).keys()):
                     if person_id not in active_ids:
                         dwell_result = self._update_dwell_tracker(camera_id, zone, person_id, False, current_time)
                         if dwell_result['should_count'] and dwell_result['action'] == 'confirmed_exit':
                             exits_to_count.append(person_id)
+                            exit_dwell[person_id] = dwell_result['dwell_time']
 
                 timestamp_str = current_time.strftime("%Y-%m-%d %H:%M:%S")
 
+                stale = self.stale_occupants.get(camera_id, {}).get("zones", {}).get(zone, set())
+                while entries_to_count and stale:
+                    # Someone counted before the restart, back under a new track id
+                    entries_to_count.pop(0)
+                    stale.pop()
+
                 if entries_to_count:
                     zone_data["in_count"] += len(entries_to_count)
                     for pid in entries_to_count:
                         history_entry = {"id": pid, "action": ActionType.ENTRY.value, "time": timestamp_str}
                         zone_data["history"].append(history_entry)
+                        self._record_event(camera_id, "zone", zone, history_entry, current_time,
+                                           position=self._find_position(detected_people, pid))
 
-                        topic = f"vision/{self.pi_id}/{camera_id}/history/zone/entry"
-                        payload = {"zone": zone, **history_entry}
-                        self._publish_mqtt_event(topic, payload)
+                        if self.event_publisher is None:
+                            self._publish_mqtt_event(camera_id, "zone", zone, "entry", history_entry)
 
                         if self.db_enabled and self.db_writer:
                             try:
@@ -459,10 +774,12 @@ class MultiSourceZoneVisitorCounter(app_callback_class):
                     for pid in exits_to_count:
                         history_entry = {"id": pid, "action": ActionType.EXIT.value, "time": timestamp_str}
                         zone_data["history"].append(history_entry)
+                        self._record_event(camera_id, "zone", zone, history_entry, current_time,
+                                           position=self._find_position(detected_people, pid),
+                                           dwell=exit_dwell.get(pid))
 
-                        topic = f"vision/{self.pi_id}/{camera_id}/history/zone/exit"
-                        payload = {"zone": zone, **history_entry}
-                        self._publish_mqtt_event(topic, payload)
+                        if self.event_publisher is None:
+                            self._publish_mqtt_event(camera_id, "zone", zone, "exit", history_entry)
 
                         if self.db_enabled and self.db_writer:
                             try:
@@ -507,8 +824,11 @@ class MultiSourceZoneVisitorCounter(app_callback_class):
                             except Exception as e:
                                 logger.error(f"Failed to write zone exit event to DB: {e}")
 
+                occupancy = len(current_inside) + len(stale)
+                if occupancy != len(zone_data.get("inside_ids", ())):
+                    self.rollups.observe_occupancy(camera_id, zone, occupancy, current_time.timestamp())
                 self.inside_zones[camera_id][zone] = current_inside
-                zone_data["inside_ids"] = list(current_inside)
+                zone_data["inside_ids"] = list(current_inside) + list(stale)
 
                 zone_data["history"] = self._trim_history(zone_data["history"])
 
@@ -584,10 +904,11 @@ class MultiSourceZoneVisitorCounter(app_callback_class):
                             history_entry = {"id": person_id, "action": action, "time": timestamp_str}
                             line_data["history"].append(history_entry)
                             line_data["history"] = self._trim_history(line_data["history"])
+                            self._record_event(camera_id, "line", line_name, history_entry, current_time,
+                                               position=(float(p_current[0]), float(p_current[1])))
 
-                            topic = f"vision/{self.pi_id}/{camera_id}/history/line/cross"
-                            payload = {"line": line_name, **history_entry}
-                            self._publish_mqtt_event(topic, payload)
+                            if self.event_publisher is None:
+                                self._publish_mqtt_event(camera_id, "line", line_name, "cross", history_entry)
 
                             if self.db_enabled and self.db_writer:
                                 try:
@@ -660,8 +981,21 @@ class MultiSourceZoneVisitorCounter(app_callback_class):
         except Exception as e:
             logger.error(f"Error during cleanup: {e}")
 
+    def validate_shape(self, kind: str, geometry: Dict[str, Any]) -> bool:
+        if kind == "zone":
+            return self._validate_coordinates(geometry.get("top_left"), geometry.get("bottom_right"))
+        if kind == "line":
+            return self._validate_line_coordinates(geometry.get("start"), geometry.get("end"))
+        return False
+
+    def save_layout(self) -> None:
+        """Persist zones and lines, e.g. once a series of unsaved edits has ended."""
+        with self.lock:
+            save_zone_line_config(self)
+            self._request_checkpoint()
+
     def create_or_update_zone(self, camera_id: str, zone: str,
-                              top_left: List[int], bottom_right: List[int]) -> bool:
+                              top_left: List[int], bottom_right: List[int], persist: bool = True) -> bool:
         if not self._validate_coordinates(top_left, bottom_right):
             logger.error(f"Invalid coordinates for zone {zone}: {top_left} -> {bottom_right}")
             return False
@@ -691,7 +1025,9 @@ class MultiSourceZoneVisitorCounter(app_callback_class):
                     "history": []
                 }
                 #self._init_camera(camera_id)
-                save_zone_line_config(self)
+                if persist:
+                    save_zone_line_config(self)
+                self._notify_change(camera_id)
                 logger.info(f"Created/updated zone '{zone}' for camera '{camera_id}'")
                 return True
             except Exception as e:
@@ -715,9 +1051,11 @@ class MultiSourceZoneVisitorCounter(app_callback_class):
                     del self.person_dwell_tracker[camera_id][zone]
                 if camera_id in self.person_zone_history and zone in self.person_zone_history[camera_id]:
                     del self.person_zone_history[camera_id][zone]
+                self.stale_occupants.get(camera_id, {}).get("zones", {}).pop(zone, None)
 
                 save_zone_line_config(self)
 
+                self._notify_change(camera_id)
                 logger.info(f"Deleted zone '{zone}' from camera '{camera_id}'")
                 return True
             except Exception as e:
@@ -747,7 +1085,10 @@ class MultiSourceZoneVisitorCounter(app_callback_class):
                     self.person_dwell_tracker[camera_id][zone].clear()
                 if camera_id in self.person_zone_history and zone in self.person_zone_history[camera_id]:
                     self.person_zone_history[camera_id][zone].clear()
+                self.stale_occupants.get(camera_id, {}).get("zones", {}).pop(zone, None)
 
+                self._request_checkpoint()
+                self._notify_change(camera_id)
                 logger.info(f"Reset counts for zone '{zone}' in camera '{camera_id}'")
                 return True
             except Exception as e:
@@ -805,7 +1146,7 @@ class MultiSourceZoneVisitorCounter(app_callback_class):
             return None
 
     def create_or_update_line(self, camera_id: str, line_name: str,
-                              start: List[int], end: List[int]) -> bool:
+                              start: List[int], end: List[int], persist: bool = True) -> bool:
         if not self._validate_line_coordinates(start, end):
             logger.error(f"Invalid coordinates for line {line_name}: {start} -> {end}")
             return False
@@ -825,10 +1166,12 @@ class MultiSourceZoneVisitorCounter(app_callback_class):
                     "out_count": 0,
                     "history": []
                 }
-                self._init_camera(camera_id)
+                self._sync_camera_trackers(camera_id, {"zones": set(), "lines": {line_name}})
 
-                save_zone_line_config(self)
+                if persist:
+                    save_zone_line_config(self)
 
+                self._notify_change(camera_id)
                 logger.info(f"Created/updated line '{line_name}' for camera '{camera_id}'")
                 return True
             except Exception as e:
@@ -854,6 +1197,7 @@ class MultiSourceZoneVisitorCounter(app_callback_class):
 
                 save_zone_line_config(self)
 
+                self._notify_change(camera_id)
                 logger.info(f"Deleted line '{line_name}' from camera '{camera_id}'")
                 return True
             except Exception as e:
@@ -883,12 +1227,104 @@ class MultiSourceZoneVisitorCounter(app_callback_class):
                     self.line_cooldown_tracker[camera_id][line_name].clear()
 
                 
+                self._request_checkpoint()
+                self._notify_change(camera_id)
                 logger.info(f"Reset counts for line '{line_name}' in camera '{camera_id}'")
                 return True
             except Exception as e:
                 logger.error(f"Failed to reset line {line_name}: {e}")
                 return False
 
+    def _validate_layout(self, layout: Dict[str, Any]) -> List[str]:
+        errors = []
+        zones = layout.get("zones", {})
+        lines = layout.get("lines", {})
+        if not isinstance(zones, dict) or not isinstance(lines, dict):
+            return ["'zones' and 'lines' must be objects keyed by name"]
+        for zone, zone_data in zones.items():
+            if not isinstance(zone_data, dict) or not self._validate_coordinates(
+                    zone_data.get("top_left"), zone_data.get("bottom_right")):
+                errors.append(f"Invalid coordinates for zone '{zone}'")
+        for line_name, line_data in lines.items():
+            if not isinstance(line_data, dict) or not self._validate_line_coordinates(
+                    line_data.get("start"), line_data.get("end")):
+                errors.append(f"Invalid coordinates for line '{line_name}'")
+        return errors
+
+    def apply_camera_layout(self, camera_id: str, layout: Dict[str, Any], replace: bool = True) -> Dict[str, Any]:
+        """
+        Apply a whole camera layout ({"zones": {name: {top_left, bottom_right}},
+        "lines": {name: {start, end}}}) as one transaction: everything is validated
+        first, then applied under a single lock acquisition with one tracker rebuild
+        and one save. Shapes whose geometry is unchanged keep their counts and
+        trackers; with replace=True shapes missing from the layout are deleted.
+        """
+        errors = self._validate_layout(layout)
+        if errors:
+            return {"success": False, "errors": errors}
+
+        summary = {"created": [], "updated": [], "unchanged": [], "deleted": []}
+        changed = {"zones": set(), "lines": set()}
+        geometry_keys = {"zones": ("top_left", "bottom_right"), "lines": ("start", "end")}
+
+        with self.lock:
+            try:
+                camera = self.data.setdefault(camera_id, {"zones": {}, "lines": {}})
+                for section, keys in geometry_keys.items():
+                    current = camera.setdefault(section, {})
+                    wanted = layout.get(section, {})
+                    if replace:
+                        for name in [n for n in current if n not in wanted]:
+                            del current[name]
+                            summary["deleted"].append(f"{section[:-1]}:{name}")
+                    for name, shape in wanted.items():
+                        geometry = {key: list(shape[key]) for key in keys}
+                        existing = current.get(name)
+                        if existing is not None and all(existing.get(key) == geometry[key] for key in keys):
+                            summary["unchanged"].append(f"{section[:-1]}:{name}")
+                            continue
+                        summary["updated" if existing is not None else "created"].append(f"{section[:-1]}:{name}")
+                        entry = {**geometry, "in_count": 0, "out_count": 0, "history": []}
+                        if section == "zones":
+                            entry["inside_ids"] = []
+                        current[name] = entry
+                        changed[section].add(name)
+
+                self._sync_camera_trackers(camera_id, changed)
+                save_zone_line_config(self)
+                self._request_checkpoint()
+                self._notify_change(camera_id)
+            except Exception as e:
+                logger.error(f"Failed to apply layout for camera {camera_id}: {e}")
+                return {"success": False, "errors": [str(e)]}
+
+        counts = ", ".join(f"{len(names)} {key}" for key, names in summary.items())
+        logger.info(f"Applied layout for camera '{camera_id}': {counts}")
+        return {"success": True, "errors": [], **summary}
+
+    def _sync_camera_trackers(self, camera_id: str, changed: Dict[str, Set[str]]) -> None:
+        """Make the tracker tables of a camera match its zones and lines; changed shapes start empty."""
+        if camera_id not in self.inside_zones:
+            self._init_camera(camera_id)
+            return
+        zones = self.data[camera_id].get("zones", {})
+        lines = self.data[camera_id].get("lines", {})
+        for table, fresh in ((self.inside_zones, set), (self.person_state_buffer, dict),
+                             (self.person_dwell_tracker, dict), (self.person_zone_history, dict)):
+            tracked = table[camera_id]
+            for zone in [z for z in tracked if z not in zones]:
+                del tracked[zone]
+            for zone in zones:
+                if zone in changed["zones"] or zone not in tracked:
+                    tracked[zone] = fresh()
+        for table in (self.line_cross_tracker, self.line_cooldown_tracker):
+            tracked = table[camera_id]
+            for line_name in [l for l in tracked if l not in lines]:
+                del tracked[line_name]
+            for line_name in lines:
+                if line_name in changed["lines"] or line_name not in tracked:
+                    tracked[line_name] = {}
+
     def get_line_stats(self, camera_id: str, line_name: str) -> Optional[Dict[str, Any]]:
         try:
             if (camera_id not in self.data or
@@ -1028,59 +1464,34 @@ class MultiSourceZoneVisitorCounter(app_callback_class):
                       end_time: Optional[datetime.datetime] = None) -> Dict[str, Any]:
         try:
             with self.lock:
-                export_data = {}
-
                 cameras_to_export = [camera_id] if camera_id else list(self.data.keys())
-
+                export_data = {}
                 for cam_id in cameras_to_export:
                     if cam_id not in self.data:
                         continue
+                    # Copy down to the zone/line dicts so filtering never touches live data
+                    export_data[cam_id] = {
+                        section: {name: dict(item) for name, item in self.data[cam_id].get(section, {}).items()}
+                        for section in ("zones", "lines")
+                    }
 
-                    cam_data = self.data[cam_id].copy()
+            if start_time or end_time:
+                for cam_id, cam_data in export_data.items():
+                    history = self.get_history(cam_id, start_time=start_time, end_time=end_time)
+                    for section in ("zones", "lines"):
+                        for name, item in cam_data[section].items():
+                            item["history"] = history[section].get(name, [])
 
-                    if start_time or end_time:
-                        for zone_data in cam_data.get("zones", {}).values():
-                            filtered_history = []
-                            for entry in zone_data.get("history", []):
-                                try:
-                                    entry_time = datetime.datetime.strptime(
-                                        entry["time"], "%Y-%m-%d %H:%M:%S")
-                                    if start_time and entry_time < start_time:
-                                        continue
-                                    if end_time and entry_time > end_time:
-                                        continue
-                                    filtered_history.append(entry)
-                                except (ValueError, KeyError):
-                                    continue
-                            zone_data["history"] = filtered_history
-
-                        for line_data in cam_data.get("lines", {}).values():
-                            filtered_history = []
-                            for entry in line_data.get("history", []):
-                                try:
-                                    entry_time = datetime.datetime.strptime(
-                                        entry["time"], "%Y-%m-%d %H:%M:%S")
-                                    if start_time and entry_time < start_time:
-                                        continue
-                                    if end_time and entry_time > end_time:
-                                        continue
-                                    filtered_history.append(entry)
-                                except (ValueError, KeyError):
-                                    continue
-                            line_data["history"] = filtered_history
-
-                    export_data[cam_id] = cam_data
-
-                return {
-                    "export_timestamp": datetime.datetime.now().isoformat(),
-                    "cameras": export_data,
-                    "config": {
-                        "frame_height": self.config.frame_height,
-                        "frame_width": self.config.frame_width,
-                        "zone_padding": self.config.zone_padding,
-                        "min_dwell_time": self.config.min_dwell_time
-                    }
+            return {
+                "export_timestamp": datetime.datetime.now().isoformat(),
+                "cameras": export_data,
+                "config": {
+                    "frame_height": self.config.frame_height,
+                    "frame_width": self.config.frame_width,
+                    "zone_padding": self.config.zone_padding,
+                    "min_dwell_time": self.config.min_dwell_time
                 }
+            }
         except Exception as e:
             logger.error(f"Failed to export data: {e}")
             return {}
@@ -1118,7 +1529,10 @@ class MultiSourceZoneVisitorCounter(app_callback_class):
                         "active_tracks": active_line_tracks
                     },
                     "last_cleanup": self.last_cleanup.isoformat(),
-                    "uptime": datetime.datetime.now().isoformat()
+                    "uptime": datetime.datetime.now().isoformat(),
+                    "recovery": self.checkpointer.get_stats() if self.checkpointer else {
+                        "time_to_first_count_seconds": self.time_to_first_count
+                    }
                 }
         except Exception as e:
             logger.error(f"Failed to get system status: {e}")